@@ -3,6 +3,9 @@
 Created on Mon Apr 14 21:51:49 2014
 
 @author: Helene
+
+Unfinished: HNR is now measured by opensauce.hnr (the HNR measurement of
+the command line interface), which ports func_GetHNR.m in full.
 """
 import numpy as np
 
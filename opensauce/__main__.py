@@ -11,6 +11,8 @@ from __future__ import print_function
 
 import argparse
 import csv
+import math
+import multiprocessing
 import os
 import shlex
 import sys
@@ -21,11 +23,23 @@ import numpy as np
 from conf.userconf import user_default_snack_method, user_tcl_shell_cmd, user_praat_path, user_reaper_path
 
 # Import from soundfile.py in opensauce package
-from .soundfile import SoundFile
+from .soundfile import SoundFile, valid_resample_methods
 # Import from helpers.py in opensauce package
-from .helpers import remove_empty_lines_from_file, round_half_away_from_zero
+from .helpers import round_half_away_from_zero
+from .helpers import run_with_dependencies
+from .helpers import scratch_run, set_scratch_dir
+# Import from cache.py in opensauce package
+from .cache import MeasurementCache, file_digest
+# Import from output.py in opensauce package
+from .output import DelimitedWriter, NpzWriter, ArrowWriter
+from .output import valid_output_formats, arrow_output_formats
 # Import from snack.py in opensauce package
 from .snack import valid_snack_methods, sformant_names
+# Import from harmonics.py in opensauce package
+from .harmonics import h1h2h4_names, h1h2h4c_names
+from .harmonics import a1a2a3_names, a1a2a3c_names
+# Import from hnr.py in opensauce package
+from .hnr import hnr_names
 # Import from praat.py in opensauce package
 from .praat import valid_praat_f0_methods
 
@@ -66,6 +80,23 @@ class MyArgumentParser(argparse.ArgumentParser):
             return int(value)
 
 
+# State of each --jobs worker process, set up by _init_worker.
+_worker_cli = None
+_worker_data_fields = None
+
+
+def _init_worker(cli, data_fields, scratch_dir):
+    global _worker_cli, _worker_data_fields
+    _worker_cli = cli
+    _worker_data_fields = data_fields
+    # Share the run's scratch directory, which the parent removes.
+    set_scratch_dir(scratch_dir)
+
+
+def _process_files_in_worker(wavfiles):
+    return _worker_cli._process_files(wavfiles, _worker_data_fields)
+
+
 class CLI(object):
 
     # Default settings file locations
@@ -82,8 +113,8 @@ class CLI(object):
                            'use_textgrid', 'include_labels',
                            'include_empty_labels', 'ignore_label',
                            'time_starts_at_zero', 'include_interval_endpoint',
-                           'NaN', 'output_delimiter', 'resample_freq', 'f0',
-                           'formants', 'frame_shift', 'window_size',
+                           'NaN', 'output_delimiter', 'resample_freq',
+                           'resample_method', 'f0', 'formants', 'frame_shift', 'window_size',
                            'frame_precision', 'snack_method', 'tcl_cmd',
                            'snack_min_f0', 'snack_max_f0', 'pre_emphasis',
                            'lpc_order', 'shr_min_f0', 'shr_max_f0',
@@ -97,7 +128,37 @@ class CLI(object):
                            'no_high_pass', 'use_hilbert_transform',
                            'inter_mark']
     excluded_args = ['wavfiles', 'settings', 'output_filepath',
-                     'output_settings', 'output_settings_path']
+                     'output_format', 'output_settings',
+                     'output_settings_path', 'jobs',
+                     'threads', 'cache_dir', 'cache_size', 'mmap',
+                     'scratch_dir']
+    # Settings (besides resample_freq) that the results of each algorithm
+    # depend on, used to key the measurement cache
+    _algorithm_settings = {
+        'snackF0': ('snack_method', 'frame_shift', 'window_size',
+                    'snack_min_f0', 'snack_max_f0'),
+        'praatF0': ('frame_shift', 'praat_f0_method', 'frame_precision',
+                    'praat_min_f0', 'praat_max_f0', 'silence_threshold',
+                    'voice_threshold', 'octave_cost', 'octave_jumpcost',
+                    'voiced_unvoiced_cost', 'kill_octave_jumps',
+                    'interpolate', 'smooth', 'smooth_bandwidth'),
+        'shrF0': ('window_size', 'frame_shift', 'shr_min_f0', 'shr_max_f0',
+                  'frame_precision'),
+        'reaperF0': ('use_pyreaper', 'frame_shift', 'reaper_max_f0',
+                     'reaper_min_f0', 'no_high_pass', 'use_hilbert_transform',
+                     'inter_mark'),
+        'snackFormants': ('snack_method', 'frame_shift', 'window_size',
+                          'pre_emphasis', 'lpc_order'),
+        'praatFormants': ('frame_shift', 'window_size', 'frame_precision',
+                          'num_formants', 'max_formant_freq'),
+        'CPP': ('frame_shift', 'window_size'),
+        }
+    # Maximum number of files for which Praat is run at once
+    prefetch_block_size = 32
+    # Measurements that are computed as a side result of another algorithm
+    _cache_sources = {'SHR': 'shrF0'}
+    # Results stored in _cached_results by an algorithm besides its own
+    _side_results = {'shrF0': ('SHR',)}
 
     #
     # Command Line Parsing and Execution.
@@ -123,6 +184,18 @@ class CLI(object):
             self.args.measurements.append(self.args.formants)
         if not self.args.measurements:
             self.parser.error("No measurements requested")
+        if self.args.output_format != 'text':
+            if self.args.output_filepath in (None, '-'):
+                self.parser.error("--output-format {} needs an output file"
+                                  " (-o)".format(self.args.output_format))
+            if self.args.output_format in arrow_output_formats:
+                try:
+                    import pyarrow
+                except ImportError:
+                    self.parser.error("--output-format {} needs the Python"
+                                      " library pyarrow.  Is it"
+                                      " installed?".format(
+                                          self.args.output_format))
         # Cache for measurement results
         self._cached_results = {}
         # Cache for keys of measurements with multiple measurement vectors
@@ -130,6 +203,20 @@ class CLI(object):
         # Initialize length of measurement vectors
         # There is a distinct data_len for each sound file
         self.data_len = 0
+        # Persistent cache of measurement results across files and runs
+        if self.args.cache_dir:
+            self._cache = MeasurementCache(self.args.cache_dir,
+                                           self.args.cache_size * 1024 * 1024)
+        else:
+            self._cache = None
+        # Digest of the contents of the current sound file
+        self._wav_digest = None
+        # Digests of the files in the current block, computed by _prefetch
+        self._wav_digests = {}
+        # Whether _prefetch left Praat or Snack results to be picked up
+        self._prefetched = False
+        # Directory for intermediate files during process
+        self._scratch_dir = None
 
     def _settings_from_file(self, filepath):
         with open(filepath) as fp:
@@ -187,18 +274,12 @@ class CLI(object):
     def _assemble_fields(self, filename, textgrid_data, offset, data):
         return ([filename] + (textgrid_data if self.args.use_textgrid and self.args.include_labels else []) + [offset] + data)
 
-    def _get_value(self, vector, index):
-        try:
-            res = vector[index]
-        except IndexError:
-            res = self.args.NaN
-        else:
-            if isinstance(res, float) and np.isnan(res):
-                res = self.args.NaN
-            else:
-                res = format(res, '.3f')
-
-        return res
+    def _get_values(self, vector, frames):
+        """Return the values of vector at frames, NaN where there are none."""
+        values = np.full(len(frames), np.nan)
+        present = frames < len(vector)
+        values[present] = np.asarray(vector)[frames[present]]
+        return values
 
     def _write_settings(self, args_dict, path):
         with open(path, 'w') as oset:
@@ -210,6 +291,10 @@ class CLI(object):
                 if isinstance(val, list) and (not val):
                     # Case of empty list
                     continue
+                if (a == 'resample_method') and (args_dict['resample_freq'] is None):
+                    # Don't put --resample-method in settings output
+                    # unless --resample-freq is set
+                    continue
                 if (a == 'smooth_bandwidth') and (not args_dict['smooth']):
                     # Don't put --smooth-bandwidth in settings output
                     # unless --smooth is set to True
@@ -285,15 +370,24 @@ class CLI(object):
 
     def process(self):
         use_stdout = self.args.output_filepath in (None, '-')
-        if use_stdout:
+        if self.args.output_format != 'text':
+            # The columnar writers open the output file themselves.
+            of = None
+        elif use_stdout:
             of = sys.stdout
         else:
             of = open(self.args.output_filepath, 'w')
         try:
-            self._process(of)
+            # Intermediate files of the external programs go to a directory
+            # of this run's own, which is removed at the end.
+            with scratch_run(self.args.scratch_dir) as scratch_dir:
+                self._scratch_dir = scratch_dir
+                self._process(of)
         except:
             raise
         else:
+            if self._cache is not None:
+                self._cache.evict()
             # Write settings file
             if self.args.output_settings:
                 args_dict = vars(self.args)
@@ -312,12 +406,11 @@ class CLI(object):
                 # Write settings to file
                 self._write_settings(args_dict, output_settings_path)
         finally:
-            if not use_stdout:
+            if of is not None and not use_stdout:
                 of.close()
-                remove_empty_lines_from_file(self.args.output_filepath)
 
-    def _process(self, of):
-        # Data fields to be printed to output
+    def _data_fields(self):
+        """Return the names of the data columns written to the output."""
         data_fields = []
         for m in self.args.measurements:
             if m == 'snackFormants':
@@ -327,113 +420,400 @@ class CLI(object):
                     data_fields.append('pF' + str(i))
                 for i in range(1, round_half_away_from_zero(self.args.num_formants) + 1):
                     data_fields.append('pB' + str(i))
+            elif m == 'H1H2H4':
+                data_fields.extend(h1h2h4_names)
+            elif m == 'H1H2H4c':
+                data_fields.extend(h1h2h4c_names)
+            elif m == 'A1A2A3':
+                data_fields.extend(a1a2a3_names)
+            elif m == 'A1A2A3c':
+                data_fields.extend(a1a2a3c_names)
+            elif m == 'HNR':
+                data_fields.extend(hnr_names)
             else:
                 data_fields.append(m)
+        return data_fields
 
-        if self.args.output_delimiter == 'comma':
-            output = csv.writer(of, dialect=csv.excel)
+    def _process(self, of):
+        # Data fields to be printed to output
+        data_fields = self._data_fields()
+        fields = self._assemble_fields(
+                    filename='Filename',
+                    textgrid_data=['Label', 'seg_Start', 'seg_End'],
+                    offset='t_ms',
+                    data=data_fields
+                    )
+
+        text = self.args.output_format == 'text'
+        if not text:
+            if self.args.output_format == 'npz':
+                output = NpzWriter(self.args.output_filepath, fields)
+            else:
+                output = ArrowWriter(self.args.output_filepath, fields,
+                                     self.args.output_format)
+        elif self.args.output_delimiter == 'comma':
+            output = DelimitedWriter(of, dialect=csv.excel,
+                                     nan=self.args.NaN)
         elif self.args.output_delimiter == 'tab':
-            output = csv.writer(of, dialect=csv.excel_tab)
+            output = DelimitedWriter(of, dialect=csv.excel_tab,
+                                     nan=self.args.NaN)
         else: # pragma: no cover
             raise ValueError('Unknown output delimiter {}'.format(self.args.output_delimiter))
 
-        output.writerow(
-            self._assemble_fields(
-                filename='Filename',
-                textgrid_data=['Label', 'seg_Start', 'seg_End'],
-                offset='t_ms',
-                data=data_fields
-            ))
-
-        for wavfile in self.args.wavfiles:
-            self._cached_results.clear()
-            self._cached_measurement_keys.clear()
-
-            if self.args.resample_freq is None:
-                soundfile = SoundFile(wavfile)
-                # Length of all measurement vectors written to output
-                self.data_len = np.int_(np.floor(soundfile.ns / soundfile.fs / self.args.frame_shift * 1000))
+        if text:
+            output.writerow(fields)
+
+        try:
+            for messages, columns in self._map_files(data_fields):
+                if messages and text:
+                    # Keep the messages in place when writing to stdout.
+                    output.flush()
+                for message in messages:
+                    # XXX covert this to use logging.
+                    print(message)
+                output.write_columns(columns)
+        finally:
+            output.close()
+
+    def _map_files(self, data_fields):
+        """Yield the _process_file result for each wav file, in input order.
+
+        With --jobs greater than one the files are handed out to a pool of
+        worker processes, each of which computes all of the measurements for
+        the files it is given.  The results are still yielded in the order
+        of self.args.wavfiles, so the output is the same as for a serial run.
+
+        """
+        wavfiles = self.args.wavfiles
+        jobs = min(self.args.jobs, len(wavfiles))
+        # Files are handled in blocks, so that the external programs can be
+        # run once per block rather than once per file (see _prefetch).
+        block_size = min(self.prefetch_block_size,
+                         int(math.ceil(len(wavfiles) / max(jobs, 1))))
+        blocks = [wavfiles[i:i+block_size]
+                  for i in range(0, len(wavfiles), block_size)]
+        if jobs <= 1:
+            for block in blocks:
+                for result in self._process_files(block, data_fields):
+                    yield result
+            return
+        pool = multiprocessing.Pool(jobs, _init_worker, (self, data_fields,
+                                                     self._scratch_dir))
+        try:
+            for results in pool.imap(_process_files_in_worker, blocks):
+                for result in results:
+                    yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def _process_files(self, wavfiles, data_fields):
+        """Return the _process_file results for a block of wav files."""
+        self._prefetch(wavfiles)
+        try:
+            return [self._process_file(wavfile, data_fields)
+                    for wavfile in wavfiles]
+        finally:
+            self._wav_digests.clear()
+            if self._prefetched:
+                from .praat import clear_praat_prefetch
+                from .snack import clear_snack_prefetch
+                clear_praat_prefetch()
+                clear_snack_prefetch()
+                self._prefetched = False
+
+    def _prefetch(self, wavfiles):
+        """Compute the Praat and Snack measurements for wavfiles in one go.
+
+        Praat is run once for each Praat measurement, and with the 'tcl'
+        Snack method one Tcl shell computes both Snack measurements.
+        praat_pitch, praat_formants, snack_pitch and snack_formants pick up
+        the prefetched results when the measurements are computed for each
+        file.
+        """
+        names = set([self.args.f0, self.args.formants] + self.args.measurements)
+        if self.args.resample_freq is not None or len(wavfiles) < 2:
+            # The resampled wav files don't exist until the files are
+            # processed, and a single file gains nothing.
+            return
+        for name in ('praatF0', 'praatFormants'):
+            if name not in names:
+                continue
+            todo = self._uncached([name], wavfiles)
+            if len(todo) < 2:
+                continue
+            self._prefetched = True
+            if name == 'praatF0':
+                from .praat import prefetch_praat_pitch
+                prefetch_praat_pitch(
+                    todo, self.args.praat_path,
+                    frame_shift=self.args.frame_shift,
+                    method=self.args.praat_f0_method,
+                    min_pitch=self.args.praat_min_f0,
+                    max_pitch=self.args.praat_max_f0,
+                    silence_threshold=self.args.silence_threshold,
+                    voice_threshold=self.args.voice_threshold,
+                    octave_cost=self.args.octave_cost,
+                    octave_jumpcost=self.args.octave_jumpcost,
+                    voiced_unvoiced_cost=self.args.voiced_unvoiced_cost,
+                    kill_octave_jumps=self.args.kill_octave_jumps,
+                    interpolate=self.args.interpolate,
+                    smooth=self.args.smooth,
+                    smooth_bandwidth=self.args.smooth_bandwidth)
             else:
-                soundfile = SoundFile(wavfile, resample_freq=self.args.resample_freq)
-                # Length of all measurement vectors written to output
-                self.data_len = np.int_(np.floor(soundfile.ns_rs / soundfile.fs_rs / self.args.frame_shift * 1000))
-
-            results = {}
-            # Compute default F0 for parameters dependent on F0
-            results[self.args.f0] = self._algorithm(self.args.f0)(soundfile)
-            # Compute default formants for parameters dependent on formants
-            formant_results = self._algorithm(self.args.formants)(soundfile)
-            for k in formant_results:
-                results[k] = formant_results[k]
-            # Compute other measurements
-            for measurement in self.args.measurements:
-                # Check if result previously cached
-                if measurement in self._cached_results:
-                    results[measurement] = self._cached_results[measurement]
-                elif measurement in self._cached_measurement_keys:
-                    for k in self._cached_measurement_keys[measurement]:
-                        results[k] = self._cached_results[k]
-                # Otherwise, compute measurement
-                else:
-                    compute_measurement = self._algorithm(measurement)
-                    computed_result = compute_measurement(soundfile)
-                    if isinstance(computed_result, dict):
-                        # Case of multiple measurements in dictionary
-                        for k in computed_result:
-                            results[k] = computed_result[k]
-                    else:
-                        # Case of single measurement vector
-                        results[measurement] = computed_result
-
-            # end_time is time for last sample in seconds
-            # Time starts at zero
-            beg_time = 0
-            if self.args.resample_freq is None:
-                end_time = soundfile.ns / soundfile.fs
+                from .praat import prefetch_praat_formants
+                prefetch_praat_formants(
+                    todo, self.args.praat_path,
+                    frame_shift=self.args.frame_shift,
+                    window_size=self.args.window_size,
+                    num_formants=self.args.num_formants,
+                    max_formant_freq=self.args.max_formant_freq)
+        snack_names = [name for name in ('snackF0', 'snackFormants')
+                       if name in names]
+        if snack_names and self.args.snack_method == 'tcl':
+            todo = self._uncached(snack_names, wavfiles)
+            if len(todo) >= 2:
+                self._prefetched = True
+                from .snack import prefetch_snack_tcl
+                prefetch_snack_tcl(
+                    todo, self.args.tcl_cmd,
+                    pitch='snackF0' in snack_names,
+                    formants='snackFormants' in snack_names,
+                    frame_shift=self.args.frame_shift,
+                    window_size=self.args.window_size,
+                    max_pitch=self.args.snack_max_f0,
+                    min_pitch=self.args.snack_min_f0,
+                    pre_emphasis=self.args.pre_emphasis,
+                    lpc_order=self.args.lpc_order)
+
+    def _uncached(self, names, wavfiles):
+        """Return the files in wavfiles lacking a cached result for any of names."""
+        if self._cache is None:
+            return wavfiles
+        todo = []
+        for wavfile in wavfiles:
+            digest = self._wav_digests.get(wavfile)
+            if digest is None:
+                digest = file_digest(wavfile)
+                self._wav_digests[wavfile] = digest
+            if any(self._cache_key(name, digest) not in self._cache
+                   for name in names):
+                todo.append(wavfile)
+        return todo
+
+    def _process_file(self, wavfile, data_fields):
+        """Compute the measurements for wavfile and return the output columns.
+
+        Return a list of messages to report to the user and a list of the
+        columns of the output rows for this file, as NumPy vectors ordered
+        as the output fields.  Measurement values that don't exist are NaN.
+
+        """
+        self._cached_results.clear()
+        self._cached_measurement_keys.clear()
+        if self._cache is not None:
+            self._wav_digest = self._wav_digests.get(wavfile)
+            if self._wav_digest is None:
+                self._wav_digest = file_digest(wavfile)
+
+        soundfile = SoundFile(wavfile, resample_freq=self.args.resample_freq,
+                              resample_method=self.args.resample_method,
+                              mmap=self.args.mmap)
+        try:
+            return self._process_soundfile(soundfile, data_fields)
+        finally:
+            # Cleanup: remove wav file corresponding to resample,
+            #          if one was written
+            soundfile.close()
+
+    def _process_soundfile(self, soundfile, data_fields):
+        """Return the _process_file result for a SoundFile."""
+        messages = []
+        if self.args.resample_freq is None:
+            # Length of all measurement vectors written to output
+            self.data_len = np.int_(np.floor(soundfile.ns / soundfile.fs / self.args.frame_shift * 1000))
+        else:
+            # Length of all measurement vectors written to output
+            self.data_len = np.int_(np.floor(soundfile.ns_rs / soundfile.fs_rs / self.args.frame_shift * 1000))
+
+        # Compute default F0 and formants for parameters dependent on them,
+        # then the other measurements.  Measurements that others reuse are
+        # scheduled too, even if they aren't output, so that each is only
+        # computed once.
+        names = self._with_dependencies(
+            [self.args.f0, self.args.formants] + self.args.measurements)
+        computed = run_with_dependencies(
+            names,
+            lambda name: self._measure(name, soundfile),
+            dict((name, self._dependencies(name)) for name in names),
+            self.args.threads)
+        results = {}
+        for name in names:
+            if isinstance(computed[name], dict):
+                # Case of multiple measurements in dictionary
+                for k in computed[name]:
+                    results[k] = computed[name][k]
             else:
-                end_time = soundfile.ns_rs / soundfile.fs_rs
-            # Determine intervals
-            # Intervals are expressed in seconds
-            if self.args.use_textgrid and soundfile.textgrid:
-                intervals = soundfile.textgrid_intervals
+                # Case of single measurement vector
+                results[name] = computed[name]
+
+        # end_time is time for last sample in seconds
+        # Time starts at zero
+        beg_time = 0
+        if self.args.resample_freq is None:
+            end_time = soundfile.ns / soundfile.fs
+        else:
+            end_time = soundfile.ns_rs / soundfile.fs_rs
+        # Determine intervals
+        # Intervals are expressed in seconds
+        if self.args.use_textgrid and soundfile.textgrid:
+            intervals = soundfile.textgrid_intervals
+        else:
+            if self.args.use_textgrid:
+                messages.append("Found no TextGrid for {}, reporting all"
+                                " data".format(soundfile.wavfn))
+            intervals = (('no textgrid', beg_time, end_time),)
+
+        frame_shift = self.args.frame_shift
+        # Label, start and end (in seconds) and frame numbers of each
+        # interval that is reported
+        labels = []
+        starts = []
+        stops = []
+        frames = []
+        for (label, start, stop) in intervals:
+            if label in self.args.ignore_label:
+                continue
+            if not label.strip() and not self.args.include_empty_labels:
+                continue
+            # Convert intervals from seconds to frame number
+            fstart = np.int_(round_half_away_from_zero(start * 1000 / frame_shift))
+            fstop = min(np.int_(round_half_away_from_zero(stop * 1000 / frame_shift)),
+                        np.int_(np.floor(end_time * 1000 / frame_shift)))
+            if not self.args.time_starts_at_zero:
+                fstart = fstart + 1
+                fstop = fstop + 1
+            if self.args.include_interval_endpoint:
+                fstop = fstop + 1
+            labels.append(label)
+            starts.append(start)
+            stops.append(stop)
+            frames.append(np.arange(fstart, max(fstart, fstop)))
+        lengths = [len(f) for f in frames]
+        frames = np.concatenate(frames) if frames else np.array([], dtype=int)
+        columns = self._assemble_fields(
+            filename=np.repeat(np.array([soundfile.wavfn], dtype='U'),
+                               len(frames)),
+            # Intervals are reported in milliseconds
+            textgrid_data=[np.repeat(np.array(labels, dtype='U'), lengths),
+                           np.repeat(np.array(starts, dtype=float) * 1000,
+                                     lengths),
+                           np.repeat(np.array(stops, dtype=float) * 1000,
+                                     lengths)],
+            offset=frames * frame_shift,
+            data=[self._get_values(results[x], frames) for x in data_fields]
+            )
+
+        return messages, columns
+
+    def _dependencies(self, measurement):
+        """Return the measurements whose results measurement reuses.
+
+        A measurement is only started once the measurements it depends on
+        have finished, so that it can take their results from the cache.
+        """
+        if measurement == 'SHR':
+            return ('shrF0',)
+        if measurement == 'H1H2H4':
+            return (self.args.f0,)
+        if measurement == 'H1H2H4c':
+            return ('H1H2H4', self.args.f0, self.args.formants)
+        if measurement == 'A1A2A3':
+            return (self.args.f0, self.args.formants)
+        if measurement == 'A1A2A3c':
+            return ('H1H2H4', 'A1A2A3', self.args.f0, self.args.formants)
+        if measurement == 'HNR':
+            return (self.args.f0,)
+        return ()
+
+    def _with_dependencies(self, measurements):
+        """Return measurements and all of the measurements they depend on.
+
+        Each measurement is listed once, after the ones it depends on.
+        """
+        names = []
+        pending = [(m, False) for m in reversed(measurements)]
+        while pending:
+            name, expanded = pending.pop()
+            if name in names:
+                continue
+            if expanded:
+                names.append(name)
             else:
-                if self.args.use_textgrid:
-                    # XXX covert this to use logging.
-                    print("Found no TextGrid for {}, reporting all"
-                          " data".format(soundfile.wavfn))
-                intervals = (('no textgrid', beg_time, end_time),)
+                pending.append((name, True))
+                pending.extend((d, False)
+                               for d in reversed(self._dependencies(name)))
+        return names
 
-            frame_shift = self.args.frame_shift
-            for (label, start, stop) in intervals:
-                if label in self.args.ignore_label:
-                    continue
-                if not label.strip() and not self.args.include_empty_labels:
-                    continue
-                # Convert intervals from seconds to frame number
-                fstart = np.int_(round_half_away_from_zero(start * 1000 / frame_shift))
-                fstop = min(np.int_(round_half_away_from_zero(stop * 1000 / frame_shift)),
-                            np.int_(np.floor(end_time * 1000 / frame_shift)))
-                if not self.args.time_starts_at_zero:
-                    fstart = fstart + 1
-                    fstop = fstop + 1
-                # Print intervals in milliseconds
-                start_str = format(start * 1000, '.3f')
-                stop_str = format(stop * 1000, '.3f')
-                if self.args.include_interval_endpoint:
-                    fstop = fstop + 1
-                for s in range(fstart, fstop):
-                    output.writerow(
-                        self._assemble_fields(
-                            filename=soundfile.wavfn,
-                            textgrid_data=[label, start_str, stop_str],
-                            offset=format(s * frame_shift, 'd'),
-                            data=[self._get_value(results[x], s)
-                                  for x in data_fields]
-                        ))
-            # Cleanup: remove wav file corresponding to resample,
-            #          if necessary
-            if self.args.resample_freq is not None:
-                os.remove(soundfile.wavpath_rs)
+    def _measure(self, measurement, soundfile):
+        # Check if result previously cached
+        if measurement in self._cached_results:
+            return self._cached_results[measurement]
+        elif measurement in self._cached_measurement_keys:
+            return dict((k, self._cached_results[k])
+                        for k in self._cached_measurement_keys[measurement])
+        # Otherwise, compute measurement
+        source = self._cache_sources.get(measurement, measurement)
+        if self._cache is None or source not in self._algorithm_settings:
+            return self._algorithm(measurement)(soundfile)
+        self._cached_algorithm(source, soundfile)
+        return self._measure(measurement, soundfile)
+
+    def _cache_key(self, name, digest):
+        settings = [(a, getattr(self.args, a))
+                    for a in ('resample_freq', 'resample_method') +
+                             self._algorithm_settings[name]]
+        return self._cache.key(digest, name, settings)
+
+    def _cached_algorithm(self, name, soundfile):
+        """Run DO_<name> unless its results are in the measurement cache.
+
+        Either way the results end up in _cached_results, as if DO_<name>
+        had been called.
+        """
+        key = self._cache_key(name, self._wav_digest)
+        stored = self._cache.get(key)
+        if stored is not None:
+            self._cached_results.update(stored)
+            if name not in stored:
+                # Case of multiple measurements in dictionary
+                self._cached_measurement_keys[name] = list(stored)
+            return
+        result = self._algorithm(name)(soundfile)
+        if isinstance(result, dict):
+            stored = dict(result)
+        else:
+            stored = {name: result}
+        for k in self._side_results.get(name, ()):
+            stored[k] = self._cached_results[k]
+        self._cache.put(key, stored)
+
+    def _formant_tracks(self, soundfile, num_formants, length):
+        """Return the first num_formants formant frequencies of --formants.
+
+        Each track has length values, so that it lines up with the F0 track
+        used with it.  Values that the formant tracker didn't estimate are
+        NaN.
+        """
+        estimates = self._measure(self.args.formants, soundfile)
+        prefix = 's' if self.args.formants == 'snackFormants' else 'p'
+        frames = np.arange(length)
+        return [self._get_values(estimates.get(prefix + 'F' + str(i), []),
+                                 frames)
+                for i in range(1, num_formants + 1)]
 
     #
     # Algorithm wrappers.
@@ -566,6 +946,113 @@ class CLI(object):
         self.DO_shrF0(soundfile)
         return self._cached_results['SHR']
 
+    def DO_H1H2H4(self, soundfile):
+        from .harmonics import h1h2h4
+        F0 = self._measure(self.args.f0, soundfile)
+        if soundfile.fs_rs is None:
+             wavdata = soundfile.wavdata
+             fs = soundfile.fs
+        else:
+             wavdata = soundfile.wavdata_rs
+             fs = soundfile.fs_rs
+        estimates = h1h2h4(wavdata, fs, F0, frame_shift=self.args.frame_shift)
+
+        self._cached_measurement_keys['H1H2H4'] = estimates.keys()
+        for k in estimates:
+            self._cached_results[k] = estimates[k]
+
+        return estimates
+
+    def DO_H1H2H4c(self, soundfile):
+        from .harmonics import corrected_harmonics
+        H = self._measure('H1H2H4', soundfile)
+        F0 = self._measure(self.args.f0, soundfile)
+        if soundfile.fs_rs is None:
+             fs = soundfile.fs
+        else:
+             fs = soundfile.fs_rs
+        F = self._formant_tracks(soundfile, 2, len(F0))
+        estimates = corrected_harmonics(fs, F0, F,
+                                        [H[k] for k in h1h2h4_names])
+
+        self._cached_measurement_keys['H1H2H4c'] = estimates.keys()
+        for k in estimates:
+            self._cached_results[k] = estimates[k]
+
+        return estimates
+
+    def DO_A1A2A3(self, soundfile):
+        from .harmonics import a1a2a3
+        F0 = self._measure(self.args.f0, soundfile)
+        if soundfile.fs_rs is None:
+             wavdata = soundfile.wavdata
+             fs = soundfile.fs
+        else:
+             wavdata = soundfile.wavdata_rs
+             fs = soundfile.fs_rs
+        F = self._formant_tracks(soundfile, 3, len(F0))
+        estimates = a1a2a3(wavdata, fs, F0, F,
+                           frame_shift=self.args.frame_shift)
+
+        self._cached_measurement_keys['A1A2A3'] = estimates.keys()
+        for k in estimates:
+            self._cached_results[k] = estimates[k]
+
+        return estimates
+
+    def DO_A1A2A3c(self, soundfile):
+        from .harmonics import corrected_harmonics
+        H = self._measure('H1H2H4', soundfile)
+        A = self._measure('A1A2A3', soundfile)
+        F0 = self._measure(self.args.f0, soundfile)
+        if soundfile.fs_rs is None:
+             fs = soundfile.fs
+        else:
+             fs = soundfile.fs_rs
+        F = self._formant_tracks(soundfile, 3, len(F0))
+        corrected = corrected_harmonics(fs, F0, F,
+                                        [H[k] for k in h1h2h4_names],
+                                        [A[k] for k in a1a2a3_names])
+        estimates = dict((k, corrected[k]) for k in a1a2a3c_names)
+
+        self._cached_measurement_keys['A1A2A3c'] = estimates.keys()
+        for k in estimates:
+            self._cached_results[k] = estimates[k]
+
+        return estimates
+
+    def DO_HNR(self, soundfile):
+        from .hnr import hnr
+        F0 = self._measure(self.args.f0, soundfile)
+        if soundfile.fs_rs is None:
+             wavdata = soundfile.wavdata
+             fs = soundfile.fs
+        else:
+             wavdata = soundfile.wavdata_rs
+             fs = soundfile.fs_rs
+        estimates = hnr(wavdata, fs, F0, frame_shift=self.args.frame_shift)
+
+        self._cached_measurement_keys['HNR'] = estimates.keys()
+        for k in estimates:
+            self._cached_results[k] = estimates[k]
+
+        return estimates
+
+    def DO_CPP(self, soundfile):
+        from .cpp import cpp
+        if soundfile.fs_rs is None:
+             wavdata = soundfile.wavdata
+             fs = soundfile.fs
+        else:
+             wavdata = soundfile.wavdata_rs
+             fs = soundfile.fs_rs
+        CPP = cpp(wavdata, fs, self.data_len,
+                  frame_shift=self.args.frame_shift,
+                  window_size=self.args.window_size)
+
+        self._cached_results['CPP'] = CPP
+        return CPP
+
     _valid_measurements = [x[3:] for x in list(locals()) if x.startswith('DO_')]
     _valid_f0 = [x for x in _valid_measurements if x.endswith('F0')]
     _valid_formants = [x for x in _valid_measurements if x.endswith('Formants')]
@@ -743,6 +1230,18 @@ class CLI(object):
                         choices=_valid_delimiters,
                         help="Delimiter to use for output file.  It defaults "
                              "to %(default)s.")
+    parser.add_argument('--output-format', default='text',
+                        choices=valid_output_formats,
+                        help="Format of the output file.  'text' writes "
+                             "delimited text (see --output-delimiter). "
+                             "'npz' (NumPy), 'feather' and 'parquet' write "
+                             "each output column as a typed array, with NaN "
+                             "for missing values, and need an output file "
+                             "(-o).  'feather' and 'parquet' need the Python "
+                             "library pyarrow, and are written one sound "
+                             "file at a time.  'npz' keeps the whole output "
+                             "in memory until all of the files are done. "
+                             "The default is %(default)s.")
     parser.add_argument('--no-output-settings', action="store_false",
                         dest='output_settings',
                         help="Do not write settings file corresponding to "
@@ -761,10 +1260,60 @@ class CLI(object):
                              "file plus the file extension '.settings' (e.g. "
                              "if the output file is 'output.txt', the settings "
                              "file path used is 'output.settings').")
+    parser.add_argument('-j', '--jobs', default=1, type=parser.positive_int,
+                        help="Number of wav files to process in parallel, "
+                             "each in its own worker process.  The output is "
+                             "the same as for a serial run, in input file "
+                             "order.  Default is %(default)s.")
+    parser.add_argument('--threads', default=1, type=parser.positive_int,
+                        help="Number of measurements to compute at the same "
+                             "time for each wav file.  Measurements that "
+                             "don't depend on each other (for example Praat "
+                             "F0 and Praat formants) run in separate threads, "
+                             "which mostly helps when they wait on external "
+                             "programs.  Default is %(default)s.")
+    parser.add_argument('--cache-dir',
+                        help="Directory in which to keep a persistent cache "
+                             "of measurement results.  Results are looked up "
+                             "by the contents of the wav file, the algorithm "
+                             "and its settings, so re-running an analysis "
+                             "only computes the measurements that changed.  "
+                             "By default no cache is used.")
+    parser.add_argument('--cache-size', default=1024,
+                        type=parser.positive_int,
+                        help="Maximum size of the --cache-dir cache in "
+                             "megabytes.  The least recently used results "
+                             "are removed at the end of a run when the cache "
+                             "is larger.  Default is %(default)s.")
+    parser.add_argument('--scratch-dir',
+                        help="Directory in which to put the intermediate "
+                             "files of the external programs (Praat, Snack, "
+                             "REAPER) and resampled wav files.  Each run "
+                             "uses a new directory of its own in it, which "
+                             "is removed at the end, so any number of runs "
+                             "can share the same input files.  Default is "
+                             "/dev/shm if it is writable (memory), else the "
+                             "system's temporary directory.")
+    parser.add_argument('--mmap', action='store_true',
+                        help="Memory-map the wav files instead of reading "
+                             "them into memory, and convert the samples to "
+                             "floating point only as the algorithms use "
+                             "them.  This keeps memory use close to the size "
+                             "of the wav file for very long recordings, and "
+                             "does not change the results.")
     # These options are general settings for the analysis
     parser.add_argument('--resample-freq', type=parser.positive_int,
                         help="Resample sound files at specified frequency in"
                              " Hz.")
+    parser.add_argument('--resample-method', default='fft',
+                        choices=valid_resample_methods,
+                        help="How to resample with --resample-freq.  'fft' "
+                             "resamples the whole signal with a Fourier "
+                             "transform.  'poly' uses a polyphase filter, "
+                             "a block of samples at a time, which is much "
+                             "faster for long files and needs less memory, "
+                             "but gives slightly different resampled data.  "
+                             "Default is %(default)s.")
     parser.add_argument('-f', '--f0', '--F0', default='snackF0',
                         choices=_valid_f0,
                         help="The algorithm to use to compute F0 for use as "
@@ -0,0 +1,148 @@
+"""A persistent, content-addressed cache of measurement results.
+
+Results are stored as NumPy .npz files in a cache directory, under a key
+derived from a hash of the wav file's bytes, the name of the algorithm, and
+the settings the algorithm depends on.  Re-running an analysis on the same
+files with the same settings can then reuse the stored vectors instead of
+computing them again.  The cache is kept under a size limit by deleting the
+least recently used entries.
+
+"""
+
+# Licensed under Apache v2 (see LICENSE)
+
+from __future__ import division
+
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+# Bump this when a change to the algorithms makes old entries invalid.
+cache_version = 1
+
+
+def file_digest(path, blocksize=1 << 20):
+    """Return the hex SHA-1 digest of the contents of the file at path."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        block = f.read(blocksize)
+        while block:
+            h.update(block)
+            block = f.read(blocksize)
+    return h.hexdigest()
+
+
+class MeasurementCache(object):
+
+    def __init__(self, cache_dir, max_size=None):
+        """Store measurement results in cache_dir.
+
+        max_size is the maximum total size of the cache entries in bytes, or
+        None for no limit.  The limit is enforced when evict is called.
+
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self, digest, algorithm, settings):
+        """Return the cache key for a result.
+
+        digest is the file_digest of the wav file, algorithm the name of the
+        algorithm that computed the result, and settings a list of (name,
+        value) pairs of the parameters the result depends on.
+
+        """
+        ident = repr((cache_version, digest, algorithm, sorted(settings)))
+        return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npz')
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def get(self, key):
+        """Return the dictionary of arrays stored under key, or None.
+
+        A hit marks the entry as recently used.
+
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                result = dict((k, data[k]) for k in data.files)
+        except (IOError, OSError):
+            return None
+        except (ValueError, EOFError, zipfile.BadZipfile):
+            # Damaged entry, e.g. from a run that was killed while writing.
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError: # pragma: no cover
+            pass
+        return result
+
+    def put(self, key, arrays):
+        """Store the dictionary of arrays under key."""
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another process may have created it in the meantime.
+                if not os.path.isdir(directory): # pragma: no cover
+                    raise
+        # Write to a temporary file and rename it, so that concurrent readers
+        # never see a partially written entry.
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            try:
+                os.rename(tmp_path, path)
+            except OSError: # pragma: no cover
+                # On Windows rename fails if another process already stored
+                # the same entry, which is just as good.
+                self._remove(tmp_path)
+        except:
+            self._remove(tmp_path)
+            raise
+
+    def _entries(self):
+        for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+            for fn in filenames:
+                if fn.endswith('.npz'):
+                    path = os.path.join(dirpath, fn)
+                    try:
+                        st = os.stat(path)
+                    except OSError: # pragma: no cover
+                        continue
+                    yield st.st_mtime, st.st_size, path
+
+    def size(self):
+        """Return the total size in bytes of the entries in the cache."""
+        return sum(size for mtime, size, path in self._entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_size."""
+        if self.max_size is None:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
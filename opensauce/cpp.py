@@ -0,0 +1,97 @@
+"""Cepstral peak prominence (CPP) estimation
+
+"""
+
+# Licensed under Apache v2 (see LICENSE)
+
+# Follows func_GetCPP.m from VoiceSauce, by Yen-Liang Shue, and J.
+# Hillenbrand, R.A. Cleveland and R.L. Erickson, Acoustic correlates of
+# breathy vocal quality, JSHR, Vol. 37, 1994.
+
+from __future__ import division
+
+import numpy as np
+from scipy.fft import rfft, irfft
+
+from opensauce.helpers import round_half_away_from_zero
+from opensauce.shrp import Frames
+
+
+def cpp(wavdata, fs, num_frames=None, frame_shift=1, window_size=25,
+        min_pitch=60, max_pitch=330, min_quefrency=1, block_size=256):
+    """Return the cepstral peak prominence (dB) of each frame
+
+    Args:
+        wavdata       - audio samples [NumPy vector]
+        fs            - sampling frequency (Hz) [integer]
+        num_frames    - number of frames, by default as many as fit in the
+                        signal (default = None) [integer]
+        frame_shift   - length of each frame in ms (default = 1) [integer]
+        window_size   - length of the analysis window in ms
+                        (default = 25) [number]
+        min_pitch     - lowest F0 whose peak is searched for (Hz)
+                        (default = 60) [number]
+        max_pitch     - highest F0 whose peak is searched for (Hz)
+                        (default = 330) [number]
+        min_quefrency - quefrencies below this are ignored (ms), as they
+                        hold the spectral envelope (default = 1) [number]
+        block_size    - number of frames analyzed at once
+                        (default = 256) [integer]
+    Returns:
+        CPP           - cepstral peak prominence in dB of each frame, NaN if
+                        the signal is shorter than the window
+                        [NumPy vector]
+
+    Frame k, counting from 1, is a Hamming windowed segment centered on
+    sample k * frame_shift ms, counting from 1, moved within the signal at
+    its ends as in shrp.toframes.  Its power cepstrum, in dB, is that of
+    func_GetCPP.m.  The CPP is the height of the largest cepstral peak at
+    the quefrencies of min_pitch to max_pitch above the regression line of
+    the cepstrum over the quefrencies from min_quefrency up.  The FFT is
+    long enough, zero padding the frames if need be, for the cepstrum to
+    reach the period of min_pitch.
+
+    Unlike func_GetCPP.m, which takes the peak nearest the period of F0 in
+    segments of five periods, this doesn't depend on an F0 track, so every
+    frame has a value.  The frames of a block are transformed, and their
+    regression lines fitted, all at once.
+    """
+    if num_frames is None:
+        num_frames = int(np.floor(len(wavdata) / fs * 1000 / frame_shift))
+    CPP = np.full(num_frames, np.nan)
+    segmentlen = int(round_half_away_from_zero(window_size / 1000 * fs))
+    if num_frames == 0 or len(wavdata) < segmentlen:
+        return CPP
+    curpos = round_half_away_from_zero(
+        (np.arange(num_frames) + 1) * (fs / 1000 * frame_shift)).astype(int)
+    frames = Frames(wavdata, curpos - 1, segmentlen, 'hamm')
+    # The cepstrum has nfft // 2 quefrencies, which must reach the period
+    # of min_pitch
+    longest_period = int(np.ceil(fs / min_pitch))
+    nfft = 1 << int(np.ceil(np.log2(max(segmentlen, 2 * longest_period + 2))))
+
+    # Quefrencies (samples) of the regression line, and of the peak search
+    half = nfft // 2
+    q_low = int(round_half_away_from_zero(min_quefrency / 1000 * fs))
+    q = np.arange(q_low, half)
+    peak_low = max(q_low, int(np.floor(fs / max_pitch)))
+    peak_high = longest_period
+    # Least squares slope and intercept of each cepstrum are dot products
+    # with these weights
+    weights = (q - q.mean()) / np.sum((q - q.mean())**2)
+
+    eps = np.finfo(float).eps
+    for start in range(0, num_frames, block_size):
+        block = frames[start:start + block_size]
+        log_power = np.log(np.abs(rfft(block, nfft, axis=1))**2 + eps)
+        cepstrum = irfft(log_power, nfft, axis=1)[:, :half]
+        cepstrum_db = 10 * np.log10(cepstrum**2 + eps)
+        y = cepstrum_db[:, q_low:]
+        slope = np.dot(y, weights)
+        intercept = y.mean(axis=1) - slope * q.mean()
+        peak = peak_low + np.argmax(cepstrum_db[:, peak_low:peak_high + 1],
+                                    axis=1)
+        rows = np.arange(len(block))
+        CPP[start:start + len(block)] = (cepstrum_db[rows, peak] -
+                                         (slope * peak + intercept))
+    return CPP
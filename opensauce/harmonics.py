@@ -7,6 +7,21 @@ from __future__ import division
 
 import numpy as np
 
+from opensauce.helpers import round_half_away_from_zero
+
+# Names of the H1H2H4 measurements: the uncorrected amplitudes (dB) of the
+# first, second and fourth harmonics
+h1h2h4_names = ['H1u', 'H2u', 'H4u']
+# Names of the A1A2A3 measurements: the uncorrected amplitudes (dB) of the
+# spectral peaks near the first, second and third formants
+a1a2a3_names = ['A1u', 'A2u', 'A3u']
+# Names of the corrected harmonic measurements: the amplitudes corrected for
+# the first two formants, and the differences between them
+h1h2h4c_names = ['H1c', 'H2c', 'H4c', 'H1H2c', 'H2H4c']
+# Names of the corrected formant peak measurements: the amplitudes corrected
+# for the formants up to their own, and their differences from H1c
+a1a2a3c_names = ['A1c', 'A2c', 'A3c', 'H1A1c', 'H1A2c', 'H1A3c']
+
 
 def correction_iseli_i(f, F_i, B_i, fs):
     """Return the i-th correction (dB) to the harmonic amplitude using the
@@ -44,6 +59,48 @@ def correction_iseli_i(f, F_i, B_i, fs):
 
     return corr_i
 
+def iseli_corrections(f, F, B, fs):
+    """Return the total corrections (dB) of several frequencies for the
+       first formants, using the algorithm of Iseli and Alwan
+
+       This computes correction_iseli_i for every pair of frequency and
+       formant at once.  The terms that depend only on a formant, or only
+       on a frequency, are computed once and shared by all of the pairs.
+
+    Args:
+        f    - frequencies to be corrected (Hz)
+               [NumPy array, one row per frequency]
+        F    - formant frequencies (Hz) [NumPy array, one row per formant]
+        B    - formant bandwidths (Hz) [NumPy array, one row per formant]
+        fs   - sampling frequency (Hz)
+    Returns:
+        corr - corr[i, j] is the sum of the corrections to the amplitude at
+               f[i] for the first j + 1 formants [NumPy array]
+    """
+    f = np.asarray(f, dtype=float)[:, None]
+    F = np.asarray(F, dtype=float)[None]
+    B = np.asarray(B, dtype=float)[None]
+
+    # Terms of each formant
+    r_i = np.exp(- np.pi * B / fs)
+    omega_i = 2 * np.pi * F / fs
+    cos_i = np.cos(omega_i)
+    sin_i = np.sin(omega_i)
+    r_i_sq = r_i**2 + 1
+    numerator = 20 * np.log10(r_i_sq - 2 * r_i * cos_i)
+    # Terms of each frequency
+    omega = 2 * np.pi * f / fs
+    cos_f = np.cos(omega)
+    sin_f = np.sin(omega)
+
+    # cos(omega_i +/- omega), from the cosines and sines of each term
+    cos_cos = cos_i * cos_f
+    sin_sin = sin_i * sin_f
+    corr = (numerator - 10 * np.log10(r_i_sq - 2 * r_i * (cos_cos - sin_sin))
+                      - 10 * np.log10(r_i_sq - 2 * r_i * (cos_cos + sin_sin)))
+
+    return np.cumsum(corr, axis=1)
+
 def bandwidth_hawks_miller(F_i, F0):
     """Return formant bandwidth estimated from the formant frequency and the
        fundamental frequency
@@ -100,3 +157,335 @@ def bandwidth_hawks_miller(F_i, F0):
     B_i = S * (np.dot(C1, F_i_mat * mask_less_500) + np.dot(C2, F_i_mat * np.logical_not(mask_less_500)))
 
     return B_i
+
+def harmonic_segments(wav_len, fs, F0, frame_shift=1, num_periods=3,
+                      odd=False):
+    """Return where the analysis segment of each frame starts and ends
+
+    Args:
+        wav_len     - number of samples in the signal [integer]
+        fs          - sampling frequency (Hz) [integer]
+        F0          - fundamental frequency of each frame (Hz) [NumPy vector]
+        frame_shift - length of each frame in ms (default = 1) [integer]
+        num_periods - number of pitch periods in a segment
+                      (default = 3) [integer]
+        odd         - whether to shorten segments of even length by their
+                      last sample (default = False) [Boolean]
+    Returns:
+        valid - whether the frame has a segment [NumPy vector of Booleans]
+        start - index of the first sample of the segment [NumPy vector]
+        stop  - index after the last sample of the segment [NumPy vector]
+
+    As in VoiceSauce, the segment of frame k is num_periods periods of
+    F0[k] long, centered on sample k * frame_shift, counting both frames
+    and samples from 1.  Frames without F0, or whose segment doesn't fit
+    within the signal, have no segment.
+    """
+    F0 = np.asarray(F0, dtype=float)
+    # Sample at the center of each frame, counting from 1
+    center = round_half_away_from_zero((np.arange(len(F0)) + 1) *
+                                       (fs / 1000 * frame_shift))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        valid = np.isfinite(F0) & (F0 > 0)
+        period = np.where(valid, fs / F0, 0)
+    # First and last sample of the segment, counting from 1
+    first = round_half_away_from_zero(center - num_periods / 2 * period)
+    last = round_half_away_from_zero(center + num_periods / 2 * period) - 1
+    if odd:
+        # As func_GetHNR.m does, before checking the segment fits
+        last = last - ((last - first + 1) % 2 == 0)
+    valid &= (center >= 1) & (center <= wav_len)
+    valid &= (first >= 1) & (last <= wav_len)
+    return valid, first - 1, last
+
+def harmonic_amplitudes(wavdata, fs, F0, harmonics=(1, 2, 4), frame_shift=1,
+                        num_periods=3, search_range=0.1, oversampling=8,
+                        block_size=1 << 20):
+    """Return the amplitudes (dB) of harmonics of F0 in each frame
+
+    Args:
+        wavdata      - audio samples [NumPy vector]
+        fs           - sampling frequency (Hz) [integer]
+        F0           - fundamental frequency of each frame (Hz)
+                       [NumPy vector]
+        harmonics    - which multiples of F0 to measure
+                       (default = (1, 2, 4)) [sequence of integers]
+        frame_shift  - length of each frame in ms (default = 1) [integer]
+        num_periods  - number of pitch periods analyzed in each frame
+                       (default = 3) [integer]
+        search_range - the peak is searched for within this fraction of
+                       the harmonic's frequency (default = 0.1) [number]
+        oversampling - number of frequencies evaluated per DFT bin of the
+                       longest segment (default = 8) [integer]
+        block_size   - number of samples in the segments analyzed at once
+                       (default = 1 << 20) [integer]
+    Returns:
+        amplitudes   - amplitude of each harmonic in dB, NaN for frames
+                       without a segment (see harmonic_segments)
+                       [NumPy array, one row per harmonic]
+
+    This is the measurement of func_GetH1_H2_H4.m in VoiceSauce: the
+    amplitude of harmonic h is the largest magnitude, in dB, of the
+    discrete-time Fourier transform of the segment at a frequency within
+    h * F0 +/- round(search_range * h * F0) Hz.  VoiceSauce searches for
+    it with a Nelder-Mead optimization per frame and harmonic.  Here the
+    frames are taken in blocks of similar F0, and the transform of all of
+    the segments of a block is evaluated on a grid of frequencies covering
+    the search ranges, oversampling times finer than the DFT of the longest
+    segment, with one matrix product.  The peak within each range, and the
+    magnitude at its two ends, are then refined by fitting a parabola to
+    the dB values of the three nearest grid frequencies.
+    """
+    F0 = np.asarray(F0, dtype=float)
+    amplitudes = np.full((len(harmonics), len(F0)), np.nan)
+    valid, start, stop = harmonic_segments(len(wavdata), fs, F0, frame_shift,
+                                           num_periods)
+    # Frames in order of F0, taken in blocks whose F0 is within 10% of the
+    # lowest, so that the segments of a block have similar lengths and the
+    # search ranges of a harmonic overlap
+    frames = np.flatnonzero(valid)
+    frames = frames[np.argsort(F0[frames], kind='mergesort')]
+    F0_sorted = F0[frames]
+    i = 0
+    while i < len(frames):
+        # Segments are longest at the start of the block
+        n = max(1, block_size // (stop[frames[i]] - start[frames[i]]))
+        n = min(n, np.searchsorted(F0_sorted, 1.1 * F0_sorted[i], 'right') - i)
+        block = frames[i:i + n]
+        amplitudes[:, block] = _block_amplitudes(
+            wavdata, fs, F0[block], start[block], stop[block], harmonics,
+            search_range, oversampling)
+        i += n
+    return amplitudes
+
+def _padded_segments(wavdata, start, stop):
+    # The segments from start to stop, one per row, zero padded to the
+    # longest one
+    length = stop - start
+    n = np.arange(length.max())
+    samples = np.minimum(start[:, None] + n, len(wavdata) - 1)
+    return np.where(n < length[:, None], wavdata[samples], 0)
+
+def _block_amplitudes(wavdata, fs, F0, start, stop, harmonics, search_range,
+                      oversampling):
+    segments = _padded_segments(wavdata, start, stop)
+    n = np.arange(segments.shape[1])
+
+    # Grid of frequencies step * k (Hz) for whole numbers k
+    step = fs / (oversampling * len(n))
+    # Search range of each harmonic, and the grid frequencies from two
+    # below the range to two above it, so that each end of the range has
+    # three grid frequencies around it
+    ranges = []
+    columns = []
+    for h in harmonics:
+        f_est = h * F0
+        df = round_half_away_from_zero(search_range * f_est)
+        f_min, f_max = f_est - df, f_est + df
+        k_min = int(np.floor(f_min.min() / step)) - 2
+        k_max = int(np.ceil(f_max.max() / step)) + 2
+        ranges.append((f_min, f_max, k_min, len(columns)))
+        columns.extend(range(k_min, k_max + 1))
+    # Transform at the grid frequencies, as real and imaginary parts
+    phase = (2 * np.pi / fs * step) * np.outer(n, columns)
+    basis = np.hstack((np.cos(phase), np.sin(phase)))
+    spectrum = np.dot(segments, basis)
+    with np.errstate(divide='ignore'):
+        spectrum_db = 10 * np.log10(spectrum[:, :len(columns)]**2 +
+                                    spectrum[:, len(columns):]**2)
+
+    rows = np.arange(len(F0))[:, None]
+    amplitudes = []
+    for f_min, f_max, k_min, offset in ranges:
+        def parabola(k, x):
+            # dB value at grid position x of the parabola through the
+            # values at grid positions k - 1, k and k + 1
+            col = offset + k - k_min
+            a = spectrum_db[rows[:, 0], col - 1]
+            b = spectrum_db[rows[:, 0], col]
+            c = spectrum_db[rows[:, 0], col + 1]
+            p = x - k
+            return b + p * (c - a) / 2 + p**2 * (a - 2 * b + c) / 2, a, b, c
+        x_min, x_max = f_min / step, f_max / step
+        # Largest value on the grid within the range
+        lo = np.ceil(x_min).astype(int)
+        hi = np.floor(x_max).astype(int)
+        k = lo[:, None] + np.arange(max(1, (hi - lo).max() + 1))
+        values = spectrum_db[rows, offset + np.minimum(k, hi[:, None]) - k_min]
+        values[k > hi[:, None]] = -np.inf
+        with np.errstate(invalid='ignore'):
+            peak = lo + np.argmax(values, axis=1)
+            # Vertex of the parabola through the peak, kept within the
+            # range and to the frequencies next to the peak
+            vertex, a, b, c = parabola(peak, peak)
+            curvature = a - 2 * b + c
+            p = np.where(curvature < 0, (a - c) / (2 * curvature), 0)
+            x = np.clip(peak + np.clip(p, -1, 1), x_min, x_max)
+            amplitude = parabola(peak, x)[0]
+            amplitude[lo > hi] = -np.inf
+            # The ends of the range
+            for x in (x_min, x_max):
+                end = parabola(round_half_away_from_zero(x), x)[0]
+                amplitude = np.fmax(amplitude, end)
+        amplitudes.append(amplitude)
+    return amplitudes
+
+def h1h2h4(wavdata, fs, F0, frame_shift=1, num_periods=3):
+    """Return the amplitudes of the first, second and fourth harmonics
+
+    Args:
+        wavdata     - audio samples [NumPy vector]
+        fs          - sampling frequency (Hz) [integer]
+        F0          - fundamental frequency of each frame (Hz) [NumPy vector]
+        frame_shift - length of each frame in ms (default = 1) [integer]
+        num_periods - number of pitch periods analyzed in each frame
+                      (default = 3) [integer]
+    Returns:
+        estimates   - the amplitudes in dB, uncorrected for the formants,
+                      keyed by h1h2h4_names [dictionary of NumPy vectors]
+
+    See harmonic_amplitudes.
+    """
+    amplitudes = harmonic_amplitudes(wavdata, fs, F0, (1, 2, 4), frame_shift,
+                                     num_periods)
+    return dict(zip(h1h2h4_names, amplitudes))
+
+def formant_peaks(wavdata, fs, F0, F, frame_shift=1, num_periods=3,
+                  fft_length=8192, search_range=0.1, block_size=256):
+    """Return the amplitudes (dB) of the spectral peaks near formants
+
+    Args:
+        wavdata      - audio samples [NumPy vector]
+        fs           - sampling frequency (Hz) [integer]
+        F0           - fundamental frequency of each frame (Hz)
+                       [NumPy vector]
+        F            - formant frequencies of each frame (Hz)
+                       [sequence of NumPy vectors]
+        frame_shift  - length of each frame in ms (default = 1) [integer]
+        num_periods  - number of pitch periods analyzed in each frame
+                       (default = 3) [integer]
+        fft_length   - length of the FFT of each segment
+                       (default = 8192) [integer]
+        search_range - the peak is searched for within this fraction of
+                       the formant frequency (default = 0.1) [number]
+        block_size   - number of frames transformed at once
+                       (default = 256) [integer]
+    Returns:
+        amplitudes   - amplitude of the peak near each formant in dB, NaN
+                       for frames without a segment (see harmonic_segments)
+                       or lacking any of the formants
+                       [NumPy array, one row per formant]
+
+    This is func_GetA1A2A3.m of VoiceSauce, which takes the largest
+    magnitude of the fft_length point FFT of the segment of each frame
+    within F_i +/- search_range * F_i.  Here the segments of a block of
+    frames are zero padded into one array and transformed with one real
+    FFT, and the peaks are picked out of the bands of all of the frames
+    and formants with masks.
+    """
+    F0 = np.asarray(F0, dtype=float)
+    F = np.array(F, dtype=float)
+    amplitudes = np.full(F.shape, np.nan)
+    valid, start, stop = harmonic_segments(len(wavdata), fs, F0, frame_shift,
+                                           num_periods)
+    valid &= np.isfinite(F).all(axis=0)
+    # Bins of the band around each formant, as in ana_GetMagnitudeMax.m
+    fstep = fs / fft_length
+    with np.errstate(invalid='ignore'):
+        low = round_half_away_from_zero(
+            np.maximum(F - search_range * F, 0) / fstep)
+        high = round_half_away_from_zero(
+            np.minimum(F + search_range * F, fs / 2 - fstep) / fstep)
+    bins = np.arange(fft_length // 2)
+    frames = np.flatnonzero(valid)
+    for i in range(0, len(frames), block_size):
+        block = frames[i:i + block_size]
+        segments = _padded_segments(wavdata, start[block], stop[block])
+        magnitude = np.abs(np.fft.rfft(segments, fft_length)[:, :len(bins)])
+        # Guard against log(0)
+        magnitude[magnitude == 0] = 1e-9
+        spectrum_db = 20 * np.log10(magnitude)
+        for row in range(len(F)):
+            band = ((bins >= low[row, block, None]) &
+                    (bins <= high[row, block, None]))
+            amplitudes[row, block] = np.where(band, spectrum_db,
+                                              -np.inf).max(axis=1)
+    # Formants above the Nyquist frequency have empty bands
+    amplitudes[np.isneginf(amplitudes)] = np.nan
+    return amplitudes
+
+def a1a2a3(wavdata, fs, F0, F, frame_shift=1, num_periods=3):
+    """Return the amplitudes of the peaks near the first three formants
+
+    Args:
+        wavdata     - audio samples [NumPy vector]
+        fs          - sampling frequency (Hz) [integer]
+        F0          - fundamental frequency of each frame (Hz) [NumPy vector]
+        F           - first three formant frequencies of each frame (Hz)
+                      [sequence of NumPy vectors]
+        frame_shift - length of each frame in ms (default = 1) [integer]
+        num_periods - number of pitch periods analyzed in each frame
+                      (default = 3) [integer]
+    Returns:
+        estimates   - the amplitudes in dB, uncorrected for the formants,
+                      keyed by a1a2a3_names [dictionary of NumPy vectors]
+
+    See formant_peaks.
+    """
+    amplitudes = formant_peaks(wavdata, fs, F0, F[:3], frame_shift,
+                               num_periods)
+    return dict(zip(a1a2a3_names, amplitudes))
+
+def corrected_harmonics(fs, F0, F, H, A=None, B=None):
+    """Return harmonic and formant peak amplitudes corrected for the formants
+
+    Args:
+        fs        - sampling frequency (Hz) [integer]
+        F0        - fundamental frequency of each frame (Hz) [NumPy vector]
+        F         - frequencies of the first two formants, or of the first
+                    three if A is given (Hz) [sequence of NumPy vectors]
+        H         - uncorrected amplitudes of the first, second and fourth
+                    harmonics (dB) [sequence of NumPy vectors]
+        A         - uncorrected amplitudes of the peaks at the first three
+                    formants (dB) (default = None) [sequence of NumPy vectors]
+        B         - bandwidths of the formants in F (Hz), estimated with
+                    bandwidth_hawks_miller if None (default = None)
+                    [sequence of NumPy vectors]
+    Returns:
+        estimates - the corrected amplitudes and their differences, keyed by
+                    h1h2h4c_names, and by a1a2a3c_names if A is given
+                    [dictionary of NumPy vectors]
+
+    This is func_GetH1H2_H2H4.m and func_GetH1A1_H1A2_H1A3.m of
+    VoiceSauce: H1, H2, H4, A1 and A2 are corrected for the first two
+    formants, and A3 for the first three.  Each correction is computed once,
+    by iseli_corrections, and H1c is shared by all of the differences.
+    """
+    F0 = np.asarray(F0, dtype=float)
+    num_formants = 2 if A is None else 3
+    F = np.array(F[:num_formants], dtype=float)
+    if B is None:
+        # VoiceSauce doesn't use the bandwidths of the formant trackers,
+        # which vary too much
+        B = np.array([bandwidth_hawks_miller(F_i, F0) for F_i in F])
+    else:
+        B = np.array(B[:num_formants], dtype=float)
+    frequencies = [F0, 2 * F0, 4 * F0]
+    amplitudes = list(H)
+    if A is not None:
+        frequencies.extend(F)
+        amplitudes.extend(A)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = iseli_corrections(frequencies, F, B, fs)
+    corrected = np.array(amplitudes, dtype=float) - corr[:, 1]
+    if A is not None:
+        corrected[5] = amplitudes[5] - corr[5, 2]
+
+    H1c, H2c, H4c = corrected[:3]
+    estimates = dict(zip(h1h2h4c_names,
+                         [H1c, H2c, H4c, H1c - H2c, H2c - H4c]))
+    if A is not None:
+        A1c, A2c, A3c = corrected[3:]
+        estimates.update(zip(a1a2a3c_names,
+                             [A1c, A2c, A3c, H1c - A1c, H1c - A2c, H1c - A3c]))
+    return estimates
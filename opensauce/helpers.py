@@ -6,22 +6,30 @@
 
 from __future__ import division
 
+import contextlib
 import math
-import fileinput
+import os
+import shutil
+import tempfile
+import threading
 
 import numpy as np
 from scipy.io import wavfile
 
 
-def wavread(fn):
+def wavread(fn, mmap=False):
     """Read in a 16-bit integer PCM WAV file for processing
 
     Args:
-        fn - filename of WAV file [string]
+        fn   - filename of WAV file [string]
+        mmap - memory-map the samples instead of reading them into memory
+               [boolean] (default = False)
 
     Returns:
-         y_float - Audio samples in float format [NumPy vector]
-         y_int - Audio samples in int format [NumPy vector]
+         y_float - Audio samples in float format [NumPy vector, or
+                   ScaledSamples if mmap is True]
+         y_int - Audio samples in int format [NumPy vector, read-only
+                 NumPy memmap if mmap is True]
         Fs - Sampling frequency in Hz [integer]
 
     Emulate the parts of the Matlab wavread function that we need.
@@ -38,6 +46,11 @@ def wavread(fn):
 
     Also, save the 16-bit integer data in another NumPy vector.
 
+    With mmap, the integer samples stay in the file until they are used,
+    and the float samples are a ScaledSamples view of them, which converts
+    only the samples that are indexed.  The two copies of the data in
+    memory otherwise take five times the size of the file.
+
     The input WAV file is assumed to be in 16-bit integer PCM format.
     """
     # For reference, I figured this out from:
@@ -45,15 +58,60 @@ def wavread(fn):
     # XXX: if we need to handle 8 bit files we'll need to detect them and
     # special case them here.
     try:
-        Fs, y = wavfile.read(fn)
+        Fs, y = wavfile.read(fn, mmap=mmap)
     except ValueError:
         raise
     if y.dtype != 'int16':
         raise IOError('Input WAV file must be in 16-bit integer PCM format')
 
+    if mmap:
+        return ScaledSamples(y), y, Fs
     return y/np.float64(32768.0), y, Fs
 
 
+class ScaledSamples(object):
+    """Float view of 16-bit integer samples, converted as they are indexed
+
+    Indexing returns the same float64 values as dividing the whole integer
+    vector by 32768 would, but converts only the indexed samples, so that
+    algorithms working a window or a block at a time never hold a float
+    copy of the whole signal.  Anything else (np.asarray, arithmetic on the
+    whole vector) converts all of the samples.
+    """
+
+    dtype = np.dtype(np.float64)
+    ndim = 1
+
+    def __init__(self, data_int):
+        self.data_int = data_int
+
+    def __len__(self):
+        return len(self.data_int)
+
+    @property
+    def shape(self):
+        return self.data_int.shape
+
+    def __getitem__(self, key):
+        return self.data_int[key] / np.float64(32768.0)
+
+    def __array__(self, dtype=None, copy=None):
+        y = self[:]
+        return y if dtype is None else y.astype(dtype)
+
+    def mean(self, axis=None, dtype=None, out=None):
+        """Return the mean of the samples, as np.mean of the floats would
+
+        The float samples are multiples of 2**-15, so their sum is exact,
+        and the same as the exact integer sum divided by 32768.  Other
+        arguments than the default ones take the mean of the floats.
+        """
+        if axis is not None or dtype is not None or out is not None:
+            return np.mean(self[:], axis=axis, dtype=dtype, out=out)
+        total = np.sum(self.data_int, dtype=np.int64) / np.float64(32768.0)
+        return total / len(self)
+
+
 def round_half_away_from_zero(x):
     """Rounds a number according to round half away from zero method
 
@@ -78,24 +136,141 @@ def round_half_away_from_zero(x):
 
     return q
 
-def remove_empty_lines_from_file(fn):
-    """ Remove empty lines from a text file
+def nearest_indices(times, targets, max_distance=None):
+    """ Find the nearest of a sorted vector of time points to each target
+
+    Args:
+        times        - time points, in increasing order [NumPy vector]
+        targets      - times to align to the time points [NumPy vector]
+        max_distance - largest distance allowed between a target and its
+                       nearest time point [number]
+                       (default = None, meaning no limit)
+
+    Returns:
+        indices - index in times of the time point nearest to each target
+                  [NumPy vector of integers]
+        found   - whether that time point is within max_distance of the
+                  target [NumPy vector of Booleans]
+
+    The indices are the same as np.argmin(np.abs(times - t)) gives for each
+    target t, including how ties are broken: between two time points at the
+    same distance, and between repeated time points, the smallest index
+    wins.  Using np.searchsorted, aligning n targets to m time points takes
+    O(n log m) time instead of O(n m).
+    """
+    times = np.asarray(times)
+    targets = np.asarray(targets)
+    # First time point at or after each target, and the first of the
+    # repeats of the time point before it
+    right = np.searchsorted(times, targets, side='left')
+    left = np.searchsorted(times, times[np.maximum(right - 1, 0)],
+                           side='left')
+    right = np.minimum(right, len(times) - 1)
+    left_distance = np.abs(targets - times[left])
+    right_distance = np.abs(times[right] - targets)
+    use_left = left_distance <= right_distance
+    indices = np.where(use_left, left, right)
+    distance = np.where(use_left, left_distance, right_distance)
+    if max_distance is None:
+        found = np.ones(len(indices), dtype=bool)
+    else:
+        found = distance <= max_distance
+    return indices, found
+
+def parse_numbers(text, num_cols, skiprows=0):
+    """ Convert the numbers in the text output of a program to an array
 
     Args:
-        fn - filename [string]
+        text     - numbers separated by whitespace, num_cols to a line
+                   [string or bytes]
+        num_cols - number of values on each line, or None for the number
+                   on the first line after the header [integer]
+        skiprows - number of header lines to skip (default = 0) [integer]
 
-    Returns: nothing
+    Returns:
+        data - the values, one row per line [NumPy array]
 
-    Has side effect of removing empty lines from file specified by fn
+    Praat writes '--undefined--' where it has no value, which becomes NaN.
+    The text is split and converted in one go, rather than line by line
+    with a Python converter per value as np.loadtxt does, which on long
+    files at a 1 ms frame shift is hundreds of thousands of calls.
+    Raises ValueError if a value is not a number or the number of values
+    is not a multiple of num_cols.
     """
-    f = fileinput.FileInput(fn, inplace=True)
+    if isinstance(text, bytes):
+        text = text.decode('ascii')
+    for i in range(skiprows):
+        newline = text.find('\n')
+        text = text[newline + 1:] if newline >= 0 else ''
+    if num_cols is None:
+        num_cols = max(len(text.split('\n', 1)[0].split()), 1)
+    values = np.array(text.replace('--undefined--', 'nan').split(), dtype=float)
+    if len(values) % num_cols:
+        raise ValueError('Expected {} values per line'.format(num_cols))
+    return values.reshape((-1, num_cols))
+
+# Directory in which the external programs' intermediate files are put,
+# each user in a directory of its own (see make_scratch_dir).  None means
+# default_scratch_dir().  The command line interface sets it to a new
+# directory for each run (see scratch_run).
+scratch_dir = None
 
-    for line in f:
-        stripped_line = line.rstrip()
-        if stripped_line:
-            print(stripped_line)
+def default_scratch_dir():
+    """ Return the default directory for intermediate files
 
-    f.close()
+    This is /dev/shm if it is a writable directory (on Linux, a tmpfs held
+    in memory), so that the intermediate files never reach a disk, and the
+    system's temporary directory otherwise.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK | os.X_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def set_scratch_dir(path):
+    """ Set the directory in which make_scratch_dir makes directories """
+    global scratch_dir
+    scratch_dir = path
+
+def make_scratch_dir(prefix='opensauce-', dir=None):
+    """ Make a new private directory for intermediate files
+
+    Args:
+        prefix - start of the name of the directory [string]
+        dir    - directory to make it in [string]
+                 (default = None, meaning scratch_dir)
+
+    Returns:
+        path - path of the new directory [string]
+
+    The directory has a unique name, so that any number of threads and
+    processes can make their own, even in the same place.  The caller
+    removes it once done with it.
+    """
+    if dir is None:
+        dir = scratch_dir
+    if dir is None:
+        dir = default_scratch_dir()
+    return tempfile.mkdtemp(prefix=prefix, dir=dir)
+
+@contextlib.contextmanager
+def scratch_run(dir=None):
+    """ Put the intermediate files in a directory of their own for a while
+
+    Args:
+        dir - directory in which to make that directory [string]
+              (default = None, meaning default_scratch_dir())
+
+    Sets scratch_dir to a new directory for the duration of the with block,
+    and removes it, with anything left in it, at the end.
+    """
+    path = make_scratch_dir('opensauce-run-', dir or default_scratch_dir())
+    previous = scratch_dir
+    set_scratch_dir(path)
+    try:
+        yield path
+    finally:
+        set_scratch_dir(previous)
+        shutil.rmtree(path, ignore_errors=True)
 
 def convert_boolean_for_praat(b):
     """ Convert Python boolean for use in Praat
@@ -109,3 +284,63 @@ def convert_boolean_for_praat(b):
         return "no"
     else:
         raise ValueError('Input must be a Boolean')
+
+def run_with_dependencies(names, func, dependencies=None, max_threads=None):
+    """ Call func for each name, running independent calls concurrently
+
+    Args:
+        names        - names of the tasks to run [list of strings]
+        func         - function called as func(name) for each task
+        dependencies - maps a name to the names of tasks that must finish
+                       before it may start; names that are not in names
+                       are ignored [dictionary]
+        max_threads  - maximum number of calls to run at the same time,
+                       default is one thread per task [integer]
+
+    Returns:
+        results - maps each name to the value returned by func(name)
+                  [dictionary]
+
+    Each call runs in its own thread, which only starts its call once all of
+    its dependencies have finished and a thread slot is free, so calls that
+    spend most of their time waiting on a subprocess overlap.  If any call
+    raises, the tasks depending on it are skipped, and once every thread has
+    finished the exception of the first failing task in names is re-raised.
+    With a single task or max_threads=1 the calls are simply made one after
+    the other in the order of names, which must then list dependencies first.
+    """
+    if dependencies is None:
+        dependencies = {}
+    results = {}
+    if len(names) <= 1 or max_threads == 1:
+        for name in names:
+            results[name] = func(name)
+        return results
+    finished = dict((name, threading.Event()) for name in names)
+    errors = {}
+    slots = threading.Semaphore(max_threads or len(names))
+
+    def run(name):
+        try:
+            for dependency in dependencies.get(name, ()):
+                if dependency in finished:
+                    finished[dependency].wait()
+                    if dependency not in results:
+                        # The dependency failed, its error is reported.
+                        return
+            with slots:
+                results[name] = func(name)
+        except Exception as err:
+            errors[name] = err
+        finally:
+            finished[name].set()
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for name in names:
+        if name in errors:
+            raise errors[name]
+    return results
@@ -0,0 +1,223 @@
+"""Harmonic to noise ratio (HNR) estimation
+
+"""
+
+# Licensed under Apache v2 (see LICENSE)
+
+# Based on func_GetHNR.m from VoiceSauce, by Yen-Liang Shue, which implements
+# the method of G. de Krom, A cepstrum-based technique for determining a
+# harmonic-to-noise ratio in speech signals, JSHR, Vol. 36, 1993.
+
+from __future__ import division
+
+import numpy as np
+from scipy.fft import rfft, irfft
+
+from opensauce.helpers import round_half_away_from_zero
+from opensauce.harmonics import harmonic_segments
+
+# Names of the HNR measurements, one per upper band limit in hnr_freqs
+hnr_names = ['HNR05', 'HNR15', 'HNR25', 'HNR35']
+# Upper limit (Hz) of the band of each HNR measurement
+hnr_freqs = [500, 1500, 2500, 3500]
+
+
+def segment_hnr(segment, fs, F0, freqs=hnr_freqs):
+    """Return the HNR (dB) of one segment below each frequency in freqs
+
+    Args:
+        segment - audio samples of the segment [NumPy vector]
+        fs      - sampling frequency (Hz) [integer]
+        F0      - fundamental frequency of the segment (Hz) [number]
+        freqs   - upper limits of the bands (Hz)
+                  (default = hnr_freqs) [sequence of numbers]
+    Returns:
+        hnr     - HNR of each band in dB [NumPy vector]
+
+    This is getHNR of func_GetHNR.m, one segment at a time.  It is the
+    reference for the batched computation of hnr.
+    """
+    L = len(segment)
+    N0 = int(round_half_away_from_zero(fs / F0))
+    N0_delta = int(round_half_away_from_zero(N0 * 0.1))
+
+    y = segment * np.hamming(L)
+    with np.errstate(divide='ignore'):
+        aY = np.log10(np.abs(np.fft.fft(y)))
+    ay = np.fft.ifft(aY).real
+
+    # Lifter out the rahmonic peaks, from the valleys around each
+    for k in range(1, int(np.floor(L / 2 / N0)) + 1):
+        base = k * N0 - N0_delta - 1
+        ayseg = ay[base:k * N0 + N0_delta]
+        p = np.argmax(np.abs(ayseg))
+        s = np.sign(np.diff(ayseg))
+        left = np.flatnonzero(s[:p] != 1)
+        right = np.flatnonzero(s[p + 1:] == 1)
+        if len(left) and len(right):
+            ay[base + left[-1] + 1:base + p + 2 + right[0]] = 0
+
+    midL = int(round_half_away_from_zero(L / 2)) + 1
+    ay[midL - 1:] = ay[L - midL + 1:0:-1]
+
+    Nap = np.fft.fft(ay).real
+    N = Nap.copy()
+    Ha = aY - Nap
+
+    # Baseline correction, per harmonic interval
+    Hdelta = F0 / fs * L
+    m = 0
+    f = Hdelta + 0.0001
+    while f <= round_half_away_from_zero(L / 2):
+        fstart = int(np.ceil(f - Hdelta))
+        fstop = int(round_half_away_from_zero(f))
+        N[fstart - 1:fstop] -= np.abs(Ha[fstart - 1:fstop].min())
+        m += 1
+        f = Hdelta + 0.0001 + m * Hdelta
+
+    H = aY - N
+    hnr = np.zeros(len(freqs))
+    for i, freq in enumerate(freqs):
+        Ef = int(round_half_away_from_zero(freq / fs * L))
+        hnr[i] = np.mean(20 * H[:Ef]) - np.mean(20 * N[:Ef])
+    return hnr
+
+def hnr(wavdata, fs, F0, frame_shift=1, num_periods=5, freqs=hnr_freqs,
+        block_size=1 << 20):
+    """Return the harmonic to noise ratios (dB) of each frame
+
+    Args:
+        wavdata     - audio samples [NumPy vector]
+        fs          - sampling frequency (Hz) [integer]
+        F0          - fundamental frequency of each frame (Hz) [NumPy vector]
+        frame_shift - length of each frame in ms (default = 1) [integer]
+        num_periods - number of pitch periods analyzed in each frame
+                      (default = 5) [integer]
+        freqs       - upper limits of the bands (Hz)
+                      (default = hnr_freqs) [sequence of numbers]
+        block_size  - number of samples in the segments analyzed at once
+                      (default = 1 << 20) [integer]
+    Returns:
+        estimates   - the HNR of each band in dB, NaN for frames without a
+                      segment (see harmonics.harmonic_segments,
+                      with odd=True), keyed by hnr_names if
+                      freqs is hnr_freqs and by the frequencies otherwise
+                      [dictionary of NumPy vectors]
+
+    This computes segment_hnr for every frame.  The segments have lengths
+    that vary with F0, and each is transformed with an FFT of its own
+    length, so the frames are grouped by segment length.  The segments of
+    a group are taken into one array, a block at a time, and their
+    cepstra, liftering, baseline corrections and the energy of all of the
+    bands are computed for the whole block at once.
+    """
+    F0 = np.asarray(F0, dtype=float)
+    values = np.full((len(freqs), len(F0)), np.nan)
+    valid, start, stop = harmonic_segments(len(wavdata), fs, F0, frame_shift,
+                                           num_periods, odd=True)
+    frames = np.flatnonzero(valid)
+    lengths = stop[frames] - start[frames]
+    for L in np.unique(lengths):
+        group = frames[lengths == L]
+        n = max(1, block_size // L)
+        for i in range(0, len(group), n):
+            block = group[i:i + n]
+            segments = wavdata[start[block, None] + np.arange(L)]
+            values[:, block] = _block_hnr(segments, fs, F0[block], freqs)
+    if list(freqs) == hnr_freqs:
+        names = hnr_names
+    else:
+        names = freqs
+    return dict(zip(names, values))
+
+def _block_hnr(segments, fs, F0, freqs):
+    # segment_hnr for segments of the same odd length L, one per row
+    num, L = segments.shape
+    rows = np.arange(num)[:, None]
+    N0 = round_half_away_from_zero(fs / F0).astype(int)
+    N0_delta = round_half_away_from_zero(N0 * 0.1).astype(int)
+
+    # Log spectra and real cepstra, with only the first half of the
+    # spectrum, since the segments are real
+    y = segments * np.hamming(L)
+    with np.errstate(divide='ignore'):
+        aY = np.log10(np.abs(rfft(y, axis=1)))
+    ay = irfft(aY, L, axis=1)
+
+    # Lifter out the rahmonic peaks, from the valleys around each.  The
+    # search windows of all of the peaks of all of the rows are taken at
+    # once, padded to the widest
+    K = np.floor(L / 2 / N0).astype(int)
+    k = np.arange(1, K.max() + 1)
+    width = 2 * N0_delta + 1
+    i = np.arange(width.max())
+    base = k[None, :] * N0[:, None] - N0_delta[:, None] - 1
+    in_window = ((i < width[:, None, None]) &
+                 (k[None, :, None] <= K[:, None, None]))
+    index = np.where(in_window, base[:, :, None] + i, 0)
+    ayseg = ay[rows[:, :, None], index]
+    p = np.argmax(np.where(in_window, np.abs(ayseg), -np.inf), axis=2)
+    s = np.sign(np.diff(ayseg, axis=2))
+    in_diff = in_window[:, :, 1:]
+    j = i[:-1]
+    p_ = p[:, :, None]
+    # The last fall before the peak, and the first rise after it
+    left = np.where(in_diff & (j < p_) & (s != 1), j, -1).max(axis=2)
+    right = np.where(in_diff & (j > p_) & (s == 1), j,
+                     len(i)).min(axis=2)
+    found = (left >= 0) & (right < len(i))
+    lifter = (found[:, :, None] & in_window &
+              (i > left[:, :, None]) & (i <= right[:, :, None]))
+    ay[np.broadcast_to(rows[:, :, None], lifter.shape)[lifter],
+       index[lifter]] = 0
+
+    # The liftered cepstrum, made symmetric again
+    midL = int(round_half_away_from_zero(L / 2)) + 1
+    ay[:, midL - 1:] = ay[:, L - midL + 1:0:-1]
+    Nap = rfft(ay, axis=1).real
+    N = Nap.copy()
+    Ha = aY - Nap
+
+    # Baseline correction, per harmonic interval.  Only the intervals
+    # starting at or below the highest band matter.  Interval m of a row
+    # covers the bins, counting from 1, from start[:, m] to stop[:, m]
+    Hdelta = F0 / fs * L
+    half = int(round_half_away_from_zero(L / 2))
+    Ef = round_half_away_from_zero(np.asarray(freqs) / fs * L).astype(int)
+    Ef = np.minimum(Ef, L)
+    top = min(half, Ef.max())
+    m = np.arange(int(np.floor(top / Hdelta.min())) + 1)
+    f = Hdelta[:, None] + 0.0001 + m * Hdelta[:, None]
+    start = np.ceil(f - Hdelta[:, None]).astype(int)
+    stop = round_half_away_from_zero(f).astype(int)
+    has = (f <= half) & (start <= top)
+    start = np.where(has, start, 1)
+    stop = np.where(has, stop, 1)
+    # Smallest value of Ha over each interval
+    t = np.arange((stop - start).max() + 1)
+    in_interval = t <= (stop - start)[:, :, None]
+    bins = np.where(in_interval, start[:, :, None] + t - 1, 0)
+    Bdf = np.abs(np.where(in_interval, Ha[rows[:, :, None], bins],
+                          np.inf).min(axis=2))
+    Bdf[~has] = 0
+    # Subtract it from every bin of the interval, with a running sum of the
+    # changes at the ends of the intervals
+    change = np.zeros((num, N.shape[1] + 1))
+    np.add.at(change, (np.broadcast_to(rows, start.shape), start - 1), Bdf)
+    np.add.at(change, (np.broadcast_to(rows, stop.shape), stop), -Bdf)
+    N -= np.cumsum(change, axis=1)[:, :N.shape[1]]
+
+    # Energy of each band, from the running sum over the bins
+    H = aY - N
+    R = N.shape[1]
+    total = np.cumsum(20 * H - 20 * N, axis=1)
+    band = total[:, np.minimum(Ef, R) - 1]
+    # Bands reaching past the half spectrum (at low sampling frequencies)
+    # also sum the bins above it, which mirror those below it, but without
+    # the baseline correction
+    over = Ef > R
+    if over.any():
+        mirrored = np.cumsum(20 * aY - 40 * Nap, axis=1)
+        band[:, over] += (mirrored[:, [L - R]] -
+                          mirrored[:, L - Ef[over]])
+    return (band / Ef).T
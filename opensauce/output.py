@@ -0,0 +1,249 @@
+"""Writers for the measurement output of the command line interface
+
+The output is a table with one row per frame.  DelimitedWriter writes it as
+delimited text.  The columnar writers take the table one sound file at a
+time as a list of NumPy columns, and store each column with its own type
+(strings for file names and labels, integers for times, floats for the
+measurements, with NaN for missing values) instead of formatting every
+value as text.
+
+"""
+
+# Licensed under Apache v2 (see LICENSE)
+
+from __future__ import division
+
+import csv
+
+import numpy as np
+
+
+class _Chunks(list):
+    # A file-like object for csv.writer, which writes one string per row.
+    write = list.append
+
+
+class _Text(str):
+    # A string that is formatted as itself whatever the format spec, so
+    # that it can stand in for a number in a str.format argument list.
+    def __format__(self, spec):
+        return str(self)
+
+
+class DelimitedWriter(object):
+    """Write rows to a text file as delimited values in a single pass
+
+    Rows are formatted like csv.writer does and collected in memory until
+    about buffer_size characters are pending, then written to the file in
+    one call.  Rows end with a plain newline rather than the dialect's line
+    terminator, trailing whitespace is removed from each row and empty rows
+    are dropped, so the output needs no cleaning up afterwards.
+
+    Rows can be given as lists of strings (writerow and writerows) or as
+    NumPy columns (write_columns).  In columns, floats are written with
+    three decimals, and NaN values as the nan string.
+
+    Call flush (or close) to write the pending rows; flush before writing
+    anything else to the same file.
+    """
+
+    def __init__(self, f, dialect=csv.excel, nan='NaN', buffer_size=1 << 20):
+        self.f = f
+        self.buffer_size = buffer_size
+        self._rows = _Chunks()
+        self._writer = csv.writer(self._rows, dialect=dialect,
+                                  lineterminator='\n')
+        self._delimiter = self._writer.dialect.delimiter
+        self._pending = []
+        self._pending_size = 0
+        self._nan = _Text(self._quote(nan))
+        # Only an empty NaN string, or one ending in whitespace, can leave
+        # trailing whitespace on a row written by write_columns.
+        self._strip_columns = self._nan.rstrip() != self._nan or not self._nan
+
+    def _quote(self, value):
+        # Return value as csv.writer writes it as a field.  The second field
+        # keeps a lone empty field from being quoted.
+        self._writer.writerow([value, ''])
+        return self._rows.pop()[:-len(self._delimiter) - 1]
+
+    def _add(self, text):
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.buffer_size:
+            self.flush()
+
+    def writerow(self, row):
+        self.writerows([row])
+
+    def writerows(self, rows):
+        self._writer.writerows(rows)
+        lines = []
+        for row in self._rows:
+            line = row.rstrip()
+            if line:
+                lines.append(line + '\n')
+        del self._rows[:]
+        self._add(''.join(lines))
+
+    def write_columns(self, columns):
+        """Write the rows given by a list of NumPy columns
+
+        The rows are formatted in blocks of consecutive rows with the same
+        values in all of the string columns (such as the rows of one
+        TextGrid interval).  A block is formatted by a single str.format
+        call, with the string values and delimiters in the format string
+        and the numbers taken from a 2-D array of the numeric columns.
+        """
+        n = len(columns[0]) if columns else 0
+        if n == 0:
+            return
+        strings = [c.dtype.kind in 'SU' for c in columns]
+        # Row indices where a block starts
+        change = np.zeros(n - 1, dtype=bool)
+        for c, is_string in zip(columns, strings):
+            if is_string:
+                change |= c[1:] != c[:-1]
+        starts = np.concatenate(([0], np.flatnonzero(change) + 1, [n]))
+        # The numbers of all rows, as Python objects
+        numbers = [c for c, is_string in zip(columns, strings)
+                   if not is_string]
+        values = np.empty((n, len(numbers)), dtype=object)
+        formats = []
+        for j, c in enumerate(numbers):
+            values[:, j] = c.astype(object)
+            formats.append('{:.3f}' if c.dtype.kind == 'f' else '{:d}')
+        lines = []
+        for start, stop in zip(starts[:-1], starts[1:]):
+            fields = []
+            j = 0
+            for c, is_string in zip(columns, strings):
+                if is_string:
+                    text = self._quote(c[start])
+                    fields.append(text.replace('{', '{{').replace('}', '}}'))
+                else:
+                    fields.append(formats[j])
+                    j += 1
+            template = self._delimiter.join(fields) + '\n'
+            block = values[start:stop]
+            # NaN is formatted as 'nan', which is replaced by the NaN string
+            # afterwards, unless the strings of the block contain 'nan' too.
+            replace_nan = 'nan' not in template
+            if not replace_nan:
+                block = block.copy()
+                for j, c in enumerate(numbers):
+                    if c.dtype.kind == 'f':
+                        block[np.isnan(c[start:stop]), j] = self._nan
+            text = (template * (stop - start)).format(*block.ravel().tolist())
+            if replace_nan:
+                text = text.replace('nan', self._nan)
+            lines.append(text)
+        text = ''.join(lines)
+        if self._strip_columns:
+            text = ''.join(line.rstrip() + '\n'
+                           for line in text[:-1].split('\n'))
+        self._add(text)
+
+    def flush(self):
+        """Write the pending rows to the file"""
+        if self._pending:
+            self.f.write(''.join(self._pending))
+        del self._pending[:]
+        self._pending_size = 0
+
+    def close(self):
+        """Write the pending rows; the file itself is left open"""
+        self.flush()
+
+
+valid_output_formats = ['text', 'npz', 'feather', 'parquet']
+
+# Formats that need the pyarrow package
+arrow_output_formats = ['feather', 'parquet']
+
+
+def _empty_column(field):
+    # A column without rows, of the type the command line interface uses
+    # for field.
+    if field in ('Filename', 'Label'):
+        return np.array([], dtype='U')
+    if field == 't_ms':
+        return np.array([], dtype=int)
+    return np.array([], dtype=float)
+
+
+class NpzWriter(object):
+    """Write columns to a NumPy .npz file, with one array per column
+
+    An .npz file can't be appended to, so the columns of all sound files
+    are kept in memory and written to path by close: the memory used grows
+    with the whole output, unlike the other writers.  Each column's chunks
+    are released as soon as they are joined, so that the output is only
+    held twice over one column at a time.
+    """
+
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = fields
+        self._chunks = [[] for field in fields]
+
+    def write_columns(self, columns):
+        """Add the columns of a sound file, ordered as fields"""
+        for chunks, column in zip(self._chunks, columns):
+            chunks.append(column)
+
+    def close(self):
+        arrays = {}
+        for field, chunks in zip(self.fields, self._chunks):
+            if chunks:
+                arrays[field] = np.concatenate(chunks)
+            else:
+                arrays[field] = _empty_column(field)
+            del chunks[:]
+        # Passing a file object keeps np.savez from adding an extension.
+        with open(self.path, 'wb') as f:
+            np.savez(f, **arrays)
+
+
+class ArrowWriter(object):
+    """Write columns to a Feather (Arrow IPC) or Parquet file
+
+    Requires the pyarrow package.  The columns of each sound file are
+    written as they arrive, as a record batch (Feather) or a row group
+    (Parquet), so only one sound file's columns are held in memory.  If no
+    columns are written, close writes a table without rows.
+    """
+
+    def __init__(self, path, fields, output_format='parquet'):
+        if output_format not in arrow_output_formats: # pragma: no cover
+            raise ValueError('Invalid Arrow output format. Choices are {}'.format(arrow_output_formats))
+        import pyarrow
+        self._pa = pyarrow
+        self.path = path
+        self.fields = fields
+        self.output_format = output_format
+        self._sink = None
+        self._writer = None
+
+    def write_columns(self, columns):
+        """Add the columns of a sound file, ordered as fields"""
+        pa = self._pa
+        table = pa.Table.from_arrays([pa.array(c) for c in columns],
+                                     names=self.fields)
+        if self._writer is None:
+            # The schema follows from the types of the first file's columns.
+            if self.output_format == 'parquet':
+                import pyarrow.parquet
+                self._writer = pyarrow.parquet.ParquetWriter(self.path,
+                                                             table.schema)
+            else:
+                self._sink = pa.OSFile(self.path, 'wb')
+                self._writer = pa.ipc.new_file(self._sink, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is None:
+            self.write_columns([_empty_column(f) for f in self.fields])
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
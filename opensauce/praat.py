@@ -10,11 +10,13 @@
 from __future__ import division
 
 import os
+import shutil
 import numpy as np
 
 from subprocess import call
 
 from opensauce.helpers import round_half_away_from_zero, convert_boolean_for_praat
+from opensauce.helpers import nearest_indices, make_scratch_dir, parse_numbers
 
 # Methods for performing Praat pitch analysis
 # 'ac' is autocorrelation method
@@ -24,13 +26,6 @@ valid_praat_f0_methods = ['ac', 'cc']
 # Directory containing Praat scripts
 praat_script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'praat-scripts')
 
-# Praat will sometimes set numerical values to the string '--undefined--'
-# But NumPy can't have a string in a float array, so we convert the
-# '--undefined--' values to NaN
-# Python 3 reads the undefined strings as byte literals, so we also have to
-# check for the byte literal b'--undefined--'
-undef = lambda x: np.nan if x =='--undefined--' or x == b'--undefined--' else x
-
 def praat_pitch(wav_fn, data_len, praat_path, frame_shift=1, method='cc',
                 frame_precision=1, min_pitch=40, max_pitch=500,
                 silence_threshold=0.03, voice_threshold=0.45, octave_cost=0.01,
@@ -117,26 +112,32 @@ def praat_pitch(wav_fn, data_len, praat_path, frame_shift=1, method='cc',
     # We use a crude interpolation method, that has precision set by
     # frame_precision.
 
+    idx_f, min_idx = _align_frames(t_raw_ms, data_len, frame_shift,
+                                   frame_precision)
+    F0[idx_f] = F0_raw[min_idx]
+
+    return F0
+
+def _align_frames(t_raw_ms, data_len, frame_shift, frame_precision):
+    """Match measurement frames to the nearest raw Praat time points
+
+    Returns the indices of the frames that have a raw time point within
+    frame_precision frames, and the indices of those raw time points.
+    """
     # Determine start and stop times
     start = 0
     if t_raw_ms[-1] % frame_shift == 0:
         stop = t_raw_ms[-1] + frame_shift
     else:
         stop = t_raw_ms[-1]
-    # Iterate through timepoints corresponding to each frame in time range
-    for idx_f, t_f in enumerate(range(start, stop, frame_shift)):
-        # Find closest time point among calculated Praat values
-        min_idx = np.argmin(np.abs(t_raw_ms - t_f))
-
-        # If closest time point is too far away, skip
-        if np.abs(t_raw_ms[min_idx] - t_f) > frame_precision * frame_shift:
-             continue
-
-        # If index is in range, set value of F0
-        if (idx_f >= 0) and (idx_f < data_len): # pragma: no branch
-            F0[idx_f] = F0_raw[min_idx]
-
-    return F0
+    # Timepoints corresponding to each frame in time range, up to data_len
+    t_f = np.arange(start, stop, frame_shift)[:data_len]
+    # Find closest time point among calculated Praat values, and skip the
+    # frames where it is too far away
+    min_idx, found = nearest_indices(t_raw_ms, t_f,
+                                     frame_precision * frame_shift)
+    idx_f = np.flatnonzero(found)
+    return idx_f, min_idx[idx_f]
 
 def praat_raw_pitch(wav_fn, praat_path, frame_shift=1, method='cc',
                     min_pitch=40, max_pitch=500, silence_threshold=0.03,
@@ -155,7 +156,7 @@ def praat_raw_pitch(wav_fn, praat_path, frame_shift=1, method='cc',
         t_raw  - times corresponding to raw F0 [NumPy Vector]
         F0_raw - raw F0 estimates [NumPy vector]
     """
-    # Determine extension of Praat output file
+    # Determine extension of Praat output file, used in error messages
     if method == 'ac':
         ext = '.praatac'
     elif method == 'cc':
@@ -163,43 +164,49 @@ def praat_raw_pitch(wav_fn, praat_path, frame_shift=1, method='cc',
     else: # pragma: no cover
         raise ValueError('Invalid Praat F0 method. Choices are {}'.format(valid_praat_f0_methods))
 
+    params = _pitch_params(frame_shift, method, min_pitch, max_pitch,
+                           silence_threshold, voice_threshold, octave_cost,
+                           octave_jumpcost, voiced_unvoiced_cost,
+                           kill_octave_jumps, interpolate, smooth,
+                           smooth_bandwidth)
+    # Use the result of an earlier prefetch_praat_pitch, if there is one
+    prefetched = _prefetched.pop(('pitch', os.path.abspath(wav_fn), praat_path,
+                                  params), None)
+    if prefetched is not None:
+        return prefetched
+
+    # Run Praat F0 script, which writes its output to a scratch directory
+    t_raw, F0_raw = _run_batch('praatF0_batch.praat', [wav_fn], praat_path,
+                               params, _read_pitch_file, ext)[0]
+
+    return t_raw, F0_raw
+
+def _pitch_params(frame_shift, method, min_pitch, max_pitch,
+                  silence_threshold, voice_threshold, octave_cost,
+                  octave_jumpcost, voiced_unvoiced_cost, kill_octave_jumps,
+                  interpolate, smooth, smooth_bandwidth):
+    """Return the Praat F0 script arguments following the file arguments"""
     # Convert Boolean variables to Praat values
     kill_octave_jumps = convert_boolean_for_praat(kill_octave_jumps)
     interpolate = convert_boolean_for_praat(interpolate)
     smooth = convert_boolean_for_praat(smooth)
 
-    # Setup command to call Praat F0 script
-    praat_cmd = [praat_path, '--run']
-    praat_cmd.append(os.path.join(praat_script_dir, 'praatF0.praat'))
-    praat_cmd.extend([os.path.abspath(wav_fn), os.path.splitext(wav_fn)[1]])
-    praat_cmd.extend([str(frame_shift / 1000), str(min_pitch), str(max_pitch)])
-    praat_cmd.extend([str(silence_threshold), str(voice_threshold)])
-    praat_cmd.extend([str(octave_cost), str(octave_jumpcost)])
-    praat_cmd.extend([str(voiced_unvoiced_cost), kill_octave_jumps])
-    praat_cmd.extend([smooth, str(smooth_bandwidth)])
-    praat_cmd.extend([interpolate, str(method)])
-
-    # Run Praat F0 script
-    return_code = call(praat_cmd)
-
-    if return_code != 0: # pragma: no cover
-        raise OSError('Praat error')
-
-    # Path for Praat F0 output file corresponding to wav_fn
-    f0_fn = wav_fn.split('.')[0] + ext
-    # Load data from f0 file
-    if os.path.isfile(f0_fn):
-        # Check if file is empty
-        if os.stat(f0_fn).st_size == 0:
-            os.remove(f0_fn)
-            raise OSError('Praat error -- pitch calculation failed, check input parameters')
-        t_raw, F0_raw = np.loadtxt(f0_fn, unpack=True, converters={0: undef, 1: undef})
-        # Cleanup and remove f0 file
-        os.remove(f0_fn)
-    else: # pragma: no cover
-        raise OSError('Praat error -- unable to locate {} file'.format(ext))
-
-    return t_raw, F0_raw
+    params = [str(frame_shift / 1000), str(min_pitch), str(max_pitch)]
+    params.extend([str(silence_threshold), str(voice_threshold)])
+    params.extend([str(octave_cost), str(octave_jumpcost)])
+    params.extend([str(voiced_unvoiced_cost), kill_octave_jumps])
+    params.extend([smooth, str(smooth_bandwidth)])
+    params.extend([interpolate, str(method)])
+    return tuple(params)
+
+def _read_pitch_file(f0_fn):
+    """Return the times and F0 values in a Praat F0 script output file"""
+    # Check if file is empty
+    if os.stat(f0_fn).st_size == 0:
+        raise OSError('Praat error -- pitch calculation failed, check input parameters')
+    with open(f0_fn) as f:
+        data_raw = parse_numbers(f.read(), 2)
+    return data_raw[:, 0], data_raw[:, 1]
 
 def praat_formants(wav_fn, data_len, praat_path, frame_shift=1, window_size=25,
                    frame_precision=1, num_formants=4, max_formant_freq=6000):
@@ -259,26 +266,10 @@ def praat_formants(wav_fn, data_len, praat_path, frame_shift=1, window_size=25,
     # Convert time from seconds to nearest whole millisecond
     t_raw_ms = np.int_(round_half_away_from_zero(estimates_raw['ptFormants'] * 1000))
 
-    # Determine start and stop times
-    start = 0
-    if t_raw_ms[-1] % frame_shift == 0:
-        stop = t_raw_ms[-1] + frame_shift
-    else:
-        stop = t_raw_ms[-1]
-    # Iterate through timepoints corresponding to each frame in time range
-    for idx_f, t_f in enumerate(range(start, stop, frame_shift)):
-        # Find closest time point among calculated Praat values
-        min_idx = np.argmin(np.abs(t_raw_ms - t_f))
-
-        # If closest time point is too far away, skip
-        if np.abs(t_raw_ms[min_idx] - t_f) > frame_precision * frame_shift:
-             continue
-
-        # If index is in range, set measurement value
-        if (idx_f >= 0) and (idx_f < data_len): # pragma: no branch
-            for k in estimates_raw:
-                if k != 'ptFormants':
-                    estimates[k][idx_f] = estimates_raw[k][min_idx]
+    idx_f, min_idx = _align_frames(t_raw_ms, data_len, frame_shift,
+                                   frame_precision)
+    for k in estimates:
+        estimates[k][idx_f] = estimates_raw[k][min_idx]
 
     return estimates
 
@@ -302,33 +293,36 @@ def praat_raw_formants(wav_fn, praat_path, frame_shift=1, window_size=25, num_fo
     is always a key 'ptFormants' which corresponds to the vector of time
     points matching the estimated formant and bandwidth vectors.
     """
-    # Setup command to call Praat F0 script
-    praat_cmd = [praat_path, '--run']
-    praat_cmd.append(os.path.join(praat_script_dir, 'praatformants.praat'))
-    praat_cmd.extend([os.path.abspath(wav_fn), os.path.splitext(wav_fn)[1]])
-    praat_cmd.extend([str(frame_shift / 1000), str(window_size / 1000)])
-    praat_cmd.extend([str(num_formants), str(max_formant_freq)])
-
-    # Run Praat F0 script
-    return_code = call(praat_cmd)
-
-    if return_code != 0: # pragma: no cover
-        raise OSError('Praat error')
-
-    # Path for Praat output file corresponding to wav_fn
-    fmt_fn = wav_fn.split('.')[0] + '.pfmt'
-    # Load results from Praat file
-    if os.path.isfile(fmt_fn):
-        # Praat allows half integer values for num_formants
-        # So we round up to get total number of formant columns
-        num_cols = 2 + round_half_away_from_zero(num_formants) * 2
-        # Define dictionary that uses undef for all columns
-        undef_dict = {i: undef for i in range(num_cols)}
-        data_raw = np.loadtxt(fmt_fn, dtype=float, skiprows=1, converters=undef_dict)
-        # Cleanup and remove Praat file
-        os.remove(fmt_fn)
-    else: # pragma: no cover
-        raise OSError('Praat error -- unable to locate .pfmt file')
+    params = _formant_params(frame_shift, window_size, num_formants,
+                             max_formant_freq)
+    # Use the result of an earlier prefetch_praat_formants, if there is one
+    prefetched = _prefetched.pop(('formants', os.path.abspath(wav_fn),
+                                  praat_path, params), None)
+    if prefetched is not None:
+        return prefetched
+
+    # Run Praat formants script, which writes its output to a scratch
+    # directory
+    estimates_raw = _run_batch('praatformants_batch.praat', [wav_fn],
+                               praat_path, params,
+                               lambda fn: _read_formants_file(fn, num_formants),
+                               '.pfmt')[0]
+
+    return estimates_raw
+
+def _formant_params(frame_shift, window_size, num_formants, max_formant_freq):
+    """Return the Praat formants script arguments following the file arguments"""
+    params = [str(frame_shift / 1000), str(window_size / 1000)]
+    params.extend([str(num_formants), str(max_formant_freq)])
+    return tuple(params)
+
+def _read_formants_file(fmt_fn, num_formants):
+    """Return the estimates in a Praat formants script output file"""
+    # Praat allows half integer values for num_formants
+    # So we round up to get total number of formant columns
+    num_cols = 2 + round_half_away_from_zero(num_formants) * 2
+    with open(fmt_fn) as f:
+        data_raw = parse_numbers(f.read(), num_cols, skiprows=1)
 
     # Put results into dictionary
     estimates_raw = {}
@@ -338,3 +332,123 @@ def praat_raw_formants(wav_fn, praat_path, frame_shift=1, window_size=25, num_fo
         estimates_raw['pB' + str(i)] = data_raw[:, 2*i+1]
 
     return estimates_raw
+
+
+# Results computed ahead of time by prefetch_praat_pitch and
+# prefetch_praat_formants, keyed by kind, absolute wav path, Praat path and
+# script parameters.  Each result is used (and dropped) by the first
+# praat_raw_pitch or praat_raw_formants call that asks for it.
+_prefetched = {}
+
+def prefetch_praat_pitch(wav_fns, praat_path, frame_shift=1, method='cc',
+                         min_pitch=40, max_pitch=500, silence_threshold=0.03,
+                         voice_threshold=0.45, octave_cost=0.01,
+                         octave_jumpcost=0.35, voiced_unvoiced_cost=0.14,
+                         kill_octave_jumps=False, interpolate=False,
+                         smooth=False, smooth_bandwidth=5):
+    """Compute raw Praat F0 for many WAV files with a single Praat run
+
+    Args:
+        wav_fns - WAV files to be processed [list of strings]
+        See praat_raw_pitch() documentation for the other arguments.
+
+    Returns:
+        The number of files for which results were computed [integer]
+
+    The results are kept until praat_raw_pitch (and so praat_pitch) is called
+    with the same file and parameters, which then returns them without
+    starting Praat again.  Files that Praat fails on are skipped, so that
+    the error is reported by the praat_raw_pitch call for that file.
+    """
+    params = _pitch_params(frame_shift, method, min_pitch, max_pitch,
+                           silence_threshold, voice_threshold, octave_cost,
+                           octave_jumpcost, voiced_unvoiced_cost,
+                           kill_octave_jumps, interpolate, smooth,
+                           smooth_bandwidth)
+    return _prefetch('pitch', 'praatF0_batch.praat', wav_fns, praat_path,
+                     params, _read_pitch_file)
+
+def prefetch_praat_formants(wav_fns, praat_path, frame_shift=1, window_size=25,
+                            num_formants=4, max_formant_freq=6000):
+    """Compute raw Praat formants for many WAV files with a single Praat run
+
+    Args:
+        wav_fns - WAV files to be processed [list of strings]
+        See praat_raw_formants() documentation for the other arguments.
+
+    Returns:
+        The number of files for which results were computed [integer]
+
+    The results are kept until praat_raw_formants (and so praat_formants) is
+    called with the same file and parameters, see prefetch_praat_pitch.
+    """
+    params = _formant_params(frame_shift, window_size, num_formants,
+                             max_formant_freq)
+    return _prefetch('formants', 'praatformants_batch.praat', wav_fns,
+                     praat_path, params,
+                     lambda fn: _read_formants_file(fn, num_formants))
+
+def clear_praat_prefetch():
+    """Drop all prefetched Praat results that haven't been used"""
+    _prefetched.clear()
+
+def _prefetch(kind, script, wav_fns, praat_path, params, read_result):
+    try:
+        results = _run_batch(script, wav_fns, praat_path, params, read_result)
+    except OSError:
+        # Praat couldn't be started; let the per-file call report it.
+        return 0
+    count = 0
+    for wav_fn, result in zip(wav_fns, results):
+        if result is None:
+            continue
+        _prefetched[(kind, os.path.abspath(wav_fn), praat_path,
+                     params)] = result
+        count += 1
+    return count
+
+def _run_batch(script, wav_fns, praat_path, params, read_result, ext=None):
+    """Run a batch Praat script for wav_fns and return the result for each
+
+    The manifest and the result files are written to a new scratch
+    directory (see helpers.make_scratch_dir), which is removed afterwards,
+    so nothing is written next to the wav files.  If ext is None, the
+    result for a file that Praat fails on is None.  Otherwise that raises
+    an OSError, which refers to the result as an ext file (such as
+    '.pfmt').  Either way an OSError is raised if Praat can't be started.
+    """
+    tmp_dir = make_scratch_dir('opensauce-praat-')
+    try:
+        # The manifest lists each wav file followed by its result file
+        manifest_fn = os.path.join(tmp_dir, 'manifest.txt')
+        result_fns = []
+        with open(manifest_fn, 'w') as f:
+            for i, wav_fn in enumerate(wav_fns):
+                result_fn = os.path.join(tmp_dir, '{}.txt'.format(i))
+                result_fns.append(result_fn)
+                f.write(os.path.abspath(wav_fn) + '\n' + result_fn + '\n')
+
+        praat_cmd = [praat_path, '--run']
+        praat_cmd.append(os.path.join(praat_script_dir, script))
+        praat_cmd.append(manifest_fn)
+        praat_cmd.extend(params)
+        # A non-zero return code means Praat stopped at a file it couldn't
+        # handle.  The results written before that are still good.
+        return_code = call(praat_cmd)
+        if ext is not None and return_code != 0: # pragma: no cover
+            raise OSError('Praat error')
+
+        results = []
+        for result_fn in result_fns:
+            if ext is not None:
+                if not os.path.isfile(result_fn): # pragma: no cover
+                    raise OSError('Praat error -- unable to locate {} file'.format(ext))
+                results.append(read_result(result_fn))
+                continue
+            try:
+                results.append(read_result(result_fn))
+            except (IOError, OSError, ValueError):
+                results.append(None)
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
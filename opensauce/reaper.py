@@ -6,9 +6,13 @@
 from __future__ import division
 
 import os
+import shutil
 import subprocess
+import threading
 import numpy as np
 
+from opensauce.helpers import make_scratch_dir, parse_numbers
+
 
 def reaper_pitch(soundfile, data_len, use_pyreaper=True,
                  reaper_path='not-specified', frame_shift=1, max_pitch=500,
@@ -39,21 +43,27 @@ def reaper_pitch(soundfile, data_len, use_pyreaper=True,
     if soundfile.fs_rs is None:
         # Use values from original WAV file
         fs = soundfile.fs
-        wavpath = soundfile.wavpath
-        wavdata_int = soundfile.wavdata_int
     else:
         # Use values from resampled WAV file
         fs = soundfile.fs_rs
-        wavpath = soundfile.wavpath_rs
-        wavdata_int = soundfile.wavdata_rs_int
 
     if use_pyreaper:
-        # Try running reaper from pyreaper package
+        # Try running reaper from pyreaper package, which takes the
+        # (resampled) data directly
+        if soundfile.fs_rs is None:
+            wavdata_int = soundfile.wavdata_int
+        else:
+            wavdata_int = soundfile.wavdata_rs_int
         t_raw, F0_raw = pyreaper_pitch(wavdata_int, fs, frame_shift, max_pitch,
                                        min_pitch, high_pass, hilbert_transform,
                                        inter_mark)
     else:
-        # Run original Google REAPER as system call
+        # Run original Google REAPER as system call, which reads the
+        # (resampled) data from a file
+        if soundfile.fs_rs is None:
+            wavpath = soundfile.wavpath
+        else:
+            wavpath = soundfile.wavpath_rs
         t_raw, F0_raw = creaper_pitch(wavpath, reaper_path,
                                       frame_shift, max_pitch, min_pitch,
                                       high_pass, hilbert_transform, inter_mark)
@@ -124,19 +134,25 @@ def creaper_pitch(wav_fn, reaper_path, frame_shift, max_pitch, min_pitch,
         F0_times          - Times corresponding to F0 estimates [NumPy vector]
         F0                - F0 estimates [NumPy vector]
     """
-    # Output file names
-    wav_dir = os.path.dirname(wav_fn)
-    reaper_f0_fn = os.path.join(wav_dir, 'reaper-f0.txt')
-    # XXX: We aren't using the output of these files for now
-    #      But they may be useful in the future
-    reaper_pitchmarks_fn = os.path.join(wav_dir, 'reaper-pitchmarks.txt')
-    reaper_corr_fn = os.path.join(wav_dir, 'reaper-corr.txt')
+    # Output files go to a scratch directory of their own, so that any
+    # number of files, even the same one, can be processed in parallel
+    tmp_dir = make_scratch_dir('opensauce-reaper-')
+    try:
+        return _creaper_pitch(wav_fn, reaper_path, frame_shift, max_pitch,
+                              min_pitch, high_pass, hilbert_transform,
+                              inter_mark, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def _creaper_pitch(wav_fn, reaper_path, frame_shift, max_pitch, min_pitch,
+                   high_pass, hilbert_transform, inter_mark, tmp_dir):
+    # Only the F0 track is requested, REAPER skips the pitchmark and
+    # correlation outputs when they are not asked for
+    reaper_f0_fn = os.path.join(tmp_dir, 'reaper-f0.txt')
 
     # Run REAPER command
     cmd = [reaper_path, '-i', wav_fn]
     cmd.extend(['-f', reaper_f0_fn])
-    cmd.extend(['-p', reaper_pitchmarks_fn])
-    cmd.extend(['-c', reaper_corr_fn])
     if hilbert_transform:
         cmd.extend(['-t'])
     if not high_pass:
@@ -147,23 +163,65 @@ def creaper_pitch(wav_fn, reaper_path, frame_shift, max_pitch, min_pitch,
     cmd.extend(['-u', str(inter_mark / 1000.0)])
     cmd.extend(['-a'])
 
+    # Where named pipes are available, REAPER writes the F0 track into one,
+    # and it is read as it is written instead of going through a file
+    if hasattr(os, 'mkfifo'):
+        os.mkfifo(reaper_f0_fn)
+    f0_text = []
+
+    def read_f0():
+        with open(reaper_f0_fn, 'rb') as f:
+            f0_text.append(f.read())
+
     try:
-        return_code = subprocess.call(cmd, stdout=subprocess.PIPE)
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
     except OSError:
         raise OSError('Error while attempting to call REAPER.  Is REAPER path {} correct?'.format(reaper_path))
-    else:
-        if return_code != 0: # pragma: no cover
-            raise OSError('Error when trying to call REAPER')
-
-    # XXX: I think flag is 1 when the measurement is in a voiced region,
-    #      and flag is 0 when the measurement is an unvoiced region
-    F0_times, flag, F0 = np.loadtxt(reaper_f0_fn, skiprows=7, unpack=True)
+    if hasattr(os, 'mkfifo'):
+        reader = threading.Thread(target=read_f0)
+        reader.start()
+        proc.communicate()
+        while reader.is_alive():
+            # If REAPER never opened the pipe, the reader is still waiting
+            # for a writer; opening and closing the pipe ends its read.
+            try:
+                os.close(os.open(reaper_f0_fn, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            reader.join(0.1)
+    else: # pragma: no cover
+        proc.communicate()
+        if os.path.exists(reaper_f0_fn):
+            read_f0()
+    if proc.returncode != 0: # pragma: no cover
+        raise OSError('Error when trying to call REAPER')
+
+    F0_times, F0 = read_f0_track(f0_text[0] if f0_text else b'')
 
     # Replace invalid measurements with NaN
     F0[F0 < 0] = np.nan
 
-    os.remove(reaper_f0_fn)
-    os.remove(reaper_pitchmarks_fn)
-    os.remove(reaper_corr_fn)
-
     return F0_times, F0
+
+def read_f0_track(text):
+    """Return times and F0 values from the text of a REAPER ASCII F0 file
+
+    Args:
+        text     - contents of a file written by REAPER with the options
+                   -f and -a [bytes]
+
+    Returns:
+        F0_times - Times of the F0 estimates [NumPy vector]
+        F0       - F0 estimates, -1 where unvoiced [NumPy vector]
+
+    The file is an EST track: a header ending with the line EST_Header_End,
+    then one line per frame with the time, a voicing flag and the F0 value.
+    """
+    header_end = text.find(b'EST_Header_End')
+    if header_end >= 0:
+        newline = text.find(b'\n', header_end)
+        text = text[newline + 1:] if newline >= 0 else b''
+    # XXX: I think flag is 1 when the measurement is in a voiced region,
+    #      and flag is 0 when the measurement is an unvoiced region
+    values = parse_numbers(text, 3)
+    return values[:, 0], values[:, 2]
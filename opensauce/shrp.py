@@ -11,7 +11,7 @@ import numpy as np
 from scipy.fftpack import fft
 from scipy.interpolate import interp1d
 
-from opensauce.helpers import round_half_away_from_zero
+from opensauce.helpers import round_half_away_from_zero, nearest_indices
 
 # Comments in quotes are copied from the matlab source.
 
@@ -85,19 +85,15 @@ def shr_pitch(wav_data, fps, window_length=None, frame_shift=None,
     start = 0
     finish = t[-1]
     increment = frame_shift
-    for k in np.arange(start, finish, increment):
-        # "try to find the closest value"
-        dabs = np.abs(t - k)
-        inx = dabs.argmin()
-        if dabs[inx] > frame_precision * frame_shift:
-            # "no valid value found"
-            continue
-        n = int(round(k / frame_shift)) + 1
-        if n < 0 or n >= datalen:
-            continue
-        F0[n] = f0_value[inx]
-        SHR[n] = shr_value[inx]
-        # "I eventually would like to get candidates as well"
+    k = np.arange(start, finish, increment)
+    # "try to find the closest value"; frames without one within
+    # frame_precision frames have "no valid value found".
+    inx, found = nearest_indices(t, k, frame_precision * frame_shift)
+    n = np.rint(k / frame_shift).astype(int) + 1
+    valid = found & (n >= 0) & (n < datalen)
+    F0[n[valid]] = f0_value[inx[valid]]
+    SHR[n[valid]] = shr_value[inx[valid]]
+    # "I eventually would like to get candidates as well"
     return SHR, F0
 
 
@@ -134,7 +130,8 @@ def shr_pitch(wav_data, fps, window_length=None, frame_shift=None,
 # ---- shrp -----
 
 def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
-         SHR_Threshold=0.4, ceiling=1250, med_smooth=0, CHECK_VOICING=0):
+         SHR_Threshold=0.4, ceiling=1250, med_smooth=0, CHECK_VOICING=0,
+         batch=True):
     """Return pitches for list of samples using subharmonic-to-harmonic ratio.
 
     Given:
@@ -158,6 +155,11 @@ def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
         med_smooth      the order of the median smoothing (default: 0 - no
                             smoothing)
         CHECK_VOICING   NOT IMPLEMENTED
+        batch           if true, compute the spectra and subharmonic sums for
+                            blocks of frames at once with NumPy instead of
+                            one frame at a time (default: True).  Both modes
+                            return the same values, up to floating point
+                            rounding in SHR.
 
     Return:
 
@@ -175,91 +177,34 @@ def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
                             algorithm. You can choose to select the lower or
                             higher value based on the shr value of this frame.
     """
-    minf0, maxf0 = F0MinMax
+    plan = shr_plan(Fs, F0MinMax, frame_length, ceiling)
+    maxf0 = plan.maxf0
+    newfre = plan.newfre
     segmentduration = frame_length
 
     # "--- pre-processing input signal ---"
     # "remove DC component"
-    Y = Y - np.mean(Y)
     # "normalization"
-    Y = Y/np.max(np.abs(Y))
+    # Both are applied to the samples of each frame as the frames are cut
+    # out (see Frames), which gives the same values without a normalized
+    # copy of the whole signal.
+    offset = np.mean(Y)
+    scale = max(np.max(np.abs(Y[start:start+normalize_block_samples] - offset))
+                for start in range(0, len(Y), normalize_block_samples))
     total_len = len(Y)
-    # "--- specify some algorithm-specific thresholds ---"
-    # "for FFT length"
-    interpolation_depth = 0.5
-    # "--- derived thresholds specific to the algorithm ---"
-    maxlogf = np.log2(maxf0 / 2)
-    # "the search region to compute SHR is as low as 0.5 minf0"
-    minlogf = np.log2(minf0 / 2)
-    # "maximum number harmonics"
-    N = int(np.floor(ceiling / minf0))
-    m = int(N % 2)
-    N = N - m
-    # "In fact, in most cases we don't need to multiply N by 4 and get equally
-    # good results yet much faster."
-    N = N * 4
     # "derive how many frames we have based on segment length and timestep."
-    segmentlen = int(np.around(segmentduration * (Fs / 1000)))
+    segmentlen = plan.segmentlen
     inc = int(np.around(timestep * (Fs / 1000)))
     nf = int(np.fix((total_len - segmentlen + inc) / inc))
     n = np.arange(nf)
     # "anchor time for each frame, the middle point"
     f0_time = np.transpose((n * timestep + segmentduration/2))
     # f0_time = np.transpose(((n - 1) * timestep)) # anchor starting from zero
-    # "--- determine FFT length ---"
-    fftlen = 1
-    while fftlen < segmentlen * (1 + interpolation_depth):
-        fftlen = fftlen * 2
-    # "--- derive linear and log frequency scale ---"
-    # "we ignore frequency 0 here since we need to do log transformation later
-    # and won't use it anyway."
-    frequency = Fs * np.arange(1, fftlen/2+1) / fftlen
-    limit = np.where(frequency >= ceiling)[0][0]
-    frequency = frequency[0:limit+1]
-    logf = np.log2(frequency)
-    # "clear some variables to save memory"
-    del frequency
-    # "the minimum distance between two points after interpolation"
-    min_bin = logf[-1] - logf[-2]
-    # "shift distance"
-    shift = np.log2(N)
-    # "the number of unit on the log x-axis"
-    shift_units = int(np.around(shift/min_bin))
-    i = np.arange(2, N+1)
-    # "--- the followings are universal for all the frames ---"
-    # "find out all the start position of each shift"
-    startpos = shift_units + 1 - np.around(np.log2(i) / min_bin).astype(int)
-    # "find out those positions that are less than 1"
-    index = np.where(startpos < 1)[0]
-    # set them to 1 since the array index starts from 1 in matlab"
-    startpos[index] = 1
-    # Correct for the fact that python is 0 origined, not 1.
-    # XXX: I wonder if keeping the zeros and not doing this subtraction
-    # would actually be more accurate.  Probably makes no real difference.
-    startpos = startpos - 1
-    interp_logf = np.arange(logf[0], logf[-1], min_bin)
-    # "new length of the amplitude spectrum after interpolation"
-    interp_len = len(interp_logf)
-    totallen = shift_units + interp_len
-    endpos = startpos + interp_len - 1
-    index = np.where(endpos >= totallen)[0]
-    # "make sure all the end positions not greater than the total length of
-    # the shift spectrum"
-    endpos[index] = totallen - 1
-    # "the linear Hz scale derived from the interpolated log scale"
-    newfre = np.power(2, interp_logf)
-    # "find out the index of upper bound of search region on the log frequency
-    # scale."
-    upperbound = np.where(interp_logf >= maxlogf)[0][0]
-    # "find out the index of lower bound of search region on the log frequency
-    # scale."
-    lowerbound = np.where(interp_logf >= minlogf)[0][0]
     # "--- segmentation of speech ---"
     # "position for each frame in terms of index, not time"
     curpos = np.around(f0_time / 1000 * Fs).astype(int) - 1
-    frames = toframes(Y, curpos, segmentlen, 'hamm')
+    frames = Frames(Y, curpos, segmentlen, 'hamm', offset, scale)
     nf, framelen = frames.shape
-    del Y
     # "--- initialize vectors for f0 time, f0 values, and SHR ---"
     f0_value = np.zeros(nf)
     SHR = np.zeros(nf)
@@ -277,28 +222,13 @@ def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
     cur_SHR = 0
     cur_cand1 = 0
     cur_cand2 = 0
-    for n in range(nf):
-        segment = frames[n, :]
+    peaks = _frame_peaks(frames, plan, batch, SHR_Threshold)
+    for n, (peak_index, shr, all_peak_indices) in enumerate(peaks):
         if voicing[n] == 0:
             curf0 = 0
             cur_SHR = 0
         else:
-            log_spectrum = get_log_spectrum(
-                segment,
-                fftlen,
-                limit,
-                logf,
-                interp_logf)
-            peak_index, cur_SHR, shshift, all_peak_indices = compute_shr(
-                log_spectrum,
-                min_bin,
-                startpos,
-                endpos,
-                lowerbound,
-                upperbound,
-                N,
-                shift_units,
-                SHR_Threshold)
+            cur_SHR = shr
             # "-1 indicates a possibly unvoiced frame, if CHECK_VOICING, set f0
             # to 0, otherwise uses previous value"
             if peak_index == -1:
@@ -338,6 +268,155 @@ def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
     return f0_time, f0_value, SHR, f0_candidates
 
 
+class ShrPlan(object):
+    """The frame-independent part of the SHRP analysis for one parameter set.
+
+    Everything here depends only on Fs, F0MinMax, frame_length and ceiling,
+    so a plan can be shared by every frame of every file analyzed with the
+    same settings (see shr_plan).  The attributes are the variables of the
+    same names in the matlab source.  In addition, sum_matrix maps a log
+    spectrum to the odd minus even sums of its shifted copies, so the shift
+    matrix of compute_shr reduces to a single matrix product per frame.
+
+    """
+
+    def __init__(self, Fs, F0MinMax, frame_length, ceiling):
+        minf0, maxf0 = F0MinMax
+        self.minf0, self.maxf0 = minf0, maxf0
+        # "--- specify some algorithm-specific thresholds ---"
+        # "for FFT length"
+        interpolation_depth = 0.5
+        # "--- derived thresholds specific to the algorithm ---"
+        maxlogf = np.log2(maxf0 / 2)
+        # "the search region to compute SHR is as low as 0.5 minf0"
+        minlogf = np.log2(minf0 / 2)
+        # "maximum number harmonics"
+        N = int(np.floor(ceiling / minf0))
+        m = int(N % 2)
+        N = N - m
+        # "In fact, in most cases we don't need to multiply N by 4 and get
+        # equally good results yet much faster."
+        N = N * 4
+        self.N = N
+        self.segmentlen = int(np.around(frame_length * (Fs / 1000)))
+        # "--- determine FFT length ---"
+        fftlen = 1
+        while fftlen < self.segmentlen * (1 + interpolation_depth):
+            fftlen = fftlen * 2
+        self.fftlen = fftlen
+        # "--- derive linear and log frequency scale ---"
+        # "we ignore frequency 0 here since we need to do log transformation
+        # later and won't use it anyway."
+        frequency = Fs * np.arange(1, fftlen/2+1) / fftlen
+        self.limit = limit = np.where(frequency >= ceiling)[0][0]
+        frequency = frequency[0:limit+1]
+        self.logf = logf = np.log2(frequency)
+        # "the minimum distance between two points after interpolation"
+        self.min_bin = min_bin = logf[-1] - logf[-2]
+        # "shift distance"
+        shift = np.log2(N)
+        # "the number of unit on the log x-axis"
+        self.shift_units = shift_units = int(np.around(shift/min_bin))
+        i = np.arange(2, N+1)
+        # "--- the followings are universal for all the frames ---"
+        # "find out all the start position of each shift"
+        startpos = shift_units + 1 - np.around(np.log2(i) / min_bin).astype(int)
+        # "find out those positions that are less than 1"
+        index = np.where(startpos < 1)[0]
+        # set them to 1 since the array index starts from 1 in matlab"
+        startpos[index] = 1
+        # Correct for the fact that python is 0 origined, not 1.
+        # XXX: I wonder if keeping the zeros and not doing this subtraction
+        # would actually be more accurate.  Probably makes no real difference.
+        startpos = startpos - 1
+        self.interp_logf = interp_logf = np.arange(logf[0], logf[-1], min_bin)
+        # "new length of the amplitude spectrum after interpolation"
+        interp_len = len(interp_logf)
+        totallen = shift_units + interp_len
+        endpos = startpos + interp_len - 1
+        index = np.where(endpos >= totallen)[0]
+        # "make sure all the end positions not greater than the total length of
+        # the shift spectrum"
+        endpos[index] = totallen - 1
+        self.startpos, self.endpos = startpos, endpos
+        # "the linear Hz scale derived from the interpolated log scale"
+        self.newfre = np.power(2, interp_logf)
+        # "find out the index of upper bound of search region on the log
+        # frequency scale."
+        self.upperbound = np.where(interp_logf >= maxlogf)[0][0]
+        # "find out the index of lower bound of search region on the log
+        # frequency scale."
+        self.lowerbound = np.where(interp_logf >= minlogf)[0][0]
+        # compute_shr_differences is linear in the spectra, so running it on
+        # the identity gives the matrix that does the whole shift-and-sum.
+        self.sum_matrix = compute_shr_differences(
+            np.eye(interp_len), startpos, endpos, N, shift_units)
+
+    def log_spectra(self, frames):
+        """Return the interpolated log spectrum of each row of frames."""
+        return get_log_spectra(frames, self.fftlen, self.limit, self.logf,
+                               self.interp_logf)
+
+    def differences(self, log_spectra):
+        """Return the odd minus even subharmonic sums of log_spectra.
+
+        log_spectra may be a single spectrum or a 2-D array with one spectrum
+        per row.
+
+        """
+        return np.dot(log_spectra, self.sum_matrix)
+
+    def pick_peak(self, difference, shr_threshold):
+        """Return pick_shr_peak(difference, ...) using this plan's bounds."""
+        return pick_shr_peak(difference, self.lowerbound, self.upperbound,
+                             self.min_bin, shr_threshold)
+
+
+_shr_plans = {}
+
+
+def shr_plan(Fs, F0MinMax, frame_length, ceiling):
+    """Return the (cached) ShrPlan for the given analysis parameters."""
+    key = (Fs, tuple(F0MinMax), frame_length, ceiling)
+    plan = _shr_plans.get(key)
+    if plan is None:
+        plan = _shr_plans[key] = ShrPlan(Fs, F0MinMax, frame_length, ceiling)
+    return plan
+
+
+# Number of samples normalized at a time by shrp.
+normalize_block_samples = 1 << 20
+
+# Number of frames whose spectra are held in memory at once in batch mode.
+# Larger blocks amortize more Python overhead but need fftlen complex values
+# per frame.
+batch_block_frames = 1024
+
+
+def _frame_peaks(frames, plan, batch, shr_threshold):
+    """Yield (peak_index, shr, all_peak_indices) for each row of frames.
+
+    When batch is false each frame's spectrum is computed by get_log_spectrum
+    as in the matlab source.  Otherwise the spectra are computed for a block
+    of frames at a time.  Either way the shifted odd/even sums come from the
+    plan's summation matrix, and only the (cheap) peak picking is done frame
+    by frame.
+
+    """
+    if not batch:
+        for segment in frames:
+            log_spectrum = get_log_spectrum(segment, plan.fftlen, plan.limit,
+                                            plan.logf, plan.interp_logf)
+            yield plan.pick_peak(plan.differences(log_spectrum),
+                                 shr_threshold)
+        return
+    for block_start in range(0, frames.shape[0], batch_block_frames):
+        block = frames[block_start:block_start+batch_block_frames]
+        differences = plan.differences(plan.log_spectra(block))
+        for difference in differences:
+            yield plan.pick_peak(difference, shr_threshold)
+
+
 # ---- GetLogSpectrum -----
 
 def get_log_spectrum(segment, fftlen, limit, logf, interp_logf):
@@ -351,6 +430,20 @@ def get_log_spectrum(segment, fftlen, limit, logf, interp_logf):
     return interp_amplitude
 
 
+def get_log_spectra(frames, fftlen, limit, logf, interp_logf):
+    """Return get_log_spectrum for every row of frames as a 2-D array."""
+    spectra = fft(frames, fftlen, axis=1)
+    # "ignore the zero frequency component"
+    amplitude = np.abs(spectra[:, 1:limit+2])
+    # Linear interpolation onto the log frequency scale, done the same way
+    # interp1d does it, but with the bracketing indices shared by all rows.
+    hi = np.searchsorted(logf, interp_logf).clip(1, len(logf)-1)
+    lo = hi - 1
+    slope = (amplitude[:, hi] - amplitude[:, lo]) / (logf[hi] - logf[lo])
+    interp_amplitude = slope * (interp_logf - logf[lo]) + amplitude[:, lo]
+    return interp_amplitude - interp_amplitude.min(axis=1)[:, np.newaxis]
+
+
 # ---- ComputeSHR -----
 
 def compute_shr(log_spectrum, min_bin, startpos, endpos, lowerbound, upperbound,
@@ -379,6 +472,43 @@ def compute_shr(log_spectrum, min_bin, startpos, endpos, lowerbound, upperbound,
     shseven = sum(shshift[0:n:2, :], 0)
     shsodd = sum(shshift[1:n-1:2, :], 0)
     difference = shsodd - shseven
+    peak_index, shr, index = pick_shr_peak(difference, lowerbound, upperbound,
+                                           min_bin, shr_threshold)
+    return peak_index, shr, shshift, index
+
+
+def compute_shr_differences(log_spectra, startpos, endpos, n, shift_units):
+    """Return the odd minus even subharmonic sums for each row of log_spectra.
+
+    This is the part of compute_shr that builds and sums the shift matrix,
+    done for many frames at once.  Instead of materializing the shift matrix,
+    each shifted copy of the spectra is added straight into the odd or even
+    accumulator, in the same order the rows of shshift are summed.  ShrPlan
+    uses it to build its summation matrix.
+    """
+    shseven = np.zeros(log_spectra.shape)
+    shsodd = np.zeros(log_spectra.shape)
+    # "the first row in shshift is the original log spectrum"
+    shseven += log_spectra
+    for i in range(1, n-1):
+        # Column range of this shift after dropping the first shift_units
+        # columns of shshift.
+        start = max(startpos[i-1], shift_units)
+        end = endpos[i-1] + 1
+        if end <= start:
+            continue
+        offset = start - startpos[i-1]
+        acc = shseven if i % 2 == 0 else shsodd
+        acc[:, start-shift_units:end-shift_units] += (
+            log_spectra[:, offset:offset+end-start])
+    return shsodd - shseven
+
+
+def pick_shr_peak(difference, lowerbound, upperbound, min_bin, shr_threshold):
+    """Return (peak_index, shr, index) for one odd/even sum difference.
+
+       returns peak_index = -1 if frame appears to be unvoiced.
+    """
     # "peak picking process"
     shr = 0
     # "only find two maxima"
@@ -392,7 +522,7 @@ def compute_shr(log_spectrum, min_bin, startpos, endpos, lowerbound, upperbound,
         if mag <= 0:
             # "this must be an unvoiced frame"
             peak_index = -1
-            return peak_index, shr, shshift, index
+            return peak_index, shr, index
         peak_index = index
         shr = 0
     else:
@@ -403,7 +533,7 @@ def compute_shr(log_spectrum, min_bin, startpos, endpos, lowerbound, upperbound,
         else:
             # "subharmonic is strong, so favor the subharmonic as F0"
             peak_index = index[0]
-    return peak_index, shr, shshift, index
+    return peak_index, shr, index
 
 
 # ---- twomax -----
@@ -462,8 +592,13 @@ def ethreshold(frames):
 # ---- toframes ----
 
 def toframes(samples, curpos, segmentlen, window_type):
-    last_index = len(samples) - 1
-    num_frames = len(curpos)
+    frames = samples[_frame_indices(len(samples), curpos, segmentlen)]
+    return np.multiply(frames, window(segmentlen, window_type))
+
+
+def _frame_indices(total_len, curpos, segmentlen):
+    # The indices of the samples in each frame, one frame per row
+    last_index = total_len - 1
     start = curpos - int(round(segmentlen/2))
     offset = np.arange(segmentlen)
     index_start = np.nonzero(start < 1)[0]
@@ -472,10 +607,45 @@ def toframes(samples, curpos, segmentlen, window_type):
     index = np.nonzero(endpos > last_index)[0]
     endpos[index] = last_index
     start[index] = last_index + 1 - segmentlen
-    frames = samples[(np.tile(np.expand_dims(start, 1),
-                     (1, segmentlen)) + np.tile(offset, (num_frames, 1)))]
-    window_vector = np.tile(window(segmentlen, window_type), (num_frames, 1))
-    return np.multiply(frames, window_vector)
+    return start[:, None] + offset
+
+
+class Frames(object):
+    """The frames of toframes((samples - offset) / scale, ...), made on demand
+
+    Slicing returns the 2-D array of the frames in the slice, and iterating
+    yields the frames one at a time, so only the frames in use are held in
+    memory.  samples can be anything that NumPy fancy indexing works on,
+    such as a helpers.ScaledSamples view of memory-mapped wav data.
+    """
+
+    def __init__(self, samples, curpos, segmentlen, window_type, offset=0,
+                 scale=1):
+        self.samples = samples
+        self.curpos = np.asarray(curpos)
+        self.offset = offset
+        self.scale = scale
+        self.shape = (len(self.curpos), segmentlen)
+        self.window_vector = window(segmentlen, window_type)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        curpos = self.curpos[key]
+        indices = _frame_indices(len(self.samples), curpos, self.shape[1])
+        if isinstance(self.samples, np.ndarray):
+            # Much faster than fancy indexing with the 2-D indices
+            frames = np.take(self.samples, indices)
+        else:
+            frames = self.samples[indices]
+        frames = (frames - self.offset) / self.scale
+        return np.multiply(frames, self.window_vector)
+
+    def __iter__(self):
+        for start in range(0, len(self), batch_block_frames):
+            for frame in self[start:start+batch_block_frames]:
+                yield frame
 
 
 # ---- voicing ----
@@ -15,15 +15,24 @@ Snack can be called in several ways:
 from __future__ import division
 
 from sys import platform
-from subprocess import call
+from subprocess import call, Popen, PIPE
 
 from conf.userconf import user_snack_lib_path
 
+from opensauce.helpers import make_scratch_dir, parse_numbers
+
 import os
 import sys
 import inspect
+import shutil
+import threading
 import numpy as np
 
+try:
+    import queue
+except ImportError: # pragma: no cover
+    import Queue as queue
+
 import logging
 log = logging.getLogger('opensauce.snack')
 
@@ -138,25 +147,34 @@ def snack_raw_pitch_exe(wav_fn, frame_shift, window_size, max_pitch, min_pitch):
          raise ValueError("Cannot use 'exe' as Snack calling method on non-Windows machine")
     # Call Snack using system command to run standalone executable
     exe_path = os.path.join(os.path.dirname(__file__), 'Windows', 'snack.exe')
-    snack_cmd = [exe_path, 'pitch', wav_fn, '-method', 'esps']
-    snack_cmd.extend(['-framelength', str(frame_shift / 1000)])
-    snack_cmd.extend(['-windowlength', str(window_size / 1000)])
-    snack_cmd.extend(['-maxpitch', str(max_pitch)])
-    snack_cmd.extend(['-minpitch', str(min_pitch)])
-    return_code = call(snack_cmd)
-
-    if return_code != 0:
-        raise OSError('snack.exe error')
-
-    # Path for f0 file corresponding to wav_fn
-    f0_fn = wav_fn.split('.')[0] + '.f0'
-    # Load data from f0 file
-    if os.path.isfile(f0_fn):
-        F0_raw, V_raw = np.loadtxt(f0_fn, dtype=float, usecols=(0,1), unpack=True)
-        # Cleanup and remove f0 file
-        os.remove(f0_fn)
-    else:
-        raise OSError('snack.exe error -- unable to locate .f0 file')
+    # snack.exe writes its output next to the wav file, so give it a copy
+    # of the wav file in a scratch directory.
+    tmp_dir = make_scratch_dir('opensauce-snack-')
+    try:
+        tmp_wav_fn = os.path.join(tmp_dir, 'sound.wav')
+        shutil.copyfile(wav_fn, tmp_wav_fn)
+        snack_cmd = [exe_path, 'pitch', tmp_wav_fn, '-method', 'esps']
+        snack_cmd.extend(['-framelength', str(frame_shift / 1000)])
+        snack_cmd.extend(['-windowlength', str(window_size / 1000)])
+        snack_cmd.extend(['-maxpitch', str(max_pitch)])
+        snack_cmd.extend(['-minpitch', str(min_pitch)])
+        return_code = call(snack_cmd)
+
+        if return_code != 0:
+            raise OSError('snack.exe error')
+
+        # Path for f0 file corresponding to the wav file
+        f0_fn = os.path.join(tmp_dir, 'sound.f0')
+        # Load data from f0 file
+        if os.path.isfile(f0_fn):
+            with open(f0_fn) as f:
+                data = parse_numbers(f.read(), None)
+            F0_raw, V_raw = data[:, 0], data[:, 1]
+        else:
+            raise OSError('snack.exe error -- unable to locate .f0 file')
+    finally:
+        # Cleanup and remove the copy and the f0 file
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
     return F0_raw, V_raw
 
@@ -170,54 +188,11 @@ def snack_raw_pitch_python(wav_fn, frame_shift, window_size, max_pitch, min_pitc
     The vectors returned here are the raw Snack output, without padding.
     For more info, see documentation for snack_raw_pitch().
     """
-    try:
-        import tkinter
-    except ImportError:
-        try:
-            import Tkinter as tkinter
-        except ImportError: # pragma: no cover
-            print("Need Python library tkinter. Is it installed?")
-
-    # HACK: Need to replace single backslash with two backslashes,
-    #       so that the Tcl shell reads the file path correctly on Windows
-    if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
-        wav_fn = wav_fn.replace('\\', '\\\\')
-
-    # XXX I'm assuming Hz for pitch; the docs don't actually say that.
-    # http://www.speech.kth.se/snack/man/snack2.2/tcl-man.html#spitch
-    tcl = tkinter.Tcl()
-    try:
-        # XXX This will trigger a message 'cannot open /dev/mixer' on the
-        # console if you don't have a /dev/mixer.  You don't *need* a mixer to
-        # snack the way we are using it, but there's no practical way to
-        # suppress the message without modifying the snack source.  Fortunately
-        # most people running opensauce will in fact have a /dev/mixer.
-        tcl.eval('package require snack')
-    except tkinter.TclError as err: # pragma: no cover
-        log.critical('Cannot load snack (is it installed?): %s', err)
+    session = snack_session()
+    if session is None: # pragma: no cover
         return
-    tcl.eval('snack::sound s')
-    tcl.eval('s read {}'.format(wav_fn))
-    cmd = ['s pitch -method esps']
-    cmd.extend(['-framelength {}'.format(frame_shift / 1000)])
-    cmd.extend(['-windowlength {}'.format(window_size / 1000)])
-    cmd.extend(['-maxpitch {}'.format(max_pitch)])
-    cmd.extend(['-minpitch {}'.format(min_pitch)])
-    # Run Snack pitch command
-    tcl.eval('set data [{}]'.format(' '.join(cmd)))
-    # XXX check for errors here and log and abort if there is one.  Result
-    # string will start with ERROR:.
-    # Collect results and save in return variables
-    num_frames = int(tcl.eval('llength $data'))
-    F0_raw = np.empty(num_frames)
-    V_raw = np.empty(num_frames)
-    # snack returns four values per frame, we only care about the first two.
-    for i in range(num_frames):
-        values = tcl.eval('lindex $data ' + str(i)).split()
-        F0_raw[i] = np.float_(values[0])
-        V_raw[i] = np.float_(values[1])
-
-    return F0_raw, V_raw
+    return session.pitch(wav_fn, frame_shift, window_size, max_pitch,
+                         min_pitch)
 
 def snack_raw_pitch_tcl(wav_fn, frame_shift, window_size, max_pitch, min_pitch, tcl_shell_cmd):
     """Implement snack_raw_pitch() by calling Snack through Tcl shell
@@ -228,71 +203,22 @@ def snack_raw_pitch_tcl(wav_fn, frame_shift, window_size, max_pitch, min_pitch,
     The vectors returned here are the raw Snack output, without padding.
     For more info, see documentation for snack_raw_pitch().
     """
-    # File path for wav file provided to Tcl script
-    in_file = wav_fn
-
     # ERROR: wind_dur parameter must be between [0.0001, 0.1].
     # ERROR: frame_step parameter must be between [1/sampling rate, 0.1].
     # invalid/inconsistent parameters -- exiting.
-
-    # HACK: Tcl shell expects double backslashes in Windows path
-    if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
-        in_file = in_file.replace('\\', '\\\\')
-
-    # Name of the file containing the Tcl script
-    tcl_file = os.path.join(os.path.dirname(wav_fn), 'tclforsnackpitch.tcl')
-
-    # Write Tcl script which will call Snack pitch calculation
-    f = open(tcl_file, 'w')
-    script = "#!/usr/bin/env bash\n"
-    script += '# the next line restarts with tclsh \\\n'
-    script += 'exec {} "$0" "$@"\n\n'.format(tcl_shell_cmd)
-    # HACK: The variable user_snack_lib_path is a hack we use in continous
-    #       integration testing. The reason is that we may not have the
-    #       permissions to copy the Snack library to the standard Tcl library
-    #       location. This is a workaround to load the Snack library from a
-    #       different location, where the location is given by
-    #       user_snack_lib_path.
-    if user_snack_lib_path is not None:
-        script += 'pkg_mkIndex {} snack.tcl libsnack.dylib libsound.dylib\n'.format(user_snack_lib_path)
-        script += 'lappend auto_path {}\n\n'.format(user_snack_lib_path)
-    script += 'package require snack\n\n'
-    script += 'snack::sound s\n\n'
-    script += 's read {}\n\n'.format(in_file)
-    script += 'set fd [open [file rootname {}].f0 w]\n'.format(in_file)
-    script += 'puts $fd [join [s pitch -method esps -framelength {} -windowlength {} -maxpitch {} -minpitch {}]\n\n]\n'.format(frame_shift / 1000, window_size / 1000, max_pitch, min_pitch)
-    script += 'close $fd\n\n'
-    script += 'exit'
-    f.write(script)
-    f.close()
-
-    # Run the Tcl script
+    options = _pitch_options(frame_shift, window_size, max_pitch, min_pitch)
+    # Use the result of an earlier prefetch_snack_tcl, if there is one
+    key = ('pitch', os.path.abspath(wav_fn), tcl_shell_cmd, options)
+    if key not in _prefetched:
+        _run_tcl_batch([wav_fn], tcl_shell_cmd, pitch_options=options)
     try:
-        return_code = call([tcl_shell_cmd, tcl_file])
-    except OSError:
-        os.remove(tcl_file)
-        raise OSError('Error while attempting to call Snack via Tcl shell.  Is Tcl shell command {} correct?'.format(tcl_shell_cmd))
-    else:
-        if return_code != 0: # pragma: no cover
-            os.remove(tcl_file)
-            raise OSError('Error when trying to call Snack via Tcl shell script.')
+        return _prefetched.pop(key)
+    except KeyError:
+        raise OSError('Snack Tcl shell error -- no pitch results for {}'.format(wav_fn))
 
-    # Load results from the f0 file output by the Tcl script
-    # And save into return variables
-    f0_file = os.path.splitext(wav_fn)[0] + '.f0'
-    if os.path.isfile(f0_file):
-        data = np.loadtxt(f0_file, dtype=float).reshape((-1,4))
-        F0_raw = data[:, 0]
-        V_raw = data[:, 1]
-        # Cleanup and remove f0 file
-        os.remove(f0_file)
-    else: # pragma: no cover
-        raise OSError('Snack Tcl shell error -- unable to locate .f0 file')
-
-    # Cleanup and remove Tcl script file
-    os.remove(tcl_file)
-
-    return F0_raw, V_raw
+def _pitch_options(frame_shift, window_size, max_pitch, min_pitch):
+    """Return the options of the Snack pitch command"""
+    return '-method esps -framelength {} -windowlength {} -maxpitch {} -minpitch {}'.format(frame_shift / 1000, window_size / 1000, max_pitch, min_pitch)
 
 def snack_formants(wav_fn, method, data_len, frame_shift=1,
                    window_size=25, pre_emphasis=0.96, lpc_order=12,
@@ -405,28 +331,36 @@ def snack_raw_formants_exe(wav_fn, frame_shift, window_size, pre_emphasis, lpc_o
          raise ValueError("Cannot use 'exe' as Snack calling method on non-Windows machine")
     # Call Snack using system command to run standalone executable
     exe_path = os.path.join(os.path.dirname(__file__), 'Windows', 'snack.exe')
-    snack_cmd = [exe_path, 'formant', wav_fn]
-    snack_cmd.extend(['-windowlength', str(window_size / 1000)])
-    snack_cmd.extend(['-framelength', str(frame_shift / 1000)])
-    snack_cmd.extend(['-windowtype', 'Hamming'])
-    snack_cmd.extend(['-lpctype', '0'])
-    snack_cmd.extend(['-preemphasisfactor', str(pre_emphasis)])
-    snack_cmd.extend(['-ds_freq', '10000'])
-    snack_cmd.extend(['-lpcorder', str(lpc_order)])
-    return_code = call(snack_cmd)
-
-    if return_code != 0:
-        raise OSError('snack.exe error')
-
-    # Path for frm file corresponding to wav_fn
-    frm_fn = wav_fn.split('.')[0] + '.frm'
-    # Load data from frm file
-    if os.path.isfile(frm_fn):
-        frm_results = np.loadtxt(frm_fn, dtype=float)
-        # Cleanup and remove frm file
-        os.remove(frm_fn)
-    else:
-        raise OSError('snack.exe error -- unable to locate .frm file')
+    # snack.exe writes its output next to the wav file, so give it a copy
+    # of the wav file in a scratch directory.
+    tmp_dir = make_scratch_dir('opensauce-snack-')
+    try:
+        tmp_wav_fn = os.path.join(tmp_dir, 'sound.wav')
+        shutil.copyfile(wav_fn, tmp_wav_fn)
+        snack_cmd = [exe_path, 'formant', tmp_wav_fn]
+        snack_cmd.extend(['-windowlength', str(window_size / 1000)])
+        snack_cmd.extend(['-framelength', str(frame_shift / 1000)])
+        snack_cmd.extend(['-windowtype', 'Hamming'])
+        snack_cmd.extend(['-lpctype', '0'])
+        snack_cmd.extend(['-preemphasisfactor', str(pre_emphasis)])
+        snack_cmd.extend(['-ds_freq', '10000'])
+        snack_cmd.extend(['-lpcorder', str(lpc_order)])
+        return_code = call(snack_cmd)
+
+        if return_code != 0:
+            raise OSError('snack.exe error')
+
+        # Path for frm file corresponding to the wav file
+        frm_fn = os.path.join(tmp_dir, 'sound.frm')
+        # Load data from frm file
+        if os.path.isfile(frm_fn):
+            with open(frm_fn) as f:
+                frm_results = parse_numbers(f.read(), None)
+        else:
+            raise OSError('snack.exe error -- unable to locate .frm file')
+    finally:
+        # Cleanup and remove the copy and the frm file
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
     # Save data into dictionary
     num_cols = frm_results.shape[1]
@@ -446,58 +380,11 @@ def snack_raw_formants_python(wav_fn, frame_shift, window_size, pre_emphasis, lp
     The vectors returned here are the raw Snack output, without padding.
     For more info, see documentation for snack_raw_formants().
     """
-    try:
-        import tkinter
-    except ImportError:
-        try:
-            import Tkinter as tkinter
-        except ImportError: # pragma: no cover
-            print("Need Python library tkinter. Is it installed?")
-
-    # HACK: Need to replace single backslash with two backslashes,
-    #       so that the Tcl shell reads the file path correctly on Windows
-    if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
-        wav_fn = wav_fn.replace('\\', '\\\\')
-
-    # XXX I'm assuming Hz for pitch; the docs don't actually say that.
-    # http://www.speech.kth.se/snack/man/snack2.2/tcl-man.html#spitch
-    tcl = tkinter.Tcl()
-    try:
-        # XXX This will trigger a message 'cannot open /dev/mixer' on the
-        # console if you don't have a /dev/mixer.  You don't *need* a mixer to
-        # snack the way we are using it, but there's no practical way to
-        # suppress the message without modifying the snack source.  Fortunately
-        # most people running opensauce will in fact have a /dev/mixer.
-        tcl.eval('package require snack')
-    except tkinter.TclError as err: # pragma: no cover
-        log.critical('Cannot load snack (is it installed?): %s', err)
+    session = snack_session()
+    if session is None: # pragma: no cover
         return
-    tcl.eval('snack::sound s')
-    tcl.eval('s read {}'.format(wav_fn))
-    cmd = ['s formant']
-    cmd.extend(['-windowlength {}'.format(window_size / 1000)])
-    cmd.extend(['-framelength {}'.format(frame_shift / 1000)])
-    cmd.extend(['-windowtype Hamming'])
-    cmd.extend(['-lpctype 0'])
-    cmd.extend(['-preemphasisfactor {}'.format(pre_emphasis)])
-    cmd.extend(['-ds_freq 10000'])
-    cmd.extend(['-lpcorder {}'.format(lpc_order)])
-    # Run Snack formant command
-    tcl.eval('set data [{}]'.format(' '.join(cmd)))
-    # XXX check for errors here and log and abort if there is one.  Result
-    # string will start with ERROR:.
-    # Collect results in dictionary
-    num_frames = int(tcl.eval('llength $data'))
-    num_cols = len(sformant_names)
-    estimates_raw = {}
-    for n in sformant_names:
-        estimates_raw[n] = np.empty(num_frames)
-    for i in range(num_frames):
-        values = tcl.eval('lindex $data ' + str(i)).split()
-        for j in range(num_cols):
-            estimates_raw[sformant_names[j]][i] = np.float_(values[j])
-
-    return estimates_raw
+    return session.formants(wav_fn, frame_shift, window_size, pre_emphasis,
+                            lpc_order)
 
 def snack_raw_formants_tcl(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order, tcl_shell_cmd):
     """Implement snack_formants() by calling Snack through Tcl shell
@@ -509,68 +396,322 @@ def snack_raw_formants_tcl(wav_fn, frame_shift, window_size, pre_emphasis, lpc_o
     The vectors returned here are the raw Snack output, without padding.
     For more info, see documentation for snack_raw_formants().
     """
-    # File path for wav file provided to Tcl script
-    in_file = wav_fn
-
     # ERROR: wind_dur parameter must be between [0.0001, 0.1].
     # ERROR: frame_step parameter must be between [1/sampling rate, 0.1].
     # invalid/inconsistent parameters -- exiting.
+    options = _formant_options(frame_shift, window_size, pre_emphasis,
+                               lpc_order)
+    # Use the result of an earlier prefetch_snack_tcl, if there is one
+    key = ('formants', os.path.abspath(wav_fn), tcl_shell_cmd, options)
+    if key not in _prefetched:
+        _run_tcl_batch([wav_fn], tcl_shell_cmd, formant_options=options)
+    try:
+        return _prefetched.pop(key)
+    except KeyError:
+        raise OSError('Snack Tcl shell error -- no formant results for {}'.format(wav_fn))
+
+def _formant_options(frame_shift, window_size, pre_emphasis, lpc_order):
+    """Return the options of the Snack formant command"""
+    return '-windowlength {} -framelength {} -windowtype Hamming -lpctype 0 -preemphasisfactor {} -ds_freq 10000 -lpcorder {}'.format(window_size / 1000, frame_shift / 1000, pre_emphasis, lpc_order)
+
+
+# Results computed by the Tcl shell, either ahead of time by
+# prefetch_snack_tcl or for a single snack_raw_pitch_tcl or
+# snack_raw_formants_tcl call.  They are keyed by kind, absolute wav path,
+# Tcl shell command and Snack command options, and each result is used (and
+# dropped) by the first call that asks for it.
+_prefetched = {}
 
-    # HACK: Tcl shell expects double backslashes in Windows path
-    if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
-        in_file = in_file.replace('\\', '\\\\')
-
-    tcl_file = os.path.join(os.path.dirname(wav_fn), 'tclforsnackformant.tcl')
-
-    # Write Tcl script to compute Snack formants
-    f = open(tcl_file, 'w')
-    script = "#!/usr/bin/env bash\n"
-    script += '# the next line restarts with tclsh \\\n'
-    script += 'exec {} "$0" "$@"\n\n'.format(tcl_shell_cmd)
-    # HACK: The variable user_snack_lib_path is a hack we use in continous
-    #       integration testing. The reason is that we may not have the
-    #       permissions to copy the Snack library to the standard Tcl library
-    #       location. This is a workaround to load the Snack library from a
-    #       different location, where the location is given by
-    #       user_snack_lib_path.
-    if user_snack_lib_path is not None:
-        script += 'pkg_mkIndex {} snack.tcl libsnack.dylib libsound.dylib\n'.format(user_snack_lib_path)
-        script += 'lappend auto_path {}\n\n'.format(user_snack_lib_path)
-    script += 'package require snack\n\n'
-    script += 'snack::sound s\n\n'
-    script += 's read {}\n\n'.format(in_file)
-    script += 'set fd [open [file rootname {}].frm w]\n'.format(in_file)
-    script += 'puts $fd [join [s formant -windowlength {} -framelength {} -windowtype Hamming -lpctype 0 -preemphasisfactor {} -ds_freq 10000 -lpcorder {}]\n\n]\n'.format(window_size / 1000, frame_shift / 1000, pre_emphasis, lpc_order)
-    script += 'close $fd\n\n'
-    script += 'exit'
-    f.write(script)
-    f.close()
-
-    # Run Tcl script
+def prefetch_snack_tcl(wav_fns, tcl_shell_cmd, pitch=True, formants=True,
+                       frame_shift=1, window_size=25, max_pitch=500,
+                       min_pitch=40, pre_emphasis=0.96, lpc_order=12):
+    """Compute raw Snack pitch and formants for many WAV files in one Tcl shell
+
+    Args:
+        wav_fns       - WAV files to be processed [list of strings]
+        tcl_shell_cmd - Command to run Tcl shell [string]
+        pitch         - Whether to compute pitch [Boolean]
+                        (default = True)
+        formants      - Whether to compute formants [Boolean]
+                        (default = True)
+        See snack_pitch() and snack_formants() documentation for the other
+        arguments.
+
+    Returns:
+        The number of results computed [integer]
+
+    Starting the Tcl shell and loading Snack takes longer than analyzing a
+    short sound file, so this runs a single Tcl script over all of the
+    files, which writes its results to standard output.  The results are
+    kept until snack_raw_pitch or snack_raw_formants (and so snack_pitch and
+    snack_formants) is called with method 'tcl' and the same file and
+    parameters, which then returns them without starting the Tcl shell
+    again.  Files that Snack fails on are skipped, so that the error is
+    reported by the call for that file.
+    """
+    pitch_options = formant_options = None
+    if pitch:
+        pitch_options = _pitch_options(frame_shift, window_size, max_pitch,
+                                       min_pitch)
+    if formants:
+        formant_options = _formant_options(frame_shift, window_size,
+                                           pre_emphasis, lpc_order)
     try:
-        return_code = call([tcl_shell_cmd, tcl_file])
-    except OSError: # pragma: no cover
-        os.remove(tcl_file)
-        raise OSError('Error while attempting to call Snack via Tcl shell.  Is Tcl shell command {} correct?'.format(tcl_shell_cmd))
-    else:
-        if return_code != 0: # pragma: no cover
-            os.remove(tcl_file)
+        return _run_tcl_batch(wav_fns, tcl_shell_cmd, pitch_options,
+                              formant_options, check=False)
+    except OSError:
+        # The Tcl shell couldn't be started; let the per-file call report it.
+        return 0
+
+def clear_snack_prefetch():
+    """Drop all prefetched Snack results that haven't been used"""
+    _prefetched.clear()
+
+def _run_tcl_batch(wav_fns, tcl_shell_cmd, pitch_options=None,
+                   formant_options=None, check=True):
+    """Run Snack over wav_fns in one Tcl shell and store the results
+
+    The Tcl script reads the names of the files from a manifest (so they
+    need no quoting or escaping) and prints one line per file and
+    command, holding the index of the file, the kind of result and the
+    flattened list of values.  Neither the script nor the results are
+    written to the directory of the wav files.
+
+    If check is True, raise OSError if the Tcl shell fails.  Returns the
+    number of results stored.
+    """
+    tmp_dir = make_scratch_dir('opensauce-snack-')
+    try:
+        manifest_fn = os.path.join(tmp_dir, 'manifest.txt')
+        with open(manifest_fn, 'w') as f:
+            for wav_fn in wav_fns:
+                f.write(os.path.abspath(wav_fn) + '\n')
+
+        script = ''
+        # HACK: The variable user_snack_lib_path is a hack we use in
+        #       continous integration testing. The reason is that we may
+        #       not have the permissions to copy the Snack library to the
+        #       standard Tcl library location. This is a workaround to load
+        #       the Snack library from a different location, where the
+        #       location is given by user_snack_lib_path.
+        if user_snack_lib_path is not None:
+            script += 'pkg_mkIndex {} snack.tcl libsnack.dylib libsound.dylib\n'.format(user_snack_lib_path)
+            script += 'lappend auto_path {}\n\n'.format(user_snack_lib_path)
+        script += 'package require snack\n\n'
+        script += 'snack::sound s\n\n'
+        script += 'set fd [open [lindex $argv 0] r]\n'
+        script += 'set wav_fns [split [string trimright [read $fd] \\n] \\n]\n'
+        script += 'close $fd\n\n'
+        script += 'set i 0\n'
+        script += 'foreach wav_fn $wav_fns {\n'
+        script += '    if {[catch {\n'
+        script += '        s read $wav_fn\n'
+        if pitch_options is not None:
+            script += '        puts "$i pitch [join [s pitch {}]]"\n'.format(pitch_options)
+        if formant_options is not None:
+            script += '        puts "$i formants [join [s formant {}]]"\n'.format(formant_options)
+        script += '    } err]} {\n'
+        script += '        puts stderr "$wav_fn: $err"\n'
+        script += '    }\n'
+        script += '    incr i\n'
+        script += '}\n\n'
+        script += 'exit'
+        tcl_file = os.path.join(tmp_dir, 'tclforsnack.tcl')
+        with open(tcl_file, 'w') as f:
+            f.write(script)
+
+        # Run the Tcl script, collecting results as they are printed
+        try:
+            proc = Popen([tcl_shell_cmd, tcl_file, manifest_fn], stdout=PIPE,
+                         universal_newlines=True)
+        except OSError:
+            raise OSError('Error while attempting to call Snack via Tcl shell.  Is Tcl shell command {} correct?'.format(tcl_shell_cmd))
+        count = 0
+        for line in proc.stdout:
+            fields = line.split(None, 2)
+            if len(fields) < 2:
+                continue
+            i, kind = int(fields[0]), fields[1]
+            values = fields[2] if len(fields) > 2 else ''
+            if kind == 'pitch':
+                # snack returns four values per frame, we only care about the
+                # first two.
+                data = parse_numbers(values, 4)
+                result = (data[:, 0], data[:, 1])
+                options = pitch_options
+            else:
+                data = parse_numbers(values, len(sformant_names))
+                result = {}
+                for j, n in enumerate(sformant_names):
+                    result[n] = data[:, j]
+                options = formant_options
+            _prefetched[(kind, os.path.abspath(wav_fns[i]), tcl_shell_cmd,
+                         options)] = result
+            count += 1
+        proc.stdout.close()
+        return_code = proc.wait()
+        if check and return_code != 0: # pragma: no cover
             raise OSError('Error when trying to call Snack via Tcl shell script.')
+        return count
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    # Load results from f0 file and save into return variables
-    frm_file = os.path.splitext(wav_fn)[0] + '.frm'
-    num_cols = len(sformant_names)
-    if os.path.isfile(frm_file):
-        frm_results = np.loadtxt(frm_file, dtype=float).reshape((-1, num_cols))
+def _import_tkinter():
+    try:
+        import tkinter
+    except ImportError:
+        try:
+            import Tkinter as tkinter
+        except ImportError: # pragma: no cover
+            print("Need Python library tkinter. Is it installed?")
+    return tkinter
+
+def _detached(err):
+    # A copy of the exception err that does not refer to the frames it was
+    # raised in.
+    return err.__class__(*err.args)
+
+class SnackSession(object):
+    """A Tcl interpreter with Snack loaded, for use by the 'python' method
+
+    Creating an interpreter and loading Snack is slow compared to analyzing
+    a short sound file, so snack_session() keeps one session per process.
+    The session also keeps the most recently read sound, so that computing
+    both pitch and formants for a file reads it only once.  Results are
+    fetched from Tcl as a single flattened list.
+
+    Tcl aborts the process if an interpreter is used or deleted by a thread
+    other than the one that created it, so the interpreter lives in its own
+    thread and commands from any thread are passed to it through a queue.
+    """
+
+    def __init__(self):
+        self._requests = queue.Queue()
+        # Serializes reading a sound and analyzing it
+        self._lock = threading.Lock()
+        # Identifies the sound currently read into s
+        self._loaded = None
+        ready = queue.Queue()
+        thread = threading.Thread(target=self._serve, args=(ready,))
+        thread.daemon = True
+        thread.start()
+        err = ready.get()
+        if err is not None:
+            raise err
+
+    def _serve(self, ready):
+        tcl = None
+        try:
+            tcl = _import_tkinter().Tcl()
+            # XXX This will trigger a message 'cannot open /dev/mixer' on the
+            # console if you don't have a /dev/mixer.  You don't *need* a
+            # mixer to snack the way we are using it, but there's no
+            # practical way to suppress the message without modifying the
+            # snack source.  Fortunately most people running opensauce will
+            # in fact have a /dev/mixer.
+            tcl.eval('package require snack')
+            tcl.eval('snack::sound s')
+        except Exception as err:
+            # The interpreter must be deleted here, and the error passed on
+            # without its traceback, which would keep this frame alive.
+            tcl = None
+            ready.put(_detached(err))
+            return
+        ready.put(None)
+        while True:
+            cmd, reply = self._requests.get()
+            try:
+                reply.put((tcl.eval(cmd), None))
+            except Exception as err:
+                reply.put((None, _detached(err)))
+
+    def eval(self, cmd):
+        """Evaluate the Tcl command cmd and return its result"""
+        reply = queue.Queue()
+        self._requests.put((cmd, reply))
+        result, err = reply.get()
+        if err is not None:
+            raise err
+        return result
+
+    def load(self, wav_fn):
+        """Read wav_fn into the session's sound, unless it is already there
+
+        Returns True if the file was read.
+        """
+        st = os.stat(wav_fn)
+        ident = (os.path.abspath(wav_fn), st.st_mtime, st.st_size)
+        if ident == self._loaded:
+            return False
+        # HACK: Need to replace single backslash with two backslashes,
+        #       so that the Tcl shell reads the file path correctly on Windows
+        if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
+            wav_fn = wav_fn.replace('\\', '\\\\')
+        self._loaded = None
+        self.eval('s read {}'.format(wav_fn))
+        self._loaded = ident
+        return True
+
+    def _rows(self, cmd, num_cols):
+        # XXX check for errors here and log and abort if there is one.  Result
+        # string will start with ERROR:.
+        # join flattens the list of frames, so all values come back at once.
+        return parse_numbers(self.eval('join [{}]'.format(cmd)), num_cols)
+
+    def pitch(self, wav_fn, frame_shift, window_size, max_pitch, min_pitch):
+        """Return raw F0 and voicing vectors, see snack_raw_pitch()"""
+        # XXX I'm assuming Hz for pitch; the docs don't actually say that.
+        # http://www.speech.kth.se/snack/man/snack2.2/tcl-man.html#spitch
+        cmd = ['s pitch -method esps']
+        cmd.extend(['-framelength {}'.format(frame_shift / 1000)])
+        cmd.extend(['-windowlength {}'.format(window_size / 1000)])
+        cmd.extend(['-maxpitch {}'.format(max_pitch)])
+        cmd.extend(['-minpitch {}'.format(min_pitch)])
+        with self._lock:
+            self.load(wav_fn)
+            # snack returns four values per frame, we only care about the
+            # first two.
+            data = self._rows(' '.join(cmd), 4)
+        return data[:, 0], data[:, 1]
+
+    def formants(self, wav_fn, frame_shift, window_size, pre_emphasis,
+                 lpc_order):
+        """Return raw formant estimates, see snack_raw_formants()"""
+        cmd = ['s formant']
+        cmd.extend(['-windowlength {}'.format(window_size / 1000)])
+        cmd.extend(['-framelength {}'.format(frame_shift / 1000)])
+        cmd.extend(['-windowtype Hamming'])
+        cmd.extend(['-lpctype 0'])
+        cmd.extend(['-preemphasisfactor {}'.format(pre_emphasis)])
+        cmd.extend(['-ds_freq 10000'])
+        cmd.extend(['-lpcorder {}'.format(lpc_order)])
+        with self._lock:
+            self.load(wav_fn)
+            data = self._rows(' '.join(cmd), len(sformant_names))
         estimates_raw = {}
-        for i in range(num_cols):
-            estimates_raw[sformant_names[i]] = frm_results[:, i]
-        # Cleanup and remove f0 file
-        os.remove(frm_file)
-    else: # pragma: no cover
-        raise OSError('Snack Tcl shell error -- unable to locate .frm file')
+        for i, n in enumerate(sformant_names):
+            estimates_raw[n] = data[:, i]
+        return estimates_raw
 
-    # Cleanup and remove Tcl script file
-    os.remove(tcl_file)
 
-    return estimates_raw
+# The process id and SnackSession returned by snack_session()
+_session = (None, None)
+_session_lock = threading.Lock()
+
+def snack_session():
+    """Return the SnackSession of this process, creating it if needed
+
+    Returns None if Snack can't be loaded.
+    """
+    global _session
+    with _session_lock:
+        pid, session = _session
+        # A forked worker process has no copy of its parent's Tcl thread
+        if session is None or pid != os.getpid():
+            try:
+                session = SnackSession()
+            except _import_tkinter().TclError as err: # pragma: no cover
+                log.critical('Cannot load snack (is it installed?): %s', err)
+                return None
+            _session = (os.getpid(), session)
+    return session
@@ -11,26 +11,126 @@ from __future__ import division
 
 import math
 import os
+import shutil
+import threading
 import numpy as np
 
-from scipy.signal import resample
+from fractions import Fraction
+from scipy.signal import resample, resample_poly
 from scipy.io import wavfile
 
-from opensauce.helpers import wavread
+from opensauce.helpers import wavread, make_scratch_dir
 from opensauce.textgrid import TextGrid, IntervalTier
 
 
+valid_resample_methods = ['fft', 'poly']
+
+# Number of input samples resampled at a time by the 'poly' method
+resample_block_samples = 1 << 20
+
+
+def resample_wavdata(y, fs, fs_rs, method='fft'):
+    """Resample a signal to a different sampling frequency
+
+    Args:
+        y      - samples of the signal [NumPy vector, or anything that
+                 slicing works on, such as helpers.ScaledSamples]
+        fs     - sampling frequency of y in Hz [integer]
+        fs_rs  - sampling frequency to resample to in Hz [integer]
+        method - 'fft' or 'poly' [string] (default = 'fft')
+
+    Returns:
+        y_rs - the resampled signal, ceil(len(y) * fs_rs / fs) samples long
+               [NumPy vector]
+
+    The 'fft' method is scipy.signal.resample, which transforms the whole
+    signal at once.  It needs the whole signal in memory, and is very slow
+    when the number of samples has large prime factors.
+
+    The 'poly' method is scipy.signal.resample_poly, which upsamples by
+    fs_rs and downsamples by fs, both divided by their greatest common
+    divisor, with a Kaiser-windowed FIR filter.  The signal is resampled
+    resample_block_samples input samples at a time, each block with enough
+    neighbouring samples on either side to cover the filter, so the result
+    is the same as resampling the whole signal at once.
+    """
+    ratio = Fraction(fs_rs, fs)
+    up, down = ratio.numerator, ratio.denominator
+    n = len(y)
+    ns_rs = -(-n * up // down)
+    if method == 'fft':
+        return resample(y, ns_rs)
+    if method != 'poly':
+        raise ValueError('Invalid resample method. Choices are {}'.format(valid_resample_methods))
+    # resample_poly's filter reaches 10 * max(up, down) upsampled samples
+    # to either side; blocks start on multiples of down, so that each
+    # starts on an output sample.
+    half_len = 10 * max(up, down)
+    margin = down * -(-(half_len // up + 1) // down)
+    block = max(down * (resample_block_samples // down), down)
+    y_rs = np.empty(ns_rs)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        lo = max(start - margin, 0)
+        hi = min(stop + margin, n)
+        chunk = resample_poly(y[lo:hi], up, down)
+        first = (start - lo) * up // down
+        out_start = start * up // down
+        out_stop = -(-stop * up // down)
+        y_rs[out_start:out_stop] = chunk[first:first + out_stop - out_start]
+    return y_rs
+
+
+class _cached(object):
+    """Decorator for a SoundFile attribute computed on first use
+
+    Unlike a property, this is a non-data descriptor: the value is stored
+    in the instance __dict__, where later lookups find it without calling
+    the method again.  The SoundFile's lock keeps measurements running in
+    separate threads from computing the value twice.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        with obj._lock:
+            if self.name not in obj.__dict__:
+                obj.__dict__[self.name] = self.func(obj)
+        return obj.__dict__[self.name]
+
+
 class SoundFile(object):
 
-    def __init__(self, wavpath, tgdir=None, tgfn=None, resample_freq=None):
+    def __init__(self, wavpath, tgdir=None, tgfn=None, resample_freq=None,
+                 mmap=False, resample_method='fft', scratch_dir=None):
         """Load sound data from wavpath and TextGrid from tgdir+tgfn.  If
         resample_freq is specified, then also resample the sound data and
-        save the resampled data, in addition to the original data.
+        keep the resampled data, in addition to the original data.
 
         Assume that input wav files are 16-bit PCM (integers between -32767
         and 32767).  Output resampled wav files are also written as 16-bit
         PCM.
 
+        resample_method selects how the data is resampled, 'fft' or 'poly'
+        (see resample_wavdata).
+
+        The resampled data is kept in memory.  Only when wavpath_rs is used,
+        for programs that read the resampled data from a file, is it written
+        to a wav file, in a new private directory in scratch_dir (by default
+        helpers.scratch_dir, see helpers.make_scratch_dir).  Call close to
+        remove it.
+
+        If mmap is True, memory-map the wav file instead of reading it into
+        memory (see helpers.wavread).  wavdata_int is then a read-only memmap
+        and wavdata a ScaledSamples view that converts samples to floats as
+        they are indexed, which keeps memory use close to the file size for
+        very long recordings.
+
         If tgdir is not specified look for the TextGrid in the same directory
         as the sound file.  if tgfn is not specified, look for a file with
         the same name as the sound file and an extension of 'TextGrid'.
@@ -45,7 +145,8 @@ class SoundFile(object):
             fs                      The number of samples per second
             ns                      Total number of samples
             wavpath_rs              Path for wav file corresponding to
-                                    resampled data
+                                    resampled data (None if resample_freq =
+                                    None)
             wavdata_rs              An ndarray of wavfile float samples after
                                     resampling (None if resample_freq = None)
             wavdata_rs_int          An ndarray of wavfile 16-bit int samples after
@@ -70,6 +171,10 @@ class SoundFile(object):
             The textgrid_intervals attribute exists if and only if the TextGrid
             file exists.
 
+        The data is read from the wav file, and resampled, on first use, once
+        per SoundFile.  The read_count and resample_count attributes count
+        how many times that happened.
+
         """
         open(wavpath).close()   # Generate an error if the file doesn't exist.
         self.wavpath = wavpath
@@ -85,82 +190,102 @@ class SoundFile(object):
                 raise ValueError('Resample frequency must be an integer')
             if resample_freq <= 0:
                 raise ValueError('Resample frequency must be positive')
+        if resample_method not in valid_resample_methods:
+            raise ValueError('Invalid resample method. Choices are {}'.format(valid_resample_methods))
         self.fs_rs = resample_freq
+        self.resample_method = resample_method
+        self.mmap = mmap
+        self.read_count = 0
+        self.resample_count = 0
+        self.scratch_dir = scratch_dir
+        self._scratch = None
+        self._lock = threading.RLock()
 
     @property
     def wavdata(self):
-        return self._wavdata()[0]
+        return self._wav[0]
 
     @property
     def wavdata_int(self):
-        return self._wavdata()[1]
+        return self._wav[1]
 
     @property
     def fs(self):
-        return self._wavdata()[2]
+        return self._wav[2]
 
     @property
     def ns(self):
         return len(self.wavdata)
 
-    def _wavdata(self):
-        data, data_int, fs = wavread(self.wavpath)
-        self.__dict__['wavdata'], self.__dict__['fs'] = data, fs
-        return data, data_int, fs
-
-    @property
-    def wavpath_rs(self):
-        return self._wavdata_rs()[0]
+    @_cached
+    def _wav(self):
+        self.read_count += 1
+        return wavread(self.wavpath, mmap=self.mmap)
 
     @property
     def wavdata_rs(self):
-        return self._wavdata_rs()[1]
+        return self._wav_rs[0]
 
     @property
     def wavdata_rs_int(self):
-        return self._wavdata_rs()[2]
+        return self._wav_rs[1]
 
     @property
     def ns_rs(self):
-        return self._wavdata_rs()[3]
+        return self._wav_rs[2]
 
-    def _wavdata_rs(self):
+    @_cached
+    def _wav_rs(self):
         if self.fs_rs is not None:
-            # Number of points in resample
-            ns_rs = np.int_(np.ceil(self.ns * self.fs_rs / self.fs))
+            self.resample_count += 1
             # Do resample
             # XXX: Tried using a Hamming window as a low pass filter, but it
             #      didn't seem to make a big difference, so it's not used
             #      here.
-            data_rs = resample(self.wavdata, ns_rs)
-            wavpath_rs = self.wavpath.split('.')[0] + '-resample-' + str(self.fs_rs) + 'Hz.wav'
-            # Write resampled data to wav file
+            data_rs = resample_wavdata(self.wavdata, self.fs, self.fs_rs,
+                                       self.resample_method)
+            ns_rs = np.int_(len(data_rs))
             # Convert data from 32-bit floating point to 16-bit PCM
             data_rs_int = np.int16(data_rs * 32768)
-            wavfile.write(wavpath_rs, self.fs_rs, data_rs_int)
-            # XXX: Was worried that Python might continue executing code
-            #      before the file write is finished, but it seems like it's
-            #      not an issue.
-            return wavpath_rs, data_rs, data_rs_int, ns_rs
+            return data_rs, data_rs_int, ns_rs
         else:
-            return None, None, None, None
+            return None, None, None
 
-    @property
+    @_cached
+    def wavpath_rs(self):
+        if self.fs_rs is None:
+            return None
+        # The file is private to this SoundFile, so that runs over the same
+        # files don't share it and read-only directories are no problem.
+        self._scratch = make_scratch_dir('opensauce-resample-',
+                                         self.scratch_dir)
+        wavpath_rs = os.path.join(self._scratch,
+                                  os.path.splitext(self.wavfn)[0] +
+                                  '-resample-' + str(self.fs_rs) + 'Hz.wav')
+        # Write resampled data to wav file
+        wavfile.write(wavpath_rs, self.fs_rs, self.wavdata_rs_int)
+        return wavpath_rs
+
+    def close(self):
+        """Remove the resampled wav file, if it was written"""
+        with self._lock:
+            if self._scratch is not None:
+                shutil.rmtree(self._scratch, ignore_errors=True)
+                self._scratch = None
+                self.__dict__.pop('wavpath_rs', None)
+
+    @_cached
     def ms_len(self):
-        ms_len = int(math.floor(len(self.wavdata) / self.fs * 1000))
-        self.__dict__['ms_len'] = ms_len
-        return ms_len
+        return int(math.floor(len(self.wavdata) / self.fs * 1000))
 
-    @property
+    @_cached
     def textgrid(self):
         if os.path.exists(self.tgpath):
-            res = TextGrid.fromFile(self.tgpath)
+            return TextGrid.fromFile(self.tgpath)
         else:
-            res = None
-        self.__dict__['textgrid'] = res
-        return res
+            return None
 
-    @property
+    @_cached
     def textgrid_intervals(self):
         if self.textgrid is None:
             raise ValueError("Textgrid file {!r} not found".format(self.tgpath))
@@ -170,5 +295,4 @@ class SoundFile(object):
                 continue
             for i in tier.intervals:
                 res.append((i.mark, float(i.minTime), float(i.maxTime)))
-        self.__dict__['textgrid_intervals'] = res
         return res
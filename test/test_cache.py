@@ -0,0 +1,72 @@
+import os
+import time
+import numpy as np
+
+from opensauce.cache import MeasurementCache, file_digest
+
+from test.support import TestCase, sound_file_path
+
+
+class TestMeasurementCache(TestCase):
+
+    def test_file_digest(self):
+        fn = sound_file_path('beijing_f3_50_a.wav')
+        digest = file_digest(fn)
+        self.assertEqual(len(digest), 40)
+        self.assertEqual(file_digest(fn, blocksize=1000), digest)
+        self.assertNotEqual(file_digest(sound_file_path('beijing_m5_17_c.wav')),
+                            digest)
+
+    def test_key(self):
+        cache = MeasurementCache(self.tmpdir())
+        key = cache.key('abc', 'shrF0', [('frame_shift', 1), ('window_size', 25)])
+        self.assertEqual(key, cache.key('abc', 'shrF0',
+                                        [('window_size', 25), ('frame_shift', 1)]))
+        self.assertNotEqual(key, cache.key('abd', 'shrF0',
+                                           [('frame_shift', 1), ('window_size', 25)]))
+        self.assertNotEqual(key, cache.key('abc', 'praatF0',
+                                           [('frame_shift', 1), ('window_size', 25)]))
+        self.assertNotEqual(key, cache.key('abc', 'shrF0',
+                                           [('frame_shift', 2), ('window_size', 25)]))
+
+    def test_get_put(self):
+        cache = MeasurementCache(self.tmpdir())
+        key = cache.key('abc', 'shrF0', [])
+        self.assertIsNone(cache.get(key))
+        arrays = {'shrF0': np.array([np.nan, 100.5, 101.25]),
+                  'SHR': np.array([np.nan, 0.1, 0.2])}
+        cache.put(key, arrays)
+        stored = cache.get(key)
+        self.assertEqual(sorted(stored), ['SHR', 'shrF0'])
+        for k in arrays:
+            np.testing.assert_array_equal(stored[k], arrays[k])
+
+    def test_damaged_entry_is_a_miss(self):
+        cache = MeasurementCache(self.tmpdir())
+        key = cache.key('abc', 'shrF0', [])
+        cache.put(key, {'shrF0': np.arange(10.0)})
+        path = cache._path(key)
+        with open(path, 'r+b') as f:
+            f.truncate(20)
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(os.path.exists(path))
+
+    def test_evict_least_recently_used(self):
+        cache = MeasurementCache(self.tmpdir())
+        keys = [cache.key('abc', str(i), []) for i in range(4)]
+        now = time.time()
+        for i, key in enumerate(keys):
+            cache.put(key, {'x': np.arange(1000.0)})
+            os.utime(cache._path(key), (now - 100 + i, now - 100 + i))
+        entry_size = cache.size() // 4
+        # Using an entry makes it the most recently used one.
+        self.assertIsNotNone(cache.get(keys[0]))
+        cache.evict()
+        self.assertEqual(cache.size(), 4 * entry_size)
+        cache.max_size = 2 * entry_size
+        cache.evict()
+        self.assertEqual(cache.size(), 2 * entry_size)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNone(cache.get(keys[2]))
+        self.assertIsNotNone(cache.get(keys[3]))
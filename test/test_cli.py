@@ -3,6 +3,7 @@ import os
 import sys
 import textwrap
 import re
+import shutil
 import unittest
 import numpy as np
 from sys import platform
@@ -220,6 +221,155 @@ class TestCommandIO(TestCase):
         self.assertEqual(len([x for x in lines
                               if 'hmong_f4_24_d.wav' in x]), 2092)
 
+    def test_jobs_same_output_as_serial(self):
+        args = ['--measurements', 'snackF0', 'SHR',
+                '--include-empty-labels',
+                '--no-output-settings',
+                sound_file_path('beijing_f3_50_a.wav'),
+                data_file_path(os.path.join('cli', 'beijing_f3_50_a.wav')),
+                sound_file_path('beijing_m5_17_c.wav'),
+                sound_file_path('hmong_f4_24_d.wav'),
+                ]
+        serial = CLI_output(self, '\t', args)
+        parallel = CLI_output(self, '\t', args + ['--jobs', '3'])
+        self.assertEqual(parallel, serial)
+        self.assertIn('Found no TextGrid for', parallel[2341][0])
+
+    def test_threads_same_output_as_serial(self):
+        args = ['--measurements', 'snackF0', 'SHR', 'praatF0', 'shrF0',
+                '--include-f0-column', '--include-formant-cols',
+                '--no-output-settings',
+                sound_file_path('beijing_f3_50_a.wav'),
+                ]
+        serial = CLI_output(self, '\t', args)
+        threaded = CLI_output(self, '\t', args + ['--threads', '4'])
+        self.assertEqual(threaded, serial)
+
+    def test_threads_shared_dependencies_computed_once(self):
+        import opensauce.harmonics
+        calls = []
+
+        def recording(name, func):
+            def wrapper(*args, **kw):
+                calls.append(name)
+                return func(*args, **kw)
+            self.addCleanup(setattr, opensauce.harmonics, name, func)
+            setattr(opensauce.harmonics, name, wrapper)
+        recording('h1h2h4', opensauce.harmonics.h1h2h4)
+        recording('a1a2a3', opensauce.harmonics.a1a2a3)
+        lines = CLI_output(self, '\t', [
+            '--f0', 'shrF0',
+            '--measurements', 'H1H2H4c', 'A1A2A3c',
+            '--threads', '4',
+            '--no-output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            ])
+        self.assertEqual(sorted(calls), ['a1a2a3', 'h1h2h4'])
+        # Only the requested measurements are output
+        self.assertEqual(lines[0][-11:],
+                         ['H1c', 'H2c', 'H4c', 'H1H2c', 'H2H4c',
+                          'A1c', 'A2c', 'A3c', 'H1A1c', 'H1A2c', 'H1A3c'])
+
+    def test_dependencies_scheduled_before_dependents(self):
+        cli = CLI([sound_file_path('beijing_f3_50_a.wav'),
+                   '--f0', 'shrF0', '--formants', 'praatFormants',
+                   '--measurements', 'A1A2A3c', 'SHR'])
+        names = cli._with_dependencies(
+            ['shrF0', 'praatFormants'] + cli.args.measurements)
+        self.assertEqual(names, ['shrF0', 'praatFormants', 'H1H2H4',
+                                 'A1A2A3', 'A1A2A3c', 'SHR'])
+
+    def test_wav_read_and_resampled_once(self):
+        import opensauce.__main__
+        soundfiles = []
+
+        class RecordingSoundFile(opensauce.__main__.SoundFile):
+            def __init__(self, *args, **kw):
+                super(RecordingSoundFile, self).__init__(*args, **kw)
+                soundfiles.append(self)
+
+        self.addCleanup(setattr, opensauce.__main__, 'SoundFile',
+                        opensauce.__main__.SoundFile)
+        opensauce.__main__.SoundFile = RecordingSoundFile
+        tmp = self.tmpdir()
+        fn = os.path.join(tmp, 'beijing_f3_50_a.wav')
+        shutil.copy(sound_file_path('beijing_f3_50_a.wav'), fn)
+        CLI_output(self, '\t', [
+            '--f0', 'shrF0',
+            '--measurements', 'SHR', 'shrF0',
+            '--resample-freq', '16000',
+            '--threads', '2',
+            '--no-output-settings',
+            fn,
+            ])
+        self.assertEqual(len(soundfiles), 1)
+        self.assertEqual(soundfiles[0].read_count, 1)
+        self.assertEqual(soundfiles[0].resample_count, 1)
+
+    def test_scratch_dir(self):
+        scratch = self.tmpdir()
+        tmp = self.tmpdir()
+        fn = os.path.join(tmp, 'beijing_f3_50_a.wav')
+        shutil.copy(sound_file_path('beijing_f3_50_a.wav'), fn)
+        args = ['--f0', 'shrF0',
+                '--measurements', 'SHR', 'praatF0',
+                '--no-output-settings',
+                fn,
+                ]
+        expected = CLI_output(self, '\t', args)
+        lines = CLI_output(self, '\t', args + ['--scratch-dir', scratch,
+                                               '--resample-freq', '16000'])
+        self.assertEqual(len(lines), len(expected))
+        self.assertEqual(os.listdir(scratch), [])
+        self.assertEqual(os.listdir(tmp), ['beijing_f3_50_a.wav'])
+
+    def test_cache_dir(self):
+        cache_dir = self.tmpdir()
+        args = ['--measurements', 'snackF0', 'SHR',
+                '--no-output-settings',
+                sound_file_path('beijing_f3_50_a.wav'),
+                ]
+        uncached = CLI_output(self, '\t', args)
+        first = CLI_output(self, '\t', args + ['--cache-dir', cache_dir])
+        self.assertTrue(os.listdir(cache_dir))
+        second = CLI_output(self, '\t', args + ['--cache-dir', cache_dir])
+        self.assertEqual(first, uncached)
+        self.assertEqual(second, uncached)
+
+    def test_jobs_negative_integer(self):
+        with self.assertArgparseError(['error: argument -j/--jobs: -2 is an invalid positive integer value']):
+            CLI([sound_file_path('beijing_f3_50_a.wav'),
+                 '--measurements', 'snackF0',
+                 '--jobs', '-2',
+                ])
+
+    def test_output_format_npz(self):
+        args = ['--measurements', 'snackF0', 'SHR',
+                '--no-output-settings',
+                sound_file_path('beijing_f3_50_a.wav'),
+                ]
+        lines = CLI_output(self, '\t', args)
+        npz_path = os.path.join(self.tmpdir(), 'output.npz')
+        CLI(args + ['--output-format', 'npz', '-o', npz_path]).process()
+        with np.load(npz_path) as data:
+            self.assertEqual(sorted(data.files), sorted(lines[0]))
+            self.assertEqual(len(data['t_ms']), len(lines) - 1)
+            for i, name in enumerate(lines[0]):
+                column = data[name]
+                text = [l[i] for l in lines[1:]]
+                if column.dtype.kind == 'f':
+                    self.assertAllClose(column, np.array(text, dtype=float),
+                                        atol=5e-4, equal_nan=True)
+                else:
+                    self.assertEqual([str(x) for x in column], text)
+
+    def test_output_format_needs_output_file(self):
+        with self.assertArgparseError(['--output-format npz needs an output file']):
+            CLI([sound_file_path('beijing_f3_50_a.wav'),
+                 '--measurements', 'SHR',
+                 '--output-format', 'npz',
+                ])
+
     def test_at_least_one_input_file_required(self):
         with self.assertArgparseError(['too few arguments'], ['required', 'wavfile']):
             CLI([])
@@ -305,6 +455,74 @@ class TestCommandIO(TestCase):
         self.assertEqual(lines[0][-3:], ['shrF0', 'snackF0', 'SHR'])
         self.assertEqual(len(lines[1]), 8)
 
+    def test_H1H2H4(self):
+        lines = CLI_output(self, '\t', [
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'H1H2H4',
+            '--f0', 'shrF0',
+            '--include-f0-column',
+            '--no-output-settings',
+            ])
+        self.assertEqual(len(lines), 585)
+        self.assertEqual(lines[0][-4:], ['H1u', 'H2u', 'H4u', 'shrF0'])
+        self.assertEqual(len(lines[1]), 9)
+        self.assertEqual(lines[100][4], '865')
+        self.assertAllClose(np.float_(lines[100][-4:-1]),
+                            np.array([22.955, 19.553, 6.644]), atol=0.002)
+
+    def test_H1H2H4c(self):
+        lines = CLI_output(self, '\t', [
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'H1H2H4c',
+            '--f0', 'shrF0',
+            '--no-output-settings',
+            ])
+        self.assertEqual(len(lines), 585)
+        self.assertEqual(lines[0][-5:],
+                         ['H1c', 'H2c', 'H4c', 'H1H2c', 'H2H4c'])
+        self.assertEqual(len(lines[1]), 10)
+        H1c, H2c, H4c, H1H2c, H2H4c = np.float_(lines[100][-5:])
+        self.assertAllClose(np.array([H1H2c, H2H4c]),
+                            np.array([H1c - H2c, H2c - H4c]), atol=0.002)
+
+    def test_A1A2A3(self):
+        lines = CLI_output(self, '\t', [
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'A1A2A3', 'A1A2A3c',
+            '--f0', 'shrF0',
+            '--no-output-settings',
+            ])
+        self.assertEqual(len(lines), 585)
+        self.assertEqual(lines[0][-9:],
+                         ['A1u', 'A2u', 'A3u', 'A1c', 'A2c', 'A3c',
+                          'H1A1c', 'H1A2c', 'H1A3c'])
+        self.assertEqual(len(lines[1]), 14)
+
+    def test_HNR(self):
+        lines = CLI_output(self, '\t', [
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'HNR',
+            '--f0', 'shrF0',
+            '--no-output-settings',
+            ])
+        self.assertEqual(len(lines), 585)
+        self.assertEqual(lines[0][-4:], ['HNR05', 'HNR15', 'HNR25', 'HNR35'])
+        self.assertEqual(len(lines[1]), 9)
+        self.assertEqual(lines[100][4], '865')
+        self.assertAllClose(np.float_(lines[100][-4:]),
+                            np.array([5.965, 10.785, 16.791, 20.604]),
+                            atol=0.002)
+
+    def test_CPP(self):
+        lines = CLI_output(self, '\t', [
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'CPP',
+            '--no-output-settings',
+            ])
+        self.assertEqual(len(lines), 585)
+        self.assertEqual(lines[0][-1], 'CPP')
+        self.assertEqual(len(lines[1]), 6)
+
     def test_measurements_from_file(self):
         measurefn = self._make_file("""
             snackF0
@@ -0,0 +1,75 @@
+from __future__ import division
+
+import numpy as np
+
+from opensauce.cpp import cpp
+from opensauce.shrp import toframes
+from opensauce.soundfile import SoundFile
+
+from test.support import TestCase, sound_file_path
+
+
+class TestCPP(TestCase):
+
+    def test_cpp_against_polyfit(self):
+        # One frame at a time, with np.polyfit for the regression line
+        soundfile = SoundFile(sound_file_path('beijing_f3_50_a.wav'))
+        self.addCleanup(soundfile.close)
+        wavdata, fs = soundfile.wavdata, soundfile.fs
+        CPP = cpp(wavdata, fs, block_size=100)
+        self.assertEqual(len(CPP), len(wavdata) * 1000 // fs)
+        segmentlen = int(np.floor(0.025 * fs + 0.5))
+        nfft = 1024
+        eps = np.finfo(float).eps
+        q_low = int(np.floor(fs / 1000 + 0.5))
+        peak_low = int(np.floor(fs / 330))
+        peak_high = int(np.ceil(fs / 60))
+        for k in (0, 5, 300, 865, len(CPP) - 1):
+            center = int(np.floor((k + 1) * fs / 1000 + 0.5)) - 1
+            frame = toframes(wavdata, np.array([center]), segmentlen,
+                             'hamm')[0]
+            spectrum = np.log(np.abs(np.fft.fft(frame, nfft))**2 + eps)
+            cepstrum = np.fft.ifft(spectrum).real[:nfft // 2]
+            cepstrum_db = 10 * np.log10(cepstrum**2 + eps)
+            q = np.arange(q_low, nfft // 2)
+            line = np.polyfit(q, cepstrum_db[q_low:], 1)
+            peak = peak_low + np.argmax(cepstrum_db[peak_low:peak_high + 1])
+            expected = cepstrum_db[peak] - np.polyval(line, peak)
+            self.assertAllClose(CPP[[k]], np.array([expected]))
+
+    def test_cpp_of_harmonic_and_noisy_signals(self):
+        fs = 16000
+        t = np.arange(fs) / fs
+        periodic = sum(np.cos(2 * np.pi * h * 150 * t) / h
+                       for h in range(1, 20))
+        noise = np.random.RandomState(0).normal(0, 1, fs)
+        clean = cpp(periodic, fs)
+        noisy = cpp(noise, fs)
+        self.assertEqual(len(clean), 1000)
+        self.assertFalse(np.isnan(clean).any())
+        self.assertGreater(clean.mean(), noisy.mean() + 5)
+
+    def test_cpp_low_pitch(self):
+        # The peaks of pulse trains near min_pitch are within the search.
+        # At 16 kHz, the period of 61 Hz is 262 samples, more than half of
+        # the FFT length that the 25 ms window alone would need
+        fs = 16000
+        for F0 in (61, 65):
+            pulses = np.zeros(fs)
+            pulses[np.floor(np.arange(0, fs, fs / F0)).astype(int)] = 1
+            CPP = cpp(pulses, fs)
+            # The largest peak is at the period
+            near = cpp(pulses, fs, min_pitch=F0 - 3, max_pitch=F0 + 3)
+            self.assertAllClose(CPP[50:950], near[50:950])
+            self.assertGreater(np.median(CPP[50:950]), 20)
+
+    def test_cpp_num_frames(self):
+        fs = 8000
+        wavdata = np.random.RandomState(1).normal(0, 1, fs // 2)
+        CPP = cpp(wavdata, fs, num_frames=600, frame_shift=1)
+        self.assertEqual(len(CPP), 600)
+        self.assertAllClose(CPP[:500], cpp(wavdata, fs))
+        # Frames past the end of the signal are moved within it
+        self.assertFalse(np.isnan(CPP).any())
+        # A signal shorter than the window has no values
+        self.assertTrue(np.isnan(cpp(wavdata[:100], fs, num_frames=10)).all())
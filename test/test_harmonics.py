@@ -5,8 +5,14 @@ import unittest
 import numpy as np
 
 from opensauce.harmonics import correction_iseli_i, bandwidth_hawks_miller
+from opensauce.harmonics import harmonic_segments, harmonic_amplitudes, h1h2h4, h1h2h4_names
+from opensauce.harmonics import iseli_corrections, corrected_harmonics
+from opensauce.harmonics import h1h2h4c_names, a1a2a3c_names
+from opensauce.harmonics import formant_peaks, a1a2a3, a1a2a3_names
+from opensauce.soundfile import SoundFile
 
 from test.support import TestCase, wav_fns, get_raw_data, get_harmonics_internal_test_data
+from test.support import sound_file_path
 
 # Shuffle wav filenames, to make sure testing doesn't depend on order
 random.shuffle(wav_fns)
@@ -115,3 +121,186 @@ class TestHarmonicsInternal(TestCase):
             # are "close enough" for floating precision
             for i in range(num_calcs):
                 self.assertAllClose(os_hawks[i, :], vs_hawks[i, :], rtol=1e-05, atol=1e-08, equal_nan=True)
+
+
+class TestHarmonicAmplitudes(TestCase):
+
+    def test_harmonic_segments(self):
+        F0 = np.array([100, 100, np.nan, 0, 100, 100, 100])
+        valid, start, stop = harmonic_segments(80, 1000, F0, frame_shift=10)
+        # Frame 2 is centered on sample 20, counting from 1, and its
+        # segment is the 30 samples 5 to 34
+        self.assertEqual(start[1], 4)
+        self.assertEqual(stop[1], 34)
+        # Frame 1 starts before the signal, frames 3 and 4 have no F0, and
+        # frame 7 ends after the signal
+        self.assertEqual(valid.tolist(),
+                         [False, True, False, False, True, True, False])
+
+    def test_harmonic_amplitudes_of_cosines(self):
+        fs = 16000
+        t = np.arange(fs) / fs
+        F0 = np.full(1000, 200.0)
+        F0[500] = np.nan
+        # A cosine of amplitude a over a whole number of periods of length
+        # L has a DTFT magnitude of a * L / 2 at its frequency
+        L = 3 * fs // 200
+        expected = 20 * np.log10(0.5 * L / 2)
+        for row, h in enumerate((1, 2, 4)):
+            wavdata = 0.5 * np.cos(2 * np.pi * h * 200 * t + h)
+            amplitudes = harmonic_amplitudes(wavdata, fs, F0)
+            self.assertEqual(amplitudes.shape, (3, 1000))
+            self.assertAllClose(amplitudes[row, [10, 250, 990]],
+                                np.full(3, expected), atol=0.01)
+            self.assertTrue(np.isnan(amplitudes[:, 500]).all())
+            # The segment would start before the first sample
+            self.assertTrue(np.isnan(amplitudes[:, 0]).all())
+
+    def test_harmonic_amplitudes_against_dense_search(self):
+        # The largest magnitude within each search range, found by
+        # evaluating the DTFT on a grid 64 times finer than the DFT
+        soundfile = SoundFile(sound_file_path('beijing_f3_50_a.wav'))
+        self.addCleanup(soundfile.close)
+        wavdata, fs = soundfile.wavdata, soundfile.fs
+        F0 = np.full(len(wavdata) * 1000 // fs, np.nan)
+        F0[300:340] = np.linspace(180, 260, 40)
+        amplitudes = harmonic_amplitudes(wavdata, fs, F0)
+        valid, start, stop = harmonic_segments(len(wavdata), fs, F0)
+        for k in np.flatnonzero(valid):
+            segment = wavdata[start[k]:stop[k]]
+            n = np.arange(len(segment))
+            for row, h in enumerate((1, 2, 4)):
+                df = np.floor(0.1 * h * F0[k] + 0.5)
+                f = np.linspace(h * F0[k] - df, h * F0[k] + df,
+                                int(64 * 2 * df * len(segment) / fs))
+                spectrum = np.dot(np.exp(-2j * np.pi / fs * np.outer(f, n)),
+                                  segment)
+                expected = 20 * np.log10(np.abs(spectrum).max())
+                self.assertAllClose(np.array([amplitudes[row, k]]),
+                                    np.array([expected]), atol=0.15)
+
+    def test_h1h2h4(self):
+        fs = 8000
+        wavdata = np.cos(2 * np.pi * 100 * np.arange(fs) / fs)
+        F0 = np.full(1000, 100.0)
+        estimates = h1h2h4(wavdata, fs, F0)
+        self.assertEqual(sorted(estimates), sorted(h1h2h4_names))
+        amplitudes = harmonic_amplitudes(wavdata, fs, F0)
+        for row, name in enumerate(h1h2h4_names):
+            self.assertAllClose(estimates[name], amplitudes[row],
+                                equal_nan=True)
+
+    def test_formant_peaks_against_voicesauce(self):
+        # The per-frame loop of func_GetA1A2A3.m and ana_GetMagnitudeMax.m
+        soundfile = SoundFile(sound_file_path('beijing_f3_50_a.wav'))
+        self.addCleanup(soundfile.close)
+        wavdata, fs = soundfile.wavdata, soundfile.fs
+        F0 = np.full(len(wavdata) * 1000 // fs, np.nan)
+        F0[300:400] = np.linspace(180, 260, 100)
+        F = np.array([np.full(len(F0), 700.0), np.full(len(F0), 1200.0),
+                      np.linspace(2500, 3000, len(F0))])
+        F[2, 350] = np.nan
+        amplitudes = formant_peaks(wavdata, fs, F0, F, block_size=16)
+        valid, start, stop = harmonic_segments(len(wavdata), fs, F0)
+        self.assertTrue(np.isnan(amplitudes[:, ~valid]).all())
+        self.assertTrue(np.isnan(amplitudes[:, 350]).all())
+        fstep = fs / 8192
+        for k in np.flatnonzero(valid):
+            if k == 350:
+                continue
+            X = np.abs(np.fft.fft(wavdata[start[k]:stop[k]], 8192))
+            X = 20 * np.log10(X[:4096])
+            for row in range(3):
+                lowf = max(0.9 * F[row, k], 0)
+                highf = min(1.1 * F[row, k], fs / 2 - fstep)
+                lo = int(np.floor(lowf / fstep + 0.5))
+                hi = int(np.floor(highf / fstep + 0.5))
+                self.assertAllClose(np.array([amplitudes[row, k]]),
+                                    np.array([X[lo:hi + 1].max()]))
+
+    def test_a1a2a3(self):
+        fs = 8000
+        wavdata = np.cos(2 * np.pi * 100 * np.arange(fs) / fs)
+        F0 = np.full(1000, 100.0)
+        F = [np.full(1000, 500.0), np.full(1000, 1500.0),
+             np.full(1000, 2500.0)]
+        estimates = a1a2a3(wavdata, fs, F0, F)
+        self.assertEqual(sorted(estimates), sorted(a1a2a3_names))
+        amplitudes = formant_peaks(wavdata, fs, F0, F)
+        for row, name in enumerate(a1a2a3_names):
+            self.assertAllClose(estimates[name], amplitudes[row],
+                                equal_nan=True)
+
+
+class TestCorrectedHarmonics(TestCase):
+
+    def _sample(self, seed):
+        # Realistic F0 and formant tracks, with some NaN
+        rng = np.random.RandomState(seed)
+        n = 500
+        sample = {'Fs': 16000}
+        for name, lo, hi in (('sF0', 80, 300), ('sF1', 300, 900),
+                             ('sF2', 900, 2500), ('sF3', 2500, 3500)):
+            track = rng.uniform(lo, hi, n)
+            track[rng.rand(n) < 0.05] = np.nan
+            sample[name] = track
+        return sample
+
+    def test_iseli_corrections_against_correction_iseli_i(self):
+        for seed in range(3):
+            s = self._sample(seed)
+            F0, fs = s['sF0'], s['Fs']
+            F = np.array([s['sF1'], s['sF2'], s['sF3']])
+            B = np.array([bandwidth_hawks_miller(F_i, F0) for F_i in F])
+            f = np.array([F0, 2 * F0, s['sF2']])
+            corr = iseli_corrections(f, F, B, fs)
+            self.assertEqual(corr.shape, (3, 3, len(F0)))
+            for i in range(3):
+                expected = np.zeros(len(F0))
+                for j in range(3):
+                    expected = expected + correction_iseli_i(f[i], F[j],
+                                                             B[j], fs)
+                    self.assertAllClose(corr[i, j], expected, rtol=1e-07,
+                                        atol=1e-08, equal_nan=True)
+
+    def test_corrected_harmonics_as_voicesauce(self):
+        # The formulas of func_GetH1H2_H2H4.m and func_GetH1A1_H1A2_H1A3.m
+        for seed in range(3):
+            s = self._sample(seed)
+            F0, fs = s['sF0'], s['Fs']
+            F1, F2, F3 = s['sF1'], s['sF2'], s['sF3']
+            B1, B2, B3 = [bandwidth_hawks_miller(F_i, F0)
+                          for F_i in (F1, F2, F3)]
+            H1, H2, H4, A1, A2, A3 = np.random.uniform(0, 40, (6, len(F0)))
+            estimates = corrected_harmonics(fs, F0, [F1, F2, F3],
+                                            [H1, H2, H4], [A1, A2, A3])
+            self.assertEqual(sorted(estimates),
+                             sorted(h1h2h4c_names + a1a2a3c_names))
+
+            def corr(f, formants):
+                return sum(correction_iseli_i(f, F_i, B_i, fs)
+                           for F_i, B_i in formants)
+            H1c = H1 - corr(F0, [(F1, B1), (F2, B2)])
+            H2c = H2 - corr(2 * F0, [(F1, B1), (F2, B2)])
+            H4c = H4 - corr(4 * F0, [(F1, B1), (F2, B2)])
+            A1c = A1 - corr(F1, [(F1, B1), (F2, B2)])
+            A2c = A2 - corr(F2, [(F1, B1), (F2, B2)])
+            A3c = A3 - corr(F3, [(F1, B1), (F2, B2), (F3, B3)])
+            expected = {'H1c': H1c, 'H2c': H2c, 'H4c': H4c,
+                        'H1H2c': H1c - H2c, 'H2H4c': H2c - H4c,
+                        'A1c': A1c, 'A2c': A2c, 'A3c': A3c,
+                        'H1A1c': H1c - A1c, 'H1A2c': H1c - A2c,
+                        'H1A3c': H1c - A3c}
+            for name in expected:
+                self.assertAllClose(estimates[name], expected[name],
+                                    rtol=1e-07, atol=1e-06, equal_nan=True)
+
+    def test_corrected_harmonics_without_A(self):
+        F0 = np.array([120.0, np.nan, 200.0])
+        F = [np.array([500.0, 500.0, np.nan]), np.array([1500.0] * 3)]
+        H = [np.array([30.0] * 3), np.array([25.0] * 3), np.array([20.0] * 3)]
+        estimates = corrected_harmonics(16000, F0, F, H)
+        self.assertEqual(sorted(estimates), sorted(h1h2h4c_names))
+        self.assertTrue(np.isfinite(estimates['H1H2c'][0]))
+        # No F0, or no F1, leaves no correction
+        self.assertTrue(np.isnan(estimates['H1c'][1:]).all())
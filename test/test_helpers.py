@@ -1,7 +1,12 @@
 import os
-import shutil
+import threading
+import time
+import numpy as np
 
-from opensauce.helpers import wavread, round_half_away_from_zero, remove_empty_lines_from_file, convert_boolean_for_praat
+from opensauce.helpers import wavread, round_half_away_from_zero, convert_boolean_for_praat
+from opensauce.helpers import run_with_dependencies, nearest_indices
+from opensauce.helpers import make_scratch_dir, scratch_run, parse_numbers
+import opensauce.helpers
 
 from test.support import TestCase, data_file_path, sound_file_path, load_json
 
@@ -37,38 +42,113 @@ class TestSupport(TestCase):
             fn = data_file_path(os.path.join('helpers', 'wav-formats', 'pcm-24bit.wav'))
             samples, samples_int, Fs = wavread(fn)
 
+    def test_wavread_mmap(self):
+        fn = sound_file_path('beijing_f3_50_a.wav')
+        samples, samples_int, Fs = wavread(fn)
+        mapped, mapped_int, mapped_Fs = wavread(fn, mmap=True)
+        self.assertIsInstance(mapped_int, np.memmap)
+        self.assertEqual(mapped_Fs, Fs)
+        self.assertEqual(len(mapped), len(samples))
+        self.assertEqual(mapped[100:200].tolist(), samples[100:200].tolist())
+        self.assertEqual(np.asarray(mapped).tolist(), samples.tolist())
+        self.assertEqual(np.mean(mapped), np.mean(samples))
+        self.assertEqual(np.mean(mapped, dtype=np.float32),
+                         np.mean(samples, dtype=np.float32))
+        del mapped, mapped_int
+
+    def test_scratch_run(self):
+        tmp = self.tmpdir()
+        with scratch_run(tmp) as run_dir:
+            self.assertEqual(opensauce.helpers.scratch_dir, run_dir)
+            self.assertEqual(os.listdir(tmp), [os.path.basename(run_dir)])
+            a = make_scratch_dir()
+            b = make_scratch_dir()
+            self.assertNotEqual(a, b)
+            self.assertEqual(os.path.dirname(a), run_dir)
+            with open(os.path.join(a, 'left-over.txt'), 'w') as f:
+                f.write('x')
+        self.assertIsNone(opensauce.helpers.scratch_dir)
+        self.assertEqual(os.listdir(tmp), [])
+
     def test_round_half_away_from_zero(self):
         self.assertEqual(round_half_away_from_zero(3.5), 4)
         self.assertEqual(round_half_away_from_zero(3.2), 3)
         self.assertEqual(round_half_away_from_zero(-2.7), -3)
         self.assertEqual(round_half_away_from_zero(-4.3), -4)
 
-    def test_remove_empty_lines_from_file(self):
-        # Copy test file and remove extra newlines from it
-        fn = 'extra_newlines.txt'
-        t = self.tmpdir()
-        tmp_path = os.path.join(t, fn)
-        shutil.copy(data_file_path(os.path.join('helpers', fn)), tmp_path)
-        remove_empty_lines_from_file(tmp_path)
-        # Read lines from original test file
-        with open(data_file_path(os.path.join('helpers', fn))) as f:
-            lines_orig = f.readlines()
-        # Read lines from copy with extra newlines removed
-        with open(tmp_path) as f:
-            lines_rm = f.readlines()
-        # Original file should be longer than copy with extra newslines removed
-        self.assertTrue(len(lines_orig) > len(lines_rm))
-        # Original and copy should match except for the removed newlines
-        idx = 0
-        for line_orig in lines_orig:
-            if line_orig.rstrip():
-                self.assertEqual(line_orig, lines_rm[idx])
-                idx += 1
-        # Copy should not contain any extra information
-        self.assertEqual(idx, len(lines_rm))
+    def test_nearest_indices(self):
+        times = np.array([0, 2, 2, 5, 9, 9, 9, 14])
+        targets = np.arange(-3, 18)
+        indices, found = nearest_indices(times, targets, max_distance=2)
+        # Same as searching the whole vector, with ties to the first index
+        expected = [np.argmin(np.abs(times - t)) for t in targets]
+        self.assertEqual(indices.tolist(), expected)
+        self.assertEqual(found.tolist(),
+                         [np.abs(times[i] - t) <= 2
+                          for i, t in zip(expected, targets)])
+        indices, found = nearest_indices(times, targets)
+        self.assertEqual(indices.tolist(), expected)
+        self.assertTrue(found.all())
+
+    def test_parse_numbers(self):
+        data = parse_numbers('0.1 2\n0.2 --undefined--\n', 2)
+        self.assertAllClose(data, np.array([[0.1, 2], [0.2, np.nan]]),
+                            equal_nan=True)
+        data = parse_numbers(b'time F1\n1 2.5 3\n4 5 6\n', None, skiprows=1)
+        self.assertAllClose(data, np.array([[1, 2.5, 3], [4, 5, 6]]))
+        self.assertEqual(parse_numbers('', 4).shape, (0, 4))
+        with self.assertRaises(ValueError):
+            parse_numbers('1 2 3', 2)
+        with self.assertRaises(ValueError):
+            parse_numbers('1 x', 2)
 
     def test_convert_boolean_for_praat(self):
         self.assertEqual(convert_boolean_for_praat(True), "yes")
         self.assertEqual(convert_boolean_for_praat(False), "no")
         with self.assertRaisesRegex(ValueError, 'Input must be a Boolean'):
             convert_boolean_for_praat(42)
+
+    def test_run_with_dependencies(self):
+        order = []
+        lock = threading.Lock()
+        def func(name):
+            time.sleep(0.01 if name == 'shrF0' else 0)
+            with lock:
+                order.append(name)
+            return name.upper()
+        names = ['SHR', 'praatF0', 'shrF0', 'praatFormants']
+        for max_threads in (None, 2):
+            del order[:]
+            results = run_with_dependencies(names, func, {'SHR': ('shrF0',)},
+                                            max_threads)
+            self.assertEqual(results, dict((n, n.upper()) for n in names))
+            self.assertEqual(sorted(order), sorted(names))
+            self.assertLess(order.index('shrF0'), order.index('SHR'))
+
+    def test_run_with_dependencies_runs_concurrently(self):
+        # Both calls have to be running at once for either to finish.
+        barrier = [threading.Event(), threading.Event()]
+        def func(name):
+            barrier[name].set()
+            if not barrier[1 - name].wait(5):
+                raise RuntimeError('not concurrent')
+            return name
+        results = run_with_dependencies([0, 1], func)
+        self.assertEqual(results, {0: 0, 1: 1})
+
+    def test_run_with_dependencies_serial(self):
+        order = []
+        results = run_with_dependencies(['a', 'b', 'c'], order.append,
+                                        {'a': ('b',)}, max_threads=1)
+        self.assertEqual(order, ['a', 'b', 'c'])
+        self.assertEqual(results, {'a': None, 'b': None, 'c': None})
+
+    def test_run_with_dependencies_error(self):
+        called = []
+        def func(name):
+            called.append(name)
+            if name == 'b':
+                raise ValueError('b failed')
+        with self.assertRaisesRegex(ValueError, 'b failed'):
+            run_with_dependencies(['a', 'b', 'c'], func, {'c': ('b',)})
+        self.assertNotIn('c', called)
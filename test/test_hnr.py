@@ -0,0 +1,90 @@
+from __future__ import division
+
+import numpy as np
+
+from opensauce.hnr import hnr, segment_hnr, hnr_names
+from opensauce.harmonics import harmonic_segments
+from opensauce.soundfile import SoundFile
+
+from test.support import TestCase, sound_file_path
+
+
+class TestHNR(TestCase):
+
+    def test_odd_segments(self):
+        F0 = np.array([100, 100, 100, 100, 100, 125])
+        valid, start, stop = harmonic_segments(73, 1000, F0, frame_shift=10,
+                                               num_periods=5, odd=True)
+        self.assertTrue(((stop - start)[valid] % 2 == 1).all())
+        # Frame 3 is centered on sample 30, counting from 1: its segment
+        # is samples 5 to 54, shortened to end at 53
+        self.assertEqual(start[2], 4)
+        self.assertEqual(stop[2], 53)
+        # Frame 5 would end at sample 74, after the signal, but fits once
+        # shortened
+        self.assertEqual(valid.tolist(),
+                         [False, False, True, True, True, False])
+        self.assertEqual(stop[4], 73)
+        valid, start, stop = harmonic_segments(73, 1000, F0, frame_shift=10,
+                                               num_periods=5)
+        self.assertFalse(valid[4])
+
+    def test_hnr_against_segment_hnr(self):
+        soundfile = SoundFile(sound_file_path('beijing_f3_50_a.wav'))
+        self.addCleanup(soundfile.close)
+        wavdata, fs = soundfile.wavdata, soundfile.fs
+        F0 = np.full(len(wavdata) * 1000 // fs, np.nan)
+        F0[300:500] = np.linspace(180, 260, 200)
+        F0[400] = 0
+        estimates = hnr(wavdata, fs, F0, block_size=4096)
+        self.assertEqual(sorted(estimates), sorted(hnr_names))
+        valid, start, stop = harmonic_segments(len(wavdata), fs, F0,
+                                               num_periods=5, odd=True)
+        self.assertFalse(valid[400])
+        for row, name in enumerate(hnr_names):
+            self.assertTrue(np.isnan(estimates[name][~valid]).all())
+        for k in np.flatnonzero(valid):
+            expected = segment_hnr(wavdata[start[k]:stop[k]], fs, F0[k])
+            actual = np.array([estimates[name][k] for name in hnr_names])
+            self.assertAllClose(actual, expected)
+
+    def test_hnr_of_harmonic_and_noisy_signals(self):
+        # A periodic signal has a higher HNR than the same signal with
+        # noise added
+        fs = 16000
+        t = np.arange(fs) / fs
+        periodic = sum(np.cos(2 * np.pi * h * 150 * t) / h
+                       for h in range(1, 20))
+        noise = np.random.RandomState(0).normal(0, 0.5, fs)
+        F0 = np.full(1000, 150.0)
+        clean = hnr(periodic, fs, F0)
+        noisy = hnr(periodic + noise, fs, F0)
+        for name in hnr_names:
+            self.assertTrue(np.all(clean[name][100:900] >
+                                   noisy[name][100:900]))
+
+    def test_other_frequencies(self):
+        fs = 8000
+        wavdata = np.random.RandomState(1).normal(0, 1, fs)
+        F0 = np.full(1000, 120.0)
+        estimates = hnr(wavdata, fs, F0, freqs=[500, 3500])
+        self.assertEqual(sorted(estimates), [500, 3500])
+        expected = hnr(wavdata, fs, F0)
+        self.assertAllClose(estimates[500], expected['HNR05'],
+                            equal_nan=True)
+        self.assertAllClose(estimates[3500], expected['HNR35'],
+                            equal_nan=True)
+
+    def test_low_sampling_frequency(self):
+        # At 6 kHz the upper bands reach past the half spectrum
+        fs = 6000
+        wavdata = np.random.RandomState(2).normal(0, 1, fs)
+        F0 = np.full(1000, np.nan)
+        F0[100:900] = np.linspace(110, 250, 800)
+        estimates = hnr(wavdata, fs, F0, block_size=300)
+        valid, start, stop = harmonic_segments(len(wavdata), fs, F0,
+                                               num_periods=5, odd=True)
+        for k in np.flatnonzero(valid):
+            expected = segment_hnr(wavdata[start[k]:stop[k]], fs, F0[k])
+            actual = np.array([estimates[name][k] for name in hnr_names])
+            self.assertAllClose(actual, expected)
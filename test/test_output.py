@@ -0,0 +1,170 @@
+import csv
+import io
+import os
+import unittest
+import numpy as np
+
+from opensauce.output import DelimitedWriter, NpzWriter, ArrowWriter
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from test.support import TestCase
+
+
+class TestDelimitedWriter(TestCase):
+
+    def test_rows(self):
+        f = io.StringIO()
+        output = DelimitedWriter(f, dialect=csv.excel_tab)
+        output.writerow(['Filename', 't_ms', 'SHR'])
+        output.writerows([['a b.wav', '1', '0.250'], ['a b.wav', '2', '']])
+        output.close()
+        self.assertEqual(f.getvalue(),
+                         'Filename\tt_ms\tSHR\n'
+                         'a b.wav\t1\t0.250\n'
+                         'a b.wav\t2\n')
+
+    def test_quoting(self):
+        f = io.StringIO()
+        output = DelimitedWriter(f, dialect=csv.excel)
+        output.writerow(['x,y.wav', '1'])
+        output.close()
+        self.assertEqual(f.getvalue(), '"x,y.wav",1\n')
+
+    def test_empty_rows_are_dropped(self):
+        f = io.StringIO()
+        output = DelimitedWriter(f)
+        output.writerows([['a'], [], ['  '], ['b']])
+        output.close()
+        self.assertEqual(f.getvalue(), 'a\nb\n')
+
+    def test_columns(self):
+        f = io.StringIO()
+        output = DelimitedWriter(f, dialect=csv.excel_tab, nan='NA')
+        output.write_columns([np.array(['a.wav', 'a.wav', 'a.wav'], dtype='U'),
+                              np.array(['C1', 'C1', 'V1'], dtype='U'),
+                              np.array([0, 1, 2]),
+                              np.array([1.0, np.nan, 2.0 / 3]),
+                              np.array([np.nan, -0.0005, 1e6])])
+        output.close()
+        self.assertEqual(f.getvalue(),
+                         'a.wav\tC1\t0\t1.000\tNA\n'
+                         'a.wav\tC1\t1\tNA\t-0.001\n'
+                         'a.wav\tV1\t2\t0.667\t1000000.000\n')
+
+    def test_columns_match_rows(self):
+        # Strings that need quoting, braces and 'nan' in the strings, and
+        # an empty NaN string that leaves trailing delimiters to be removed
+        labels = np.array(['', 'nan', 'a,b', 'a,b', '{0}', '"x"'], dtype='U')
+        numbers = np.array([[np.nan, 1.5], [2.25, np.nan], [np.nan, np.nan],
+                            [3.0, 4.0], [np.nan, 0.0], [1.0, np.nan]])
+        columns = [np.repeat(np.array(['banana.wav'], dtype='U'), 6), labels,
+                   np.arange(6), numbers[:, 0], numbers[:, 1]]
+        for dialect in (csv.excel, csv.excel_tab):
+            for nan in ('NaN', '', ','):
+                rows = [[fn, label, str(t)] +
+                        [nan if np.isnan(v) else format(v, '.3f') for v in vs]
+                        for fn, label, t, vs in zip(columns[0], labels,
+                                                    columns[2], numbers)]
+                f = io.StringIO()
+                output = DelimitedWriter(f, dialect=dialect)
+                output.writerows(rows)
+                output.close()
+                g = io.StringIO()
+                output = DelimitedWriter(g, dialect=dialect, nan=nan)
+                output.write_columns(columns)
+                output.close()
+                self.assertEqual(g.getvalue(), f.getvalue())
+
+    def test_buffering(self):
+        f = io.StringIO()
+        output = DelimitedWriter(f, buffer_size=10)
+        output.writerow(['abc'])
+        self.assertEqual(f.getvalue(), '')
+        output.writerow(['defghij'])
+        self.assertEqual(f.getvalue(), 'abc\ndefghij\n')
+        output.writerow(['k'])
+        output.flush()
+        self.assertEqual(f.getvalue(), 'abc\ndefghij\nk\n')
+
+
+def _columns(fn, n, start):
+    # Columns of the kinds written by the command line interface
+    return [np.repeat(np.array([fn], dtype='U'), n),
+            np.arange(start, start + n),
+            np.where(np.arange(n) % 2, np.nan, np.linspace(0, 1, n))]
+
+
+class TestColumnarWriters(TestCase):
+
+    fields = ['Filename', 't_ms', 'SHR']
+
+    def _check(self, read_column):
+        expected = [np.concatenate(c)
+                    for c in zip(_columns('a.wav', 3, 0), _columns('bc.wav', 4, 10))]
+        for field, column in zip(self.fields, expected):
+            if column.dtype.kind == 'f':
+                self.assertAllClose(read_column(field), column, equal_nan=True)
+            else:
+                self.assertEqual(list(read_column(field)), column.tolist())
+
+    def _write(self, output):
+        output.write_columns(_columns('a.wav', 3, 0))
+        output.write_columns(_columns('bc.wav', 4, 10))
+        output.close()
+
+    def test_npz(self):
+        path = os.path.join(self.tmpdir(), 'output.npz')
+        self._write(NpzWriter(path, self.fields))
+        with np.load(path) as data:
+            self.assertEqual(sorted(data.files), sorted(self.fields))
+            self.assertEqual(data['t_ms'].dtype.kind, 'i')
+            self._check(lambda field: data[field])
+
+    @unittest.skipIf(pyarrow is None, 'needs pyarrow')
+    def test_feather(self):
+        import pyarrow.feather
+        path = os.path.join(self.tmpdir(), 'output.feather')
+        self._write(ArrowWriter(path, self.fields, 'feather'))
+        table = pyarrow.feather.read_table(path)
+        self.assertEqual(table.column_names, self.fields)
+        self._check(lambda field: table.column(field).to_numpy())
+
+    @unittest.skipIf(pyarrow is None, 'needs pyarrow')
+    def test_parquet(self):
+        import pyarrow.parquet
+        path = os.path.join(self.tmpdir(), 'output.parquet')
+        self._write(ArrowWriter(path, self.fields, 'parquet'))
+        self.assertEqual(pyarrow.parquet.ParquetFile(path).num_row_groups, 2)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column_names, self.fields)
+        self._check(lambda field: table.column(field).to_numpy())
+
+    def test_empty(self):
+        # Without any rows, every format still writes its file, with the
+        # fields as columns
+        path = os.path.join(self.tmpdir(), 'output.npz')
+        NpzWriter(path, self.fields).close()
+        with np.load(path) as data:
+            self.assertEqual(sorted(data.files), sorted(self.fields))
+            self.assertEqual(data['t_ms'].dtype.kind, 'i')
+            self.assertEqual(len(data['SHR']), 0)
+
+    @unittest.skipIf(pyarrow is None, 'needs pyarrow')
+    def test_arrow_empty(self):
+        import pyarrow.feather
+        import pyarrow.parquet
+        for output_format, read_table in (
+                ('feather', pyarrow.feather.read_table),
+                ('parquet', pyarrow.parquet.read_table)):
+            path = os.path.join(self.tmpdir(), 'output.' + output_format)
+            ArrowWriter(path, self.fields, output_format).close()
+            table = read_table(path)
+            self.assertEqual(table.column_names, self.fields)
+            self.assertEqual(table.num_rows, 0)
+            self.assertEqual(str(table.schema.field('Filename').type),
+                             'string')
+            self.assertEqual(str(table.schema.field('t_ms').type), 'int64')
@@ -9,6 +9,7 @@ from sys import platform
 from conf.userconf import user_praat_path
 
 from opensauce.praat import praat_pitch, praat_raw_pitch, praat_formants, praat_raw_formants
+from opensauce.praat import prefetch_praat_pitch, prefetch_praat_formants, clear_praat_prefetch
 
 from opensauce.soundfile import SoundFile
 
@@ -32,6 +33,23 @@ class TestPraatPitch(TestCase):
 
     longMessage = True
 
+    def test_pitch_raw_prefetch(self):
+        # A single Praat run for all files gives the same results as running
+        # Praat for each file
+        self.addCleanup(clear_praat_prefetch)
+        kw = dict(frame_shift=1, method='ac', min_pitch=50, max_pitch=400)
+        self.assertEqual(prefetch_praat_pitch(wav_fns, default_praat_path, **kw),
+                         len(wav_fns))
+        for fn in wav_fns:
+            t_pre, F0_pre = praat_raw_pitch(fn, default_praat_path, **kw)
+            t_raw, F0_raw = praat_raw_pitch(fn, default_praat_path, **kw)
+            self.assertAllClose(t_pre, t_raw)
+            self.assertAllClose(F0_pre, F0_raw, equal_nan=True)
+
+    def test_prefetch_without_praat(self):
+        self.assertEqual(prefetch_praat_pitch(wav_fns, 'no-such-praat'), 0)
+        self.assertEqual(prefetch_praat_formants(wav_fns, 'no-such-praat'), 0)
+
     def test_pitch_against_voicesauce_data(self):
         # Test against Snack data generated by VoiceSauce
         # The data was generated on VoiceSauce v1.31 on Windows 7
@@ -100,6 +118,23 @@ class TestPraatFormants(TestCase):
     formants4_names = ['ptFormants', 'pF1', 'pF2', 'pF3', 'pF4',
                        'pB1', 'pB2', 'pB3', 'pB4']
 
+    def test_formants_raw_prefetch(self):
+        # A single Praat run for all files gives the same results as running
+        # Praat for each file
+        self.addCleanup(clear_praat_prefetch)
+        kw = dict(frame_shift=1, window_size=25, num_formants=4,
+                  max_formant_freq=6000)
+        self.assertEqual(prefetch_praat_formants(wav_fns, default_praat_path,
+                                                 **kw),
+                         len(wav_fns))
+        for fn in wav_fns:
+            estimates_pre = praat_raw_formants(fn, default_praat_path, **kw)
+            estimates_raw = praat_raw_formants(fn, default_praat_path, **kw)
+            self.assertEqual(sorted(estimates_pre), sorted(self.formants4_names))
+            for n in self.formants4_names:
+                self.assertAllClose(estimates_pre[n], estimates_raw[n],
+                                    equal_nan=True)
+
     def test_formants_against_voicesauce_data(self):
         # Test against Snack data generated by VoiceSauce
         # The data was generated on VoiceSauce v1.31 on Windows 7
@@ -8,7 +8,8 @@ from sys import platform
 # Import user-defined global configuration variables
 from conf.userconf import user_reaper_path
 
-from opensauce.reaper import reaper_pitch, pyreaper_pitch, creaper_pitch
+from opensauce.reaper import (reaper_pitch, pyreaper_pitch, creaper_pitch,
+                              read_f0_track)
 
 from opensauce.soundfile import SoundFile
 
@@ -96,6 +97,20 @@ class TestReaperPitch(TestCase):
                                           min_pitch=40, high_pass=True,
                                           hilbert_transform=False, inter_mark=10)
 
+    def test_read_f0_track(self):
+        text = (b'EST_File Track\nDataType ascii\nNumChannels 1\n'
+                b'NumFrames 3\nFrameShift 0.00100\nVoicingEnabled true\n'
+                b'EST_Header_End\n'
+                b'0.000000 0 -1.000000\n'
+                b'0.001000 1 120.500000\n'
+                b'0.002000 1 121.000000\n')
+        F0_times, F0 = read_f0_track(text)
+        self.assertAllClose(F0_times, np.array([0, 0.001, 0.002]))
+        self.assertAllClose(F0, np.array([-1, 120.5, 121]))
+        F0_times, F0 = read_f0_track(text[:text.index(b'0.000000')])
+        self.assertEqual(len(F0_times), 0)
+        self.assertEqual(len(F0), 0)
+
     def test_pitch_raw_using_creaper(self):
         # Test against previously generated data to make sure nothing has
         # broken and that there are no cross platform or REAPER version issues.
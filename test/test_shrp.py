@@ -2,11 +2,12 @@ import os
 import numpy as np
 
 from opensauce.shrp import (window, toframes, two_max, compute_shr,
-                            get_log_spectrum, shrp, shr_pitch, vda,
-                            ethreshold, postvda, zcr)
+                            compute_shr_differences, get_log_spectrum,
+                            get_log_spectra, shrp, shr_pitch, shr_plan,
+                            ShrPlan, vda, ethreshold, postvda, zcr)
 from opensauce.helpers import wavread
 
-from test.support import TestCase, parameterize, load_json, sound_file_path
+from test.support import TestCase, parameterize, load_json, sound_file_path, wav_fns
 
 
 @parameterize
@@ -190,6 +191,81 @@ class Test_shrp(TestCase):
                 med_smooth=5,
                 CHECK_VOICING=False)
 
+class Test_shrp_batch(TestCase):
+
+    def test_batch_matches_per_frame(self):
+        for fn in wav_fns:
+            wav_data, wavdata_int, fps = wavread(fn)
+            per_frame = shrp(wav_data, fps, [50, 550], 25, 1, batch=False)
+            batched = shrp(wav_data, fps, [50, 550], 25, 1, batch=True)
+            for expected, actual in zip(per_frame, batched):
+                np.testing.assert_array_almost_equal(actual, expected,
+                                                     err_msg=fn)
+
+    def test_mmap_matches_in_memory(self):
+        fn = sound_file_path('beijing_f3_50_a.wav')
+        wav_data, wavdata_int, fps = wavread(fn)
+        mapped, mapped_int, fps = wavread(fn, mmap=True)
+        for expected, actual in zip(shrp(wav_data, fps, [50, 550], 25, 1),
+                                    shrp(mapped, fps, [50, 550], 25, 1)):
+            self.assertEqual(actual.tolist(), expected.tolist())
+
+    def test_log_spectra_match_log_spectrum(self):
+        wav_data, wavdata_int, fps = wavread(sound_file_path('beijing_f3_50_a.wav'))
+        frames = toframes(wav_data, np.arange(1000, 5000, 100), 551, 'hamm')
+        logf = np.log2(fps * np.arange(1, 60) / 1024)
+        interp_logf = np.arange(logf[0], logf[-1], logf[-1] - logf[-2])
+        spectra = get_log_spectra(frames, 1024, 58, logf, interp_logf)
+        for segment, spectrum in zip(frames, spectra):
+            np.testing.assert_array_almost_equal(
+                spectrum,
+                get_log_spectrum(segment, 1024, 58, logf, interp_logf))
+
+    def test_shr_differences_match_shshift(self):
+        rng = np.random.RandomState(0)
+        log_spectra = rng.rand(3, 40)
+        n = 8
+        shift_units = 12
+        startpos = shift_units - np.array([3, 5, 7, 8, 9, 10, 11])
+        endpos = np.minimum(startpos + 39, shift_units + 39)
+        differences = compute_shr_differences(log_spectra, startpos, endpos,
+                                              n, shift_units)
+        for spectrum, difference in zip(log_spectra, differences):
+            peak_index, shr, shshift, index = compute_shr(
+                spectrum, 0.1, startpos, endpos, 0, 39, n, shift_units, 0.4)
+            expected = (sum(shshift[1:n-1:2, :], 0) -
+                        sum(shshift[0:n:2, :], 0))
+            np.testing.assert_array_equal(difference, expected)
+
+
+class Test_shr_plan(TestCase):
+
+    def test_plan_is_cached(self):
+        plan = shr_plan(16000, [50, 550], 25, 1250)
+        self.assertIs(plan, shr_plan(16000, (50, 550), 25, 1250))
+        self.assertIsNot(plan, shr_plan(16000, [50, 550], 40, 1250))
+
+    def test_differences_match_compute_shr(self):
+        plan = ShrPlan(16000, [50, 550], 25, 1250)
+        wav_data, wavdata_int, fps = wavread(sound_file_path('beijing_f3_50_a.wav'))
+        frames = toframes(wav_data, np.arange(1000, 5000, 100),
+                          plan.segmentlen, 'hamm')
+        log_spectra = plan.log_spectra(frames)
+        differences = plan.differences(log_spectra)
+        for spectrum, difference in zip(log_spectra, differences):
+            peak_index, shr, shshift, index = compute_shr(
+                spectrum, plan.min_bin, plan.startpos, plan.endpos,
+                plan.lowerbound, plan.upperbound, plan.N, plan.shift_units,
+                0.4)
+            n = plan.N
+            expected = (sum(shshift[1:n-1:2, :], 0) -
+                        sum(shshift[0:n:2, :], 0))
+            np.testing.assert_array_almost_equal(difference, expected)
+            np.testing.assert_array_almost_equal(
+                plan.differences(spectrum), expected)
+            self.assertEqual(plan.pick_peak(difference, 0.4)[0], peak_index)
+
+
 class Test_shr_pitch(TestCase):
 
     def test_with_matlab_data(self):
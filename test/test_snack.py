@@ -1,5 +1,6 @@
 from __future__ import division
 
+import os
 import random
 import unittest
 import sys
@@ -10,6 +11,8 @@ import numpy as np
 from conf.userconf import user_default_snack_method, user_tcl_shell_cmd
 
 from opensauce.snack import snack_pitch, snack_raw_pitch, snack_formants, snack_raw_formants, valid_snack_methods, sformant_names
+from opensauce.snack import snack_session
+from opensauce.snack import prefetch_snack_tcl, clear_snack_prefetch
 
 from opensauce.soundfile import SoundFile
 
@@ -196,3 +199,55 @@ class TestSnackFormants(TestCase):
                 # Increase rtol from 1e-5 to 1e-3 to account for random seed
                 # used in Snack formants
                 self.assertAllClose(estimates_raw[n], sample_data[n], rtol=1e-03, atol=1e-08)
+
+
+class TestSnackSession(TestCase):
+
+    def test_session_is_reused(self):
+        session = snack_session()
+        self.assertIsNotNone(session)
+        self.assertIs(snack_session(), session)
+
+    def test_sound_is_read_once(self):
+        session = snack_session()
+        fn1, fn2 = wav_fns[:2]
+        session.load(fn2)
+        self.assertTrue(session.load(fn1))
+        snack_raw_pitch(fn1, 'python')
+        snack_raw_formants(fn1, 'python')
+        self.assertFalse(session.load(fn1))
+
+    def test_python_method_matches_tcl_method(self):
+        for fn in wav_fns:
+            F0_py, V_py = snack_raw_pitch(fn, 'python')
+            F0_tcl, V_tcl = snack_raw_pitch(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+            self.assertAllClose(F0_py, F0_tcl)
+            self.assertAllClose(V_py, V_tcl)
+            estimates_py = snack_raw_formants(fn, 'python')
+            estimates_tcl = snack_raw_formants(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+            for n in sformant_names:
+                self.assertAllClose(estimates_py[n], estimates_tcl[n])
+
+
+class TestSnackTclBatch(TestCase):
+
+    def test_prefetch_matches_single_file(self):
+        # A single Tcl shell run for all files gives the same results as
+        # running it for each file, and leaves nothing in the wav directory
+        self.addCleanup(clear_snack_prefetch)
+        wav_dir = os.path.dirname(wav_fns[0])
+        before = sorted(os.listdir(wav_dir))
+        self.assertEqual(prefetch_snack_tcl(wav_fns, tcl_cmd), 2 * len(wav_fns))
+        for fn in wav_fns:
+            F0_pre, V_pre = snack_raw_pitch(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+            F0_raw, V_raw = snack_raw_pitch(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+            self.assertAllClose(F0_pre, F0_raw)
+            self.assertAllClose(V_pre, V_raw)
+            estimates_pre = snack_raw_formants(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+            estimates_raw = snack_raw_formants(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+            for n in sformant_names:
+                self.assertAllClose(estimates_pre[n], estimates_raw[n])
+        self.assertEqual(sorted(os.listdir(wav_dir)), before)
+
+    def test_prefetch_without_tcl_shell(self):
+        self.assertEqual(prefetch_snack_tcl(wav_fns, 'no-such-tclsh'), 0)
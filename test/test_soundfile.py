@@ -2,11 +2,13 @@ import os
 import shutil
 import unittest
 import numpy as np
+from scipy.signal import resample_poly
 
 from sys import platform
 
 from opensauce.helpers import wavread
-from opensauce.soundfile import SoundFile
+import opensauce.soundfile
+from opensauce.soundfile import SoundFile, resample_wavdata
 
 from test.support import TestCase, parameterize, load_json, data_file_path, sound_file_path, wav_fns
 
@@ -34,6 +36,69 @@ class TestSoundFile(TestCase):
         self.assertIsNone(s.fs_rs)
         self.assertIsNone(s.ns_rs)
 
+    def test_load_wav_file_mmap(self):
+        spath = sound_file_path('beijing_f3_50_a.wav')
+        s = SoundFile(spath, mmap=True)
+        data, data_int, fs = wavread(spath)
+        self.assertIsInstance(s.wavdata_int, np.memmap)
+        self.assertEqual(s.wavdata[:].tolist(), data.tolist())
+        self.assertEqual(s.fs, 22050)
+        self.assertEqual(s.ns, 51597)
+        self.assertEqual(s.ms_len, 2340)
+
+    def test_read_and_resample_once(self):
+        fn = 'beijing_f3_50_a.wav'
+        tmp_path = os.path.join(self.tmpdir(), fn)
+        shutil.copy(sound_file_path(fn), tmp_path)
+        s = SoundFile(tmp_path, resample_freq=16000)
+        self.addCleanup(s.close)
+        self.assertEqual(s.read_count, 0)
+        for i in range(3):
+            s.wavdata, s.wavdata_int, s.fs, s.ns, s.ms_len
+            s.wavpath_rs, s.wavdata_rs, s.wavdata_rs_int, s.ns_rs
+        self.assertIs(s.wavdata_rs, s.wavdata_rs)
+        self.assertEqual(s.read_count, 1)
+        self.assertEqual(s.resample_count, 1)
+
+    def test_resampled_wav_file_written_on_demand(self):
+        spath = sound_file_path('beijing_f3_50_a.wav')
+        scratch = self.tmpdir()
+        s = SoundFile(spath, resample_freq=16000, scratch_dir=scratch)
+        self.assertEqual(len(s.wavdata_rs), 37440)
+        self.assertEqual(os.listdir(scratch), [])
+        path = s.wavpath_rs
+        self.assertEqual(os.path.dirname(os.path.dirname(path)), scratch)
+        self.assertEqual(os.path.basename(path),
+                         'beijing_f3_50_a-resample-16000Hz.wav')
+        y_rs, y_rs_int, fs_rs = wavread(path)
+        self.assertEqual(y_rs_int.tolist(), s.wavdata_rs_int.tolist())
+        self.assertFalse(os.path.exists(spath.split('.')[0] + '-resample-16000Hz.wav'))
+        s.close()
+        self.assertEqual(os.listdir(scratch), [])
+        self.assertIsNone(SoundFile(spath).wavpath_rs)
+
+    def test_resample_poly(self):
+        y = np.random.RandomState(0).uniform(-1, 1, 100003)
+        whole = resample_poly(y, 320, 441)
+        self.addCleanup(setattr, opensauce.soundfile, 'resample_block_samples',
+                        opensauce.soundfile.resample_block_samples)
+        for block in (441, 1000, 1 << 20):
+            opensauce.soundfile.resample_block_samples = block
+            y_rs = resample_wavdata(y, 22050, 16000, 'poly')
+            self.assertEqual(y_rs.tolist(), whole.tolist())
+        self.assertEqual(len(y_rs), len(resample_wavdata(y, 22050, 16000)))
+
+    def test_resample_method(self):
+        fn = 'beijing_f3_50_a.wav'
+        tmp_path = os.path.join(self.tmpdir(), fn)
+        shutil.copy(sound_file_path(fn), tmp_path)
+        s = SoundFile(tmp_path, resample_freq=16000, resample_method='poly')
+        self.assertEqual(s.ns_rs, 37440)
+        self.assertEqual(s.wavdata_rs.tolist(),
+                         resample_poly(s.wavdata, 320, 441).tolist())
+        with self.assertRaisesRegex(ValueError, 'Invalid resample method'):
+            SoundFile(tmp_path, resample_freq=16000, resample_method='sinc')
+
     def test_resample_invalid_value(self):
         with self.assertRaisesRegex(ValueError, 'Resample frequency must be an integer'):
             spath = sound_file_path('beijing_f3_50_a.wav')
@@ -50,6 +115,7 @@ class TestSoundFile(TestCase):
         tmp_path = os.path.join(t, fn)
         shutil.copy(sound_file_path(fn), tmp_path)
         s = SoundFile(tmp_path, resample_freq=16000)
+        self.addCleanup(s.close)
         self.assertEqual(s.fs, 22050)
         self.assertEqual(s.ns, 51597)
         self.assertEqual(s.ms_len, 2340)
@@ -80,6 +146,7 @@ class TestSoundFile(TestCase):
             tmp_path = os.path.join(t, os.path.basename(fn))
             shutil.copy(fn, tmp_path)
             s = SoundFile(tmp_path, resample_freq=16000)
+            self.addCleanup(s.close)
             data, data_int, fs = wavread(s.wavpath_rs)
             resample_fn = os.path.splitext(os.path.basename(fn))[0] + '-resample-16kHz.wav'
             data_test, data_test_int, fs_test = wavread(data_file_path(os.path.join('soundfile', 'resample', resample_fn)))
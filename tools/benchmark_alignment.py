@@ -0,0 +1,71 @@
+# Script to time the alignment of measurement frames to output frames
+
+# Licensed under Apache v2 (see LICENSE)
+
+# Praat and SHRP report their measurements at their own frame times, which
+# are aligned to the output frames by finding the nearest measurement frame
+# for each output frame.  This compares the per-frame argmin search that
+# shr_pitch used to do with nearest_indices for increasing file lengths.
+#
+# Usage:
+#   python -m tools.benchmark_alignment [max_seconds]
+
+from __future__ import division
+
+import sys
+import timeit
+
+import numpy as np
+
+from opensauce.helpers import nearest_indices
+
+
+def align_loop(t, k, max_distance):
+    # One argmin over all measurement frames per output frame
+    inx = np.zeros(len(k), dtype=int)
+    found = np.zeros(len(k), dtype=bool)
+    for i, target in enumerate(k):
+        dabs = np.abs(t - target)
+        inx[i] = dabs.argmin()
+        found[i] = dabs[inx[i]] <= max_distance
+    return inx, found
+
+
+def frame_times(seconds, frame_shift=1):
+    # SHRP-like frame times in ms, with a little jitter, and output frame times
+    rng = np.random.RandomState(0)
+    n = int(seconds * 1000 / frame_shift)
+    t = np.arange(n) * frame_shift + rng.uniform(-0.3, 0.3, n) * frame_shift
+    t = np.sort(t + frame_shift / 2)
+    k = np.arange(0, t[-1], frame_shift)
+    return t, k
+
+
+def best_time(func, number=3):
+    return min(timeit.repeat(func, number=1, repeat=number))
+
+
+def main(max_seconds=60):
+    frame_shift = 1
+    max_distance = 2 * frame_shift
+    print('{:>8} {:>8} {:>12} {:>12} {:>8}'.format(
+        'seconds', 'frames', 'loop (s)', 'search (s)', 'speedup'))
+    seconds = 1
+    while seconds <= max_seconds:
+        t, k = frame_times(seconds, frame_shift)
+        expected = align_loop(t, k, max_distance)
+        actual = nearest_indices(t, k, max_distance)
+        assert np.array_equal(expected[0], actual[0])
+        assert np.array_equal(expected[1], actual[1])
+        loop = best_time(lambda: align_loop(t, k, max_distance))
+        search = best_time(lambda: nearest_indices(t, k, max_distance))
+        print('{:8d} {:8d} {:12.4f} {:12.4f} {:8.0f}'.format(
+            seconds, len(k), loop, search, loop / search))
+        seconds *= 2
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(float(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,80 @@
+# Script to time the HNR measurement on long recordings
+
+# Licensed under Apache v2 (see LICENSE)
+
+# func_GetHNR.m computes the HNR one frame at a time, as segment_hnr does.
+# This times hnr, which computes all of the frames in batches, against a
+# loop over segment_hnr, for increasing lengths of a synthetic voice-like
+# signal at 16 kHz and a 1 ms frame shift, up to about 10 minutes.  The
+# loop is only timed up to loop_seconds; for longer signals its time is
+# estimated from its time per frame, and marked with '~'.
+#
+# Usage:
+#   python -m tools.benchmark_hnr [max_seconds [loop_seconds]]
+
+from __future__ import division
+
+import sys
+import timeit
+
+import numpy as np
+
+from opensauce.harmonics import harmonic_segments
+from opensauce.hnr import hnr, segment_hnr, hnr_names
+
+fs = 16000
+
+
+def make_signal(seconds):
+    # Harmonics of a slowly varying F0, with some noise
+    rng = np.random.RandomState(0)
+    n = int(seconds * fs)
+    t = np.arange(n) / fs
+    F0_signal = 150 + 50 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(F0_signal) / fs
+    wavdata = sum(np.cos(h * phase) / h for h in range(1, 20))
+    wavdata += rng.normal(0, 0.1, n)
+    frames = np.arange(int(seconds * 1000))
+    F0 = 150 + 50 * np.sin(2 * np.pi * 0.5 * frames / 1000)
+    return wavdata, F0
+
+
+def loop_hnr(wavdata, F0):
+    valid, start, stop = harmonic_segments(len(wavdata), fs, F0,
+                                           num_periods=5, odd=True)
+    values = np.full((len(hnr_names), len(F0)), np.nan)
+    for k in np.flatnonzero(valid):
+        values[:, k] = segment_hnr(wavdata[start[k]:stop[k]], fs, F0[k])
+    return values
+
+
+def best_time(func, number=3):
+    return min(timeit.repeat(func, number=1, repeat=number))
+
+
+def main(max_seconds=640, loop_seconds=40):
+    print('{:>8} {:>10} {:>12} {:>12} {:>8}'.format(
+        'seconds', 'frames', 'loop (s)', 'hnr (s)', 'speedup'))
+    seconds = 10
+    per_frame = None
+    while seconds <= max_seconds:
+        wavdata, F0 = make_signal(seconds)
+        batched = best_time(lambda: hnr(wavdata, fs, F0), number=1)
+        if seconds <= loop_seconds:
+            estimates = hnr(wavdata, fs, F0)
+            expected = loop_hnr(wavdata, F0)
+            actual = np.array([estimates[name] for name in hnr_names])
+            assert np.allclose(actual, expected, equal_nan=True)
+            loop = best_time(lambda: loop_hnr(wavdata, F0), number=1)
+            per_frame = loop / len(F0)
+            loop_str = '{:12.2f}'.format(loop)
+        else:
+            loop = per_frame * len(F0)
+            loop_str = '{:>12}'.format('~{:.2f}'.format(loop))
+        print('{:8g} {:10d} {} {:12.2f} {:8.1f}'.format(
+            seconds, len(F0), loop_str, batched, loop / batched))
+        seconds *= 4
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,101 @@
+# Script to time the parsing of Praat's text output
+
+# Licensed under Apache v2 (see LICENSE)
+
+# The Praat wrappers used to read the pitch and formant files written by
+# the Praat scripts with np.loadtxt and a converter per column, mapping
+# '--undefined--' to NaN, which calls a Python function for every value.
+# This compares that with parse_numbers for increasing file lengths, at a
+# 1 ms frame shift.
+#
+# Usage:
+#   python -m tools.benchmark_parsing [max_seconds]
+
+from __future__ import division
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+from opensauce.helpers import parse_numbers
+
+undef = lambda x: np.nan if x =='--undefined--' or x == b'--undefined--' else x
+
+
+def read_pitch_loadtxt(f0_fn):
+    t_raw, F0_raw = np.loadtxt(f0_fn, unpack=True, converters={0: undef, 1: undef})
+    return np.column_stack((t_raw, F0_raw))
+
+
+def read_formants_loadtxt(fmt_fn, num_cols=10):
+    undef_dict = {i: undef for i in range(num_cols)}
+    return np.loadtxt(fmt_fn, dtype=float, skiprows=1, converters=undef_dict)
+
+
+def read_pitch(f0_fn):
+    with open(f0_fn) as f:
+        return parse_numbers(f.read(), 2)
+
+
+def read_formants(fmt_fn, num_cols=10):
+    with open(fmt_fn) as f:
+        return parse_numbers(f.read(), num_cols, skiprows=1)
+
+
+def write_praat_files(seconds, tmp_dir):
+    # Praat-like pitch and formant files, a fifth of the frames unvoiced
+    rng = np.random.RandomState(0)
+    n = int(seconds * 1000)
+    t = np.arange(n) / 1000 + 0.0125
+    undefined = rng.uniform(size=n) < 0.2
+    def value(v, i):
+        return '--undefined--' if undefined[i] else '{:.6f}'.format(v)
+    f0_fn = os.path.join(tmp_dir, 'pitch.txt')
+    with open(f0_fn, 'w') as f:
+        for i, v in enumerate(rng.uniform(80, 300, n)):
+            f.write('{:.6f}\t{}\n'.format(t[i], value(v, i)))
+    fmt_fn = os.path.join(tmp_dir, 'formants.txt')
+    with open(fmt_fn, 'w') as f:
+        f.write('time\tnformants\tF1\tB1\tF2\tB2\tF3\tB3\tF4\tB4\n')
+        for i, v in enumerate(rng.uniform(200, 4000, (n, 8))):
+            f.write('\t'.join(['{:.6f}'.format(t[i]), '4'] +
+                              [value(x, i) for x in v]) + '\n')
+    return f0_fn, fmt_fn
+
+
+def best_time(func, number=3):
+    return min(timeit.repeat(func, number=1, repeat=number))
+
+
+def main(max_seconds=640):
+    print('{:>8} {:>9} {:>12} {:>12} {:>8}'.format(
+        'seconds', 'file', 'loadtxt (s)', 'parse (s)', 'speedup'))
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        seconds = 10
+        while seconds <= max_seconds:
+            f0_fn, fmt_fn = write_praat_files(seconds, tmp_dir)
+            for name, fn, old, new in (
+                    ('pitch', f0_fn, read_pitch_loadtxt, read_pitch),
+                    ('formants', fmt_fn, read_formants_loadtxt, read_formants)):
+                expected = old(fn)
+                actual = new(fn)
+                assert np.array_equal(expected, actual, equal_nan=True)
+                loadtxt = best_time(lambda: old(fn))
+                parse = best_time(lambda: new(fn))
+                print('{:8g} {:>9} {:12.4f} {:12.4f} {:8.1f}'.format(
+                    seconds, name, loadtxt, parse, loadtxt / parse))
+            seconds *= 4
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(float(sys.argv[1]))
+    else:
+        main()
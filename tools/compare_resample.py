@@ -1,4 +1,9 @@
-# Script to plot original wav file against wav file resampled at 16 kHz
+# Script to plot original wav file against wav file resampled at 16 kHz,
+# or to compare the accuracy and speed of the resampling methods
+#
+# Usage:
+#   python compare_resample.py wav_dir fs_rs            (plots)
+#   python compare_resample.py wav_dir fs_rs methods    (method comparison)
 
 # Licensed under Apache v2 (see LICENSE)
 
@@ -7,8 +12,8 @@ from __future__ import division
 import sys
 import os
 import glob
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 
 from numpy.random import randint
 from scipy.signal import resample
@@ -16,12 +21,15 @@ from scipy.signal import resample
 # Problems doing this import
 # May need to move this file to top level directory
 from opensauce.helpers import wavread, round_half_away_from_zero
+from opensauce.soundfile import resample_wavdata, valid_resample_methods
 from test.support import load_json
 
 def main(wav_dir, fs_rs):
     """Compare original data vs resampled data for all wav files in wav_dir,
     where resampling frequency is given in Hz by fs_rs
     """
+    import matplotlib.pyplot as plt
+
     # Find all .wav files in test/data directory
     wav_files = glob.glob(os.path.join(wav_dir, '*.wav'))
 
@@ -82,5 +90,55 @@ def main(wav_dir, fs_rs):
         plt.ylabel('Amplitude')
         plt.savefig(os.path.splitext(os.path.basename(wav_file))[0] + '-matlab.pdf')
 
+def compare_methods(wav_dir, fs_rs, edge_ms=10):
+    """Compare the resampling methods against the 'fft' method, which has
+    always been used, for all wav files in wav_dir, where resampling
+    frequency is given in Hz by fs_rs
+
+    For each method, print the time taken, and the largest and the RMS
+    difference from the 'fft' resampled data, both over the whole file and
+    leaving out edge_ms milliseconds at either end, where the 'fft' method
+    wraps the end of the signal around to the start.  The RMS difference is
+    also given in dB relative to the RMS of the resampled signal.
+
+    The 'fft' method stretches the signal to fill a whole number of output
+    samples, by the fraction of a sample given in the stretch column, while
+    the 'poly' method keeps the exact time scale.  The differences between
+    the methods grow towards the end of the file with the stretch; where it
+    is zero they come from the filter's transition band just below the new
+    Nyquist frequency.
+    """
+    wav_files = sorted(glob.glob(os.path.join(wav_dir, '*.wav')))
+    print('{:24} {:>7} {:>6} {:>9} {:>10} {:>10} {:>10} {:>10} {:>8}'.format(
+        'file', 'stretch', 'method', 'time (s)', 'max diff', 'rms diff',
+        'max (mid)', 'rms (mid)', 'dB (mid)'))
+    for wav_file in wav_files:
+        y, y_int, fs = wavread(wav_file)
+        results = {}
+        for method in valid_resample_methods:
+            start = time.time()
+            y_rs = resample_wavdata(y, fs, fs_rs, method)
+            results[method] = y_rs, time.time() - start
+        reference = results['fft'][0]
+        stretch = len(reference) - len(y) * fs_rs / fs
+        edge = int(edge_ms * fs_rs / 1000)
+        mid = slice(edge, len(reference) - edge)
+        for method in valid_resample_methods:
+            y_rs, seconds = results[method]
+            diff = y_rs - reference
+            rms_mid = np.sqrt(np.mean(diff[mid]**2))
+            signal_rms = np.sqrt(np.mean(reference[mid]**2))
+            if rms_mid > 0:
+                db = '{:8.1f}'.format(20 * np.log10(rms_mid / signal_rms))
+            else:
+                db = '{:>8}'.format('-inf')
+            print('{:24} {:7.3f} {:>6} {:9.4f} {:10.2e} {:10.2e} {:10.2e} {:10.2e} {}'.format(
+                os.path.basename(wav_file)[:24], stretch, method, seconds,
+                np.max(np.abs(diff)), np.sqrt(np.mean(diff**2)),
+                np.max(np.abs(diff[mid])), rms_mid, db))
+
 if __name__ == '__main__':
-    main(sys.argv[1], int(sys.argv[2]))
+    if len(sys.argv) > 3 and sys.argv[3] == 'methods':
+        compare_methods(sys.argv[1], int(sys.argv[2]))
+    else:
+        main(sys.argv[1], int(sys.argv[2]))